@@ -0,0 +1,123 @@
+"""
+Benchmark: event-loop blocking time against JSON body size.
+
+Sends an edit-style body (one base64 image plus a prompt) through two
+in-process FastAPI apps and echoes the image back as imageUrl/imageBase64:
+
+- baseline: default APIRoute parsing and response-model serialization
+- fast: routers.fast_json (incremental base64 decode, streamed response)
+
+A probe task ticks every 0.5 ms on the same loop; the longest gap between
+ticks during a request is the worst event-loop stall that request caused.
+Request bodies are pre-encoded and responses read as raw bytes, so the
+client side adds no JSON work of its own.
+
+Usage (from backend/):
+    python benchmarks/json_bench.py
+    python benchmarks/json_bench.py --sizes 1 8 32 --repeat 5
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import time
+from typing import Optional, Union
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import httpx
+from fastapi import APIRouter, FastAPI
+from pydantic import BaseModel
+
+from routers.fast_json import FastJSONRoute, image_json_response
+from services.image_pipeline import source_bytes
+from services.image_result import ImageResult
+
+PROBE_INTERVAL = 0.0005
+
+
+class EchoRequest(BaseModel):
+    imageBase64: Union[str, bytes]
+    prompt: str
+
+
+class EchoResponse(BaseModel):
+    imageUrl: str
+    imageBase64: str
+    promptPreview: Optional[str] = None
+
+
+def _build_app(fast: bool) -> FastAPI:
+    router = APIRouter(route_class=FastJSONRoute) if fast else APIRouter()
+
+    @router.post("/echo", response_model=EchoResponse)
+    async def echo(request: EchoRequest):
+        result = ImageResult(data=source_bytes(request.imageBase64))
+        if fast:
+            return image_json_response(result, EchoResponse, promptPreview=request.prompt)
+        return EchoResponse(imageUrl=result.data_url, imageBase64=result.base64, promptPreview=request.prompt)
+
+    app = FastAPI()
+    app.include_router(router)
+    return app
+
+
+async def _probe(stop: asyncio.Event, gaps: list) -> None:
+    last = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(PROBE_INTERVAL)
+        now = time.perf_counter()
+        gaps.append(now - last - PROBE_INTERVAL)
+        last = now
+
+
+async def _measure(client: httpx.AsyncClient, body: bytes) -> tuple[float, float]:
+    """(worst loop stall ms, request wall ms) for one request"""
+    stop = asyncio.Event()
+    gaps: list = []
+    probe = asyncio.create_task(_probe(stop, gaps))
+    await asyncio.sleep(0.005)
+    gaps.clear()
+
+    started = time.perf_counter()
+    response = await client.post("/echo", content=body, headers={"content-type": "application/json"})
+    elapsed = time.perf_counter() - started
+    response.raise_for_status()
+
+    stop.set()
+    await probe
+    return max(gaps) * 1000, elapsed * 1000
+
+
+async def _bench(sizes: list[int], repeat: int) -> None:
+    clients = {
+        name: httpx.AsyncClient(transport=httpx.ASGITransport(app=_build_app(name == "fast")), base_url="http://bench")
+        for name in ("baseline", "fast")
+    }
+
+    print(f"{'body MB':>8} {'method':>9} {'max stall ms':>13} {'wall ms':>8}")
+    for size in sizes:
+        image = os.urandom(size * 1024 * 1024 * 3 // 4)
+        body = json.dumps({"imageBase64": base64.b64encode(image).decode(), "prompt": "Add a pergola"}).encode()
+        for name, client in clients.items():
+            runs = [await _measure(client, body) for _ in range(repeat)]
+            stall = min(r[0] for r in runs)
+            wall = min(r[1] for r in runs)
+            print(f"{len(body) / 1e6:>8.1f} {name:>9} {stall:>13.1f} {wall:>8.1f}")
+
+    for client in clients.values():
+        await client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 4, 8, 16, 32], help="Body sizes in MB")
+    parser.add_argument("--repeat", type=int, default=3, help="Requests per size and method (best is reported)")
+    args = parser.parse_args()
+    asyncio.run(_bench(args.sizes, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark: edit-mask preparation cost against output size.
+
+The client's brush mask arrives as a PNG at the source photo's resolution
+(1.5x the output side here) and is brought to the output size two ways:
+
+- legacy: LANCZOS resize -> RGB -> float mean -> np.where threshold ->
+  GaussianBlur(2), as _prepare_mask_bytes did before services.masks
+- engine: services.masks (uint8 threshold at the source resolution,
+  nearest-neighbour resize, distance-transform feather scaled to the output)
+
+Stages are timed separately. The provider-mask PNG encode is the same for
+both and is reported on its own. Rows whose decode + resize + feather time
+exceeds --budget-ms are flagged.
+
+Usage (from backend/):
+    python benchmarks/mask_bench.py
+    python benchmarks/mask_bench.py --sizes 1024 4096 --repeat 5 --budget-ms 250
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+from config import settings
+from services.masks import (
+    Stroke,
+    StrokeMask,
+    _decode_png,
+    decode_compact_mask,
+    feather_mask,
+    feather_radius,
+    resize_mask,
+)
+
+
+def _make_mask_png(width: int, height: int) -> bytes:
+    """A brush mask: a few thick wandering strokes and an erased dab"""
+    rng = np.random.default_rng(0)
+    strokes = []
+    for _ in range(6):
+        start = rng.uniform(0.2, 0.8, size=2) * (width, height)
+        path = start + rng.normal(0, width / 40, size=(40, 2)).cumsum(axis=0)
+        strokes.append(Stroke(points=[tuple(p) for p in path], radius=width / 30))
+    strokes.append(Stroke(points=[(width / 2, height / 2)], radius=width / 12, erase=True))
+    selected = decode_compact_mask(StrokeMask(format="strokes", width=width, height=height, strokes=strokes))
+
+    buffer = io.BytesIO()
+    Image.fromarray(selected.view(np.uint8) * np.uint8(255), mode="L").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    value = fn(*args)
+    return value, (time.perf_counter() - started) * 1000
+
+
+def _legacy(data: bytes, size: tuple[int, int]) -> tuple[dict, np.ndarray]:
+    def threshold(mask):
+        brightness = np.array(mask.convert("RGB")).mean(axis=2)
+        return np.where(brightness > 128, 0, 255).astype(np.uint8)
+
+    def feather(alpha):
+        return np.array(Image.fromarray(alpha, mode="L").filter(ImageFilter.GaussianBlur(radius=2)))
+
+    times = {}
+    mask, times["decode"] = _timed(lambda: Image.open(io.BytesIO(data)).convert("L"))
+    mask, times["resize"] = _timed(mask.resize, size, Image.Resampling.LANCZOS)
+    alpha, times["threshold"] = _timed(threshold, mask)
+    alpha, times["feather"] = _timed(feather, alpha)
+    return times, alpha
+
+
+def _engine(data: bytes, size: tuple[int, int]) -> tuple[dict, np.ndarray]:
+    times = {}
+    selected, times["decode"] = _timed(_decode_png, data)  # Includes the uint8 threshold
+    times["threshold"] = 0.0
+    selected, times["resize"] = _timed(resize_mask, selected, size)
+    coverage, times["feather"] = _timed(feather_mask, selected, feather_radius(size, settings.mask_feather_px))
+    return times, 255 - coverage
+
+
+def _encode(alpha: np.ndarray) -> None:
+    rgba = np.zeros((alpha.shape[0], alpha.shape[1], 4), dtype=np.uint8)
+    rgba[:, :, 3] = alpha
+    Image.fromarray(rgba, mode="RGBA").save(io.BytesIO(), format="PNG")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[512, 1024, 2048, 4096], help="Output long sides")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per size and method (best is reported)")
+    parser.add_argument("--budget-ms", type=float, default=500.0, help="Decode + resize + feather budget (ms)")
+    args = parser.parse_args()
+
+    print(f"{'size':>5} {'method':>7} {'decode':>7} {'thresh':>7} {'resize':>7} {'feather':>8} {'prep':>7} {'encode':>7}")
+    for side in args.sizes:
+        size = (side, side * 3 // 4)
+        data = _make_mask_png(side * 3 // 2, side * 9 // 8)
+        for name, method in (("legacy", _legacy), ("engine", _engine)):
+            runs = [method(data, size) for _ in range(args.repeat)]
+            best = {stage: min(times[stage] for times, _ in runs) for stage in runs[0][0]}
+            _, encode_ms = _timed(_encode, runs[0][1])
+            prep = best["decode"] + best["threshold"] + best["resize"] + best["feather"]
+            flag = "  OVER BUDGET" if prep > args.budget_ms else ""
+            print(
+                f"{side:>5} {name:>7} {best['decode']:>7.1f} {best['threshold']:>7.1f} {best['resize']:>7.1f} "
+                f"{best['feather']:>8.1f} {prep:>7.1f} {encode_ms:>7.1f}{flag}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark: upload preprocessing cost per megapixel.
+
+Compares the original decode path (full decode -> convert -> single LANCZOS
+resize) with the pipeline's draft-mode / staged-reduction path for camera
+sized JPEGs. Each measurement runs in a fresh subprocess so peak RSS is not
+polluted by earlier runs.
+
+Usage (from backend/):
+    python benchmarks/preprocess_bench.py
+    python benchmarks/preprocess_bench.py --sides 4000 6000 8000 --repeat 5
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np
+from PIL import Image
+
+from services.image_pipeline import (
+    ImageSpec,
+    OPENAI_IMAGE_SPEC,
+    REPLICATE_IMAGE_SPEC,
+    load_image,
+)
+
+SPECS = {
+    "openai": OPENAI_IMAGE_SPEC,
+    "replicate": REPLICATE_IMAGE_SPEC,
+}
+
+
+def _baseline(data: bytes, spec: ImageSpec) -> Image.Image:
+    """The pre-pipeline code path"""
+    image = Image.open(io.BytesIO(data))
+    if image.mode != spec.mode:
+        image = image.convert(spec.mode)
+    if max(image.size) > spec.max_size:
+        ratio = spec.max_size / max(image.size)
+        new_size = (int(image.size[0] * ratio), int(image.size[1] * ratio))
+        image = image.resize(new_size, Image.Resampling.LANCZOS)
+    return image
+
+
+def _make_photo(side: int, path: str) -> None:
+    """Write a 3:2 photo-like JPEG (smooth gradients plus sensor noise)"""
+    width, height = side, side * 2 // 3
+    rng = np.random.default_rng(0)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    x = np.linspace(0, 1, width, dtype=np.float32)[None, :]
+    base = np.stack(np.broadcast_arrays(180 * y + 40 * x, 120 + 60 * x * y, 200 - 120 * y), axis=2)
+    noise = rng.normal(0, 12, size=(height, width, 1)).astype(np.float32)
+    arr = np.clip(base + noise, 0, 255).astype(np.uint8)
+    Image.fromarray(arr, "RGB").save(path, format="JPEG", quality=92)
+
+
+def _peak_rss() -> int:
+    """Peak resident set size of this process in bytes"""
+    # On Linux ru_maxrss survives fork+exec (it would report the parent's
+    # peak), so prefer the per-address-space high-water mark
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _worker(method: str, path: str, spec_name: str, repeat: int) -> None:
+    """Runs in a child process; prints one JSON line"""
+    data = b""
+    if path:
+        with open(path, "rb") as f:
+            data = f.read()
+    spec = SPECS[spec_name]
+    fn = load_image if method == "pipeline" else _baseline
+
+    cpu_times = [0.0]
+    image = None
+    for _ in range(repeat):
+        start = time.process_time()
+        image = fn(data, spec)
+        image.load()
+        cpu_times.append(time.process_time() - start)
+
+    print(json.dumps({"cpu": min(cpu_times[1:] or cpu_times), "peak_rss": _peak_rss()}))
+
+
+def _run(method: str, path: str, spec_name: str, repeat: int) -> dict:
+    out = subprocess.run(
+        [sys.executable, __file__, "--worker", method, path, spec_name, str(repeat)],
+        check=True, capture_output=True, text=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sides", type=int, nargs="+", default=[2000, 4000, 6000, 8000])
+    parser.add_argument("--spec", choices=sorted(SPECS), nargs="+", default=["openai", "replicate"])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # Interpreter + Pillow/NumPy import overhead, subtracted from peak RSS
+    idle = _run("noop", "", "openai", 0)["peak_rss"]
+
+    print(f"{'input':>11} {'spec':>9} {'method':>9} {'cpu ms':>8} {'ms/MP':>7} {'peak MB':>8} {'MB/MP':>6}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for side in args.sides:
+            path = os.path.join(tmp, f"photo_{side}.jpg")
+            _make_photo(side, path)
+            with Image.open(path) as im:
+                width, height = im.size
+            megapixels = width * height / 1e6
+
+            for spec_name in args.spec:
+                for method in ("baseline", "pipeline"):
+                    r = _run(method, path, spec_name, args.repeat)
+                    rss_mb = max(r["peak_rss"] - idle, 0) / 1e6
+                    print(
+                        f"{width:>5}x{height:<5} {spec_name:>9} {method:>9} "
+                        f"{r['cpu'] * 1000:>8.1f} {r['cpu'] * 1000 / megapixels:>7.2f} "
+                        f"{rss_mb:>8.1f} {rss_mb / megapixels:>6.2f}"
+                    )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--worker":
+        method, path, spec_name, repeat = sys.argv[2:6]
+        _worker(method, path, spec_name, int(repeat))
+    else:
+        main()
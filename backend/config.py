@@ -8,12 +8,105 @@ class Settings(BaseSettings):
     
     # Replicate
     replicate_api_token: str = ""
+    replicate_poll_interval: float = 1.0  # Seconds between prediction status checks
+    replicate_output_url_ttl: float = 3000.0  # Seconds an output URL is passed to later steps (Replicate deletes outputs after an hour)
+    replicate_prediction_timeout: float = 300.0  # Predictions still running after this are cancelled
     
     # Server
     host: str = "0.0.0.0"
     port: int = 8000
     debug: bool = True
     
+    # Image preprocessing
+    max_upload_bytes: int = 50 * 1024 * 1024  # Per file part on multipart endpoints
+    image_cache_max_bytes: int = 256 * 1024 * 1024  # Prepared-variant LRU budget
+    codec_baseline_sample_rate: float = 0.1  # Share of adaptive encodes also measured with the fixed codec
+    response_webp_quality: int = 90  # Binary responses requested as image/webp
+    cpu_pool_kind: str = "thread"  # "thread" or "process"
+    cpu_pool_workers: int = 0  # 0 = one per core
+    json_fast_path_min_bytes: int = 1024 * 1024  # Larger JSON bodies decode base64 fields incrementally
+    segment_max_size: int = 1024  # Working resolution for click-to-mask
+    segment_cache_max_bytes: int = 128 * 1024 * 1024  # Cached Lab images for repeat clicks
+    mask_feather_px: float = 2.0  # Edit-mask edge ramp half-width, in pixels at 1024px output
+    composite_edits: bool = True  # Paste masked edits into the full-resolution original
+    
+    render_variants_max: int = 8  # Variants per /api/render/variants request
+    
+    # Streamed generations (/api/render/stream, /api/edit/stream)
+    stream_partial_images: int = 2  # Partial frames per gpt-image call (0-3; each adds output tokens)
+    stream_preview_size: int = 512  # Longest side of partial frames sent to the client
+    stream_keepalive: float = 15.0  # Seconds between keep-alive comments on a quiet stream
+    
+    # Tiled high-resolution renders
+    tiled_render_tile: int = 1024  # Square tile edge; must be an output size the model supports
+    tiled_render_overlap: int = 128  # Pixels shared by neighbouring tiles, blended at the seam
+    tiled_render_concurrency: int = 8  # Tiles in flight per render
+    tiled_render_max_size: int = 8192  # Longest output side
+    tiled_render_scratch_dir: str = ""  # Memory-mapped canvas location ("" = system temp dir)
+    
+    # Generation result cache (identical requests reuse the result)
+    result_cache_enabled: bool = True
+    result_cache_memory_bytes: int = 256 * 1024 * 1024
+    result_cache_path: str = "./data/results"
+    result_cache_disk_bytes: int = 4 * 1024 * 1024 * 1024  # 0 disables the disk tier
+    
+    # Pooled HTTP client for result downloads
+    http_http2: bool = True  # Needs h2 (httpx[http2]); falls back to HTTP/1.1 without it
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 20
+    http_keepalive_expiry: float = 60.0  # Seconds an idle connection stays open
+    http_connect_timeout: float = 10.0
+    http_read_timeout: float = 60.0  # Per read / write, not for the whole download
+    http_pool_timeout: float = 10.0  # Waiting for a free connection
+    http_download_retries: int = 3
+    
+    # Adaptive provider rate limiting (one limiter per provider and model)
+    rate_limit_enabled: bool = True
+    openai_requests_per_minute: float = 50.0  # Token bucket refill; match the account's image RPM (0 = no rate cap)
+    openai_chat_requests_per_minute: float = 500.0  # Chat / vision calls (gpt-4o), limited apart from images
+    openai_chat_initial_window: int = 16
+    replicate_requests_per_minute: float = 600.0  # Prediction creates
+    rate_limit_burst: int = 5  # Calls that may start back to back
+    rate_limit_initial_window: int = 4  # Calls in flight per model before any feedback
+    rate_limit_max_window: int = 32
+    rate_limit_backoff: float = 0.5  # Window multiplier on a 429
+    
+    # Hedged /render and /edit: start the other provider when the first is slow (needs both keys)
+    hedge_enabled: bool = False
+    hedge_percentile: float = 95.0  # Hedge delay = this latency percentile of the first provider
+    hedge_min_samples: int = 20  # Completions needed before the percentile is used
+    hedge_default_delay: float = 60.0  # Seconds, until then
+    hedge_min_delay: float = 5.0
+    hedge_max_ratio: float = 0.2  # At most this share of requests are hedged
+    
+    # Circuit breakers per provider/model; /render and /edit route to the healthiest backend
+    breaker_enabled: bool = True
+    breaker_window_seconds: float = 120.0  # Rolling window of call outcomes
+    breaker_min_calls: int = 5  # Outcomes in the window before the circuit can open
+    breaker_error_rate: float = 0.5  # Failure share (errors and slow calls) that opens it
+    breaker_slow_call_seconds: float = 150.0  # Calls slower than this count as failures
+    breaker_open_seconds: float = 30.0  # Fail fast this long, then let one probe call through
+    routing_health_margin: float = 0.2  # Backends this close to the healthiest keep preference order
+    routing_prior_health: float = 0.9  # Success share assumed for a backend with no recent calls
+    
+    # Background jobs (POST /api/jobs)
+    job_backend: str = "memory"  # "memory" or "redis" (any Redis-protocol server; needs redis-py)
+    job_workers: int = 4  # Jobs running at once per process
+    job_max_queued: int = 100  # Submissions past this get a 503
+    job_ttl_seconds: int = 24 * 3600  # How long job records and results stay queryable
+    job_cancel_poll: float = 1.0  # Seconds between cancellation checks on a running job
+    redis_url: str = "redis://localhost:6379/0"
+    job_redis_prefix: str = "renderless:jobs:"
+    
+    # Image store (content-addressed uploads and results)
+    image_store_backend: str = "local"  # "local" or "s3"
+    image_store_path: str = "./data/images"
+    image_store_max_bytes: int = 2 * 1024 * 1024 * 1024  # Local backend prunes least-recently-used past this
+    s3_bucket: str = ""
+    s3_prefix: str = "images/"
+    s3_endpoint_url: str = ""  # Set for S3-compatible stores (MinIO, R2, ...)
+    s3_region: str = ""
+    
     # CORS
     cors_origins: List[str] = ["http://localhost:3000", "http://127.0.0.1:3000"]
     
@@ -6,7 +6,19 @@ from config import settings
 from routers import generate_router
 from routers.render import router as render_router
 from routers.chat import router as chat_router
+from routers.images import router as images_router
+from routers.segment import router as segment_router
+from routers.jobs import router as jobs_router
 from models import HealthResponse
+from services.circuit_breaker import circuit_breakers
+from services.cpu_pool import cpu_pool
+from services.hedging import hedger
+from services.http_client import http_pool
+from services.image_pipeline import image_cache, codec_stats
+from services.job_queue import job_manager
+from services.rate_limiter import rate_limiters
+from services.result_cache import result_cache
+from services.segmentation import lab_cache
 
 
 @asynccontextmanager
@@ -16,9 +28,17 @@ async def lifespan(app: FastAPI):
     print(f"📡 Running on http://{settings.host}:{settings.port}")
     print(f"🔑 OpenAI API Key: {'configured' if settings.openai_api_key else 'NOT SET'}")
     print(f"🔄 Replicate API: {'configured' if settings.replicate_api_token else 'NOT SET'}")
+    print(f"🧮 CPU pool: {cpu_pool.workers} {cpu_pool.kind} workers")
+    await http_pool.start()
+    print(f"🌐 HTTP pool: {'HTTP/2' if http_pool.http2 else 'HTTP/1.1'}, {settings.http_max_connections} connections max")
+    await job_manager.start()
+    print(f"📋 Jobs: {settings.job_workers} workers, {settings.job_backend} queue")
     yield
     # Shutdown
     print("👋 Renderless API shutting down...")
+    await job_manager.aclose()
+    await http_pool.aclose()
+    cpu_pool.shutdown()
 
 
 app = FastAPI(
@@ -42,6 +62,9 @@ app.add_middleware(
 app.include_router(generate_router)
 app.include_router(render_router)
 app.include_router(chat_router)
+app.include_router(images_router)
+app.include_router(segment_router)
+app.include_router(jobs_router)
 
 
 @app.get("/health", response_model=HealthResponse, tags=["health"])
@@ -50,6 +73,23 @@ async def health_check():
     return HealthResponse(status="healthy", version="0.1.0")
 
 
+@app.get("/metrics", tags=["health"])
+async def metrics():
+    """Image pipeline metrics: CPU pool queue depth / wait times, variant / result caches, upload codecs, downloads, provider limiters and circuits, jobs, hedging"""
+    return {
+        "cpu_pool": cpu_pool.stats(),
+        "image_cache": image_cache.stats(),
+        "codecs": codec_stats.stats(),
+        "segment_cache": lab_cache.stats(),
+        "result_cache": result_cache.stats(),
+        "http": http_pool.stats(),
+        "rate_limits": rate_limiters.stats(),
+        "jobs": job_manager.stats(),
+        "hedging": hedger.stats(),
+        "circuits": circuit_breakers.stats(),
+    }
+
+
 @app.get("/", tags=["root"])
 async def root():
     """Root endpoint with API info"""
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Optional, Union
 from enum import Enum
 
 
@@ -13,8 +13,9 @@ class GenerationStyle(str, Enum):
 
 class GenerationRequest(BaseModel):
     prompt: str = Field(..., min_length=1, max_length=1000)
-    image_base64: str = Field(..., alias="imageBase64")
-    mask_base64: Optional[str] = Field(None, alias="maskBase64")
+    # Base64 string in JSON bodies, raw bytes from the multipart variant
+    image_base64: Union[str, bytes] = Field(..., alias="imageBase64")
+    mask_base64: Optional[Union[str, bytes]] = Field(None, alias="maskBase64")
     style: Optional[GenerationStyle] = GenerationStyle.PHOTOREALISTIC
     
     class Config:
@@ -24,6 +25,7 @@ class GenerationRequest(BaseModel):
 class GenerationResponse(BaseModel):
     image_url: str = Field(..., alias="imageUrl")
     image_base64: str = Field(..., alias="imageBase64")
+    image_id: Optional[str] = Field(None, alias="imageId", description="Image store ID of the result")
     
     class Config:
         populate_by_name = True
@@ -6,8 +6,8 @@ Uses GPT-4 to interview users and build detailed prompts.
 from typing import Optional
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from openai import OpenAI
 from config import settings
+from services.openai_service import openai_service
 
 router = APIRouter(prefix="/api", tags=["chat"])
 
@@ -149,8 +149,6 @@ async def chat(request: ChatRequest):
         raise HTTPException(status_code=500, detail="OpenAI API not configured")
     
     try:
-        client = OpenAI(api_key=settings.openai_api_key)
-        
         # Build the conversation for GPT
         conversation = [{"role": "system", "content": SYSTEM_PROMPT}]
         
@@ -199,7 +197,7 @@ Respond with appropriate JSON. If user wants to render now (says "render", "go",
         })
         
         # Get GPT response
-        response = client.chat.completions.create(
+        content = await openai_service.chat_completion(
             model="gpt-4o",
             messages=conversation,
             response_format={"type": "json_object"},
@@ -207,8 +205,6 @@ Respond with appropriate JSON. If user wants to render now (says "render", "go",
             max_tokens=1000
         )
         
-        content = response.choices[0].message.content
-        
         import json
         try:
             data = json.loads(content)
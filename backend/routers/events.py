@@ -0,0 +1,216 @@
+"""
+Server-Sent Events for generation endpoints.
+
+The /stream variants of /api/render and /api/edit take the same bodies and
+answer with text/event-stream while the regular handler runs:
+
+    event: stage    data: {"stage": "preprocessing", "elapsed": 0.01}
+                    stages: preprocessing, queued, uploading, generating,
+                    downloading, compositing, hedging (plus provider /
+                    model / log fields where known)
+    event: partial  data: {"index": 0, "imageUrl": "data:image/jpeg;...",
+                           "width": 512, "height": 341, "elapsed": 18.2}
+                    (hedged requests tag stage and partial events with the
+                    provider of the attempt)
+    event: result   data: the endpoint's JSON response (imageUrl,
+                          imageBase64, imageId, ...; only the ID with ?format=id)
+    event: error    data: {"status": 500, "detail": "..."}
+
+Partial frames are downscaled to STREAM_PREVIEW_SIZE JPEGs. Comment lines
+keep quiet streams alive through proxies, and the generation is cancelled
+if the client goes away.
+
+Fan-outs (/api/render/variants) stream one event per finished image instead:
+
+    event: variant  data: {"index": 2, "style": "evening", "model": ..., plus
+                           the result fields (imageUrl, imageBase64, imageId);
+                           "requestedModel" too if the group fell over}
+    event: error    data: {"index": [2, 3], "style": ..., "status": 500, "detail": ...}
+    event: done     data: {"variants": 3, "failed": 1, "elapsed": 41.7}
+"""
+import asyncio
+import base64
+import io
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+import orjson
+from fastapi import HTTPException, Response
+from fastapi.responses import StreamingResponse
+from PIL import Image
+
+from config import settings
+from routers.images import image_path, store_image, store_image_later
+from routers.responses import ID_FORMAT
+from services import progress
+from services.cpu_pool import cpu_pool
+from services.image_result import ImageResult
+
+SSE_RESPONSES = {
+    200: {
+        "content": {"text/event-stream": {}},
+        "description": "stage / partial events, then one result or error event",
+    },
+}
+
+
+def stream_format(response_format: Optional[str]) -> Optional[str]:
+    """Streams carry JSON results: JSON (None) or just the stored ID"""
+    if response_format not in (None, ID_FORMAT):
+        raise HTTPException(status_code=400, detail="Streamed results are JSON: use ?format=json or ?format=id")
+    return response_format
+
+
+def preview_frame(b64_json: str, max_side: int) -> tuple[str, int, int]:
+    """A partial frame as a small JPEG data URI, with its size (runs on the CPU pool)"""
+    with Image.open(io.BytesIO(base64.b64decode(b64_json))) as frame:
+        frame = frame.convert("RGB")
+        frame.thumbnail((max_side, max_side), Image.Resampling.BILINEAR)
+        buffer = io.BytesIO()
+        frame.save(buffer, format="JPEG", quality=70)
+        return f"data:image/jpeg;base64,{base64.b64encode(buffer.getvalue()).decode()}", frame.width, frame.height
+
+
+def sse(event: str, data: Any) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+def event_stream(run: Callable[[], Awaitable[Response]]) -> StreamingResponse:
+    """Run a generation handler with a progress listener and stream its events and result"""
+    queue: asyncio.Queue = asyncio.Queue()
+    started = time.monotonic()
+
+    def listener(event: dict) -> None:
+        event["elapsed"] = round(time.monotonic() - started, 2)
+        queue.put_nowait(event)
+
+    with progress.listen(listener):
+        task = asyncio.ensure_future(run())
+    task.add_done_callback(lambda _: queue.put_nowait(None))
+
+    async def body():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), settings.stream_keepalive)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                if event is None:
+                    break
+                if "partial" in event:
+                    try:
+                        url, width, height = await cpu_pool.run(
+                            preview_frame, event["b64_json"], settings.stream_preview_size,
+                        )
+                    except Exception as e:
+                        # A truncated or undecodable preview; the generation itself is fine
+                        print(f"⚠️ Skipping partial frame {event['partial']}: {e}")
+                        continue
+                    frame = {
+                        "index": event["partial"], "imageUrl": url,
+                        "width": width, "height": height, "elapsed": event["elapsed"],
+                    }
+                    if "provider" in event:
+                        frame["provider"] = event["provider"]
+                    yield sse("partial", frame)
+                else:
+                    yield sse("stage", event)
+
+            try:
+                response = task.result()
+            except HTTPException as e:
+                yield sse("error", {"status": e.status_code, "detail": e.detail})
+                return
+            except Exception as e:
+                print(f"❌ Stream error: {e}")
+                yield sse("error", {"status": 500, "detail": str(e)})
+                return
+
+            # The handler's own JSON body (streamed base64 for full results) is the event data
+            yield b"event: result\ndata: "
+            if isinstance(response, StreamingResponse):
+                async for chunk in response.body_iterator:
+                    yield chunk
+            else:
+                yield response.body
+            yield b"\n\n"
+        finally:
+            # Client gone (or done): don't keep generating for nobody
+            task.cancel()
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# One fan-out group: (event fields, result indexes, coroutine factory returning one image per index)
+VariantGroup = tuple[dict, list[int], Callable[[], Awaitable[list[ImageResult]]]]
+
+
+async def _variant_fields(result: ImageResult, response_format: Optional[str]) -> dict:
+    if response_format == ID_FORMAT:
+        image_id = await store_image(result.data)
+        return {"imageId": image_id, "imageUrl": image_path(image_id) if image_id else None}
+    # The event carries the image; the store write needn't hold it up
+    image_id = store_image_later(result.data)
+    width, height = result.size
+    return {
+        "imageUrl": result.data_url,
+        "imageBase64": result.base64,
+        "imageId": image_id,
+        "width": width,
+        "height": height,
+    }
+
+
+def variant_stream(groups: list[VariantGroup], response_format: Optional[str]) -> StreamingResponse:
+    """Run fan-out groups concurrently and stream each image as soon as its group finishes"""
+    started = time.monotonic()
+
+    async def run(group: VariantGroup) -> tuple[VariantGroup, list[ImageResult]]:
+        return group, await group[2]()
+
+    async def body():
+        tasks = [asyncio.ensure_future(run(group)) for group in groups]
+        pending = set(tasks)
+        variants = failed = 0
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=settings.stream_keepalive, return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    yield b": keepalive\n\n"
+                    continue
+                for task in done:
+                    try:
+                        (fields, indexes, _), results = task.result()
+                    except Exception as e:
+                        fields, indexes, _ = groups[tasks.index(task)]
+                        failed += len(indexes)
+                        print(f"❌ Variant {indexes} failed: {e}")
+                        yield sse("error", {
+                            "index": indexes, **fields,
+                            "status": getattr(e, "status_code", 500), "detail": str(getattr(e, "detail", e)),
+                        })
+                        continue
+                    for index, result in zip(indexes, results):
+                        variants += 1
+                        yield sse("variant", {
+                            "index": index, **fields,
+                            **await _variant_fields(result, response_format),
+                            "elapsed": round(time.monotonic() - started, 2),
+                        })
+            yield sse("done", {"variants": variants, "failed": failed, "elapsed": round(time.monotonic() - started, 2)})
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,243 @@
+"""
+JSON fast path for endpoints whose bodies carry multi-megabyte base64 images.
+
+Requests: bodies above JSON_FAST_PATH_MIN_BYTES are parsed without ever
+building the base64 strings. Long string values are cut out of the raw body
+(structural quotes are found with bytes.find, i.e. memchr), the small
+remaining skeleton goes through orjson, and each cut-out value is
+base64-decoded straight from the body in 1 MB chunks, yielding to the event
+loop between chunks. Handlers then receive the image fields as bytes, which
+ImageSource fields accept as-is, so Pydantic does no per-character work on
+them either. Other long strings, and image values that are not pure base64,
+stay strings.
+
+Handing the whole parse to a worker thread does not help here: orjson and
+json hold the GIL for the full parse, so the event loop stalls just as long.
+Chunking bounds the stall instead (see benchmarks/json_bench.py).
+
+Responses: image JSON is streamed. The small fields are encoded with orjson,
+the base64 payload is produced chunk by chunk as the body is sent, and the
+base64 chunks are shared between imageUrl and imageBase64.
+"""
+import asyncio
+import binascii
+import json
+import re
+from typing import Any, AsyncIterator, Callable, Optional
+
+import orjson
+from fastapi import Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+
+from config import settings
+from services.image_result import ImageResult
+
+# Request fields (ImageSource on the models) whose base64 values are decoded
+# to bytes; any other long string is passed through as a string
+IMAGE_FIELDS = frozenset({"imageBase64", "maskBase64", "referenceImages", "image_base64", "mask_base64"})
+# Strings at least this long are candidates for the base64 fast path
+BLOB_MIN_CHARS = 64 * 1024
+# Base64 characters decoded per event-loop slice (a multiple of 4)
+CHUNK_CHARS = 1024 * 1024
+
+_B64_ALPHABET = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/="
+_BLOB_TOKEN = "\x00blob:"
+
+
+def _string_end(body: bytes, start: int) -> int:
+    """Index of the quote closing the string that opens at body[start]"""
+    end = body.find(b'"', start + 1)
+    while end != -1:
+        backslashes = 0
+        while body[end - 1 - backslashes] == 0x5C:
+            backslashes += 1
+        if backslashes % 2 == 0:
+            return end
+        end = body.find(b'"', end + 1)
+    return -1
+
+
+def _split_blobs(body: bytes) -> tuple[bytes, list[tuple[int, int]]]:
+    """
+    Replace long escape-free strings with placeholder tokens.
+
+    Returns the skeleton JSON and the (start, end) body offsets of each
+    removed string's contents. Outside strings JSON has no quote characters,
+    so walking quote pairs from the start visits every string in order.
+    """
+    parts = []
+    blobs = []
+    pos = 0
+    quote = body.find(b'"')
+    while quote != -1:
+        end = _string_end(body, quote)
+        if end == -1:
+            break  # Unterminated; let orjson report it
+        if end - quote - 1 >= BLOB_MIN_CHARS and body.find(b"\\", quote, end) == -1:
+            parts.append(body[pos:quote])
+            parts.append(orjson.dumps(f"{_BLOB_TOKEN}{len(blobs)}"))
+            blobs.append((quote + 1, end))
+            pos = end + 1
+        quote = body.find(b'"', end + 1)
+    parts.append(body[pos:])
+    return b"".join(parts), blobs
+
+
+def _as_string(body: bytes, start: int, end: int) -> str:
+    try:
+        return body[start:end].decode()
+    except UnicodeDecodeError as e:
+        raise json.JSONDecodeError("Invalid UTF-8 in string", "", start + e.start)
+
+
+async def _decode_blob(body: bytes, start: int, end: int) -> Any:
+    """Base64-decode body[start:end] in chunks; the string itself if it is not base64"""
+    decoded = []
+    for offset in range(start, end, CHUNK_CHARS):
+        chunk = body[offset:min(offset + CHUNK_CHARS, end)]
+        if chunk.translate(None, _B64_ALPHABET):
+            return _as_string(body, start, end)
+        try:
+            decoded.append(binascii.a2b_base64(chunk))
+        except binascii.Error:
+            return _as_string(body, start, end)
+        await asyncio.sleep(0)
+    return b"".join(decoded)
+
+
+def _blob_index(value: Any, count: int) -> Optional[int]:
+    if isinstance(value, str) and value.startswith(_BLOB_TOKEN):
+        index = value[len(_BLOB_TOKEN):]
+        if index.isdigit() and int(index) < count:
+            return int(index)
+    return None
+
+
+def _image_blobs(value: Any, count: int, in_image_field: bool = False) -> set[int]:
+    """Indexes of the placeholders that sit in IMAGE_FIELDS (directly or in a list)"""
+    if isinstance(value, dict):
+        found = set()
+        for key, item in value.items():
+            found |= _image_blobs(item, count, key in IMAGE_FIELDS)
+        return found
+    if isinstance(value, list):
+        found = set()
+        for item in value:
+            found |= _image_blobs(item, count, in_image_field)
+        return found
+    index = _blob_index(value, count)
+    return {index} if in_image_field and index is not None else set()
+
+
+def _substitute(value: Any, blobs: list) -> Any:
+    """Swap placeholder tokens in the parsed skeleton for the decoded values"""
+    if isinstance(value, dict):
+        return {k: _substitute(v, blobs) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_substitute(v, blobs) for v in value]
+    index = _blob_index(value, len(blobs))
+    return value if index is None else blobs[index]
+
+
+async def parse_json_body(body: bytes) -> Any:
+    """Parse a large JSON body, decoding base64 image fields to bytes without blocking the loop"""
+    skeleton, spans = _split_blobs(body)
+    parsed = orjson.loads(skeleton)
+    if not spans:
+        return parsed
+
+    images = _image_blobs(parsed, len(spans))
+    blobs = []
+    for index, (start, end) in enumerate(spans):
+        if index in images:
+            blobs.append(await _decode_blob(body, start, end))
+        else:
+            blobs.append(_as_string(body, start, end))
+    return _substitute(parsed, blobs)
+
+
+def _redact_bytes(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray)):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, dict):
+        return {k: _redact_bytes(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_redact_bytes(v) for v in value]
+    return value
+
+
+class FastJSONRequest(Request):
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            body = await self.body()
+            if len(body) >= settings.json_fast_path_min_bytes:
+                self._json = await parse_json_body(body)
+            else:
+                self._json = orjson.loads(body)
+        return self._json
+
+
+class FastJSONRoute(APIRoute):
+    """Route class for routers that take image JSON bodies"""
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def fast_json_handler(request: Request) -> Response:
+            try:
+                return await handler(FastJSONRequest(request.scope, request.receive))
+            except RequestValidationError as e:
+                # Errors echo their input, which may now hold decoded image bytes
+                raise RequestValidationError(_redact_bytes(e.errors()), body=e.body)
+
+        return fast_json_handler
+
+
+_URL_SLOT = "\x00imageUrl"
+_BASE64_SLOT = "\x00imageBase64"
+_SLOT_PATTERN = re.compile(rb'"\\u0000(imageUrl|imageBase64)"')
+
+
+def image_json_response(result: ImageResult, model: type[BaseModel], **fields) -> StreamingResponse:
+    """
+    Stream an image response model (imageUrl / imageBase64 plus **fields)
+    without building the base64 strings.
+    """
+    # Validate the small fields through the model; the image slots are markers
+    skeleton = orjson.dumps(
+        model(imageUrl=_URL_SLOT, imageBase64=_BASE64_SLOT, **fields).model_dump(by_alias=True)
+    )
+    segments = _SLOT_PATTERN.split(skeleton)  # [literal, slot, literal, slot, literal]
+    url_prefix = f'"data:{result.mime_type};base64,'.encode()
+
+    length = 0
+    for i, segment in enumerate(segments):
+        if i % 2 == 0:
+            length += len(segment)
+        else:
+            length += result.base64_length + 2 + (len(url_prefix) - 1 if segment == b"imageUrl" else 0)
+
+    async def body() -> AsyncIterator[bytes]:
+        chunks = []
+        for i, segment in enumerate(segments):
+            if i % 2 == 0:
+                yield segment
+                continue
+            yield url_prefix if segment == b"imageUrl" else b'"'
+            if chunks:
+                for chunk in chunks:
+                    yield chunk
+            else:
+                for chunk in result.iter_base64(CHUNK_CHARS // 4 * 3):
+                    chunks.append(chunk)
+                    yield chunk
+            yield b'"'
+
+    return StreamingResponse(
+        body(),
+        media_type="application/json",
+        headers={"Content-Length": str(length)},
+    )
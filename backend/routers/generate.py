@@ -1,21 +1,26 @@
-from fastapi import APIRouter, HTTPException
-from models.schemas import GenerationRequest, GenerationResponse, ErrorResponse
+from typing import Optional, Union
+from fastapi import APIRouter, HTTPException, Depends, File, Form, UploadFile
+from models.schemas import GenerationRequest, GenerationResponse, GenerationStyle, ErrorResponse
+from routers.fast_json import FastJSONRoute
+from routers.uploads import read_upload, read_optional_upload
+from routers.responses import IMAGE_RESPONSES, image_format, image_response
 from services.openai_service import openai_service
 from services.replicate_service import replicate_service
 import traceback
 
-router = APIRouter(prefix="/api", tags=["generation"])
+router = APIRouter(prefix="/api", tags=["generation"], route_class=FastJSONRoute)
 
 
 @router.post(
     "/generate",
     response_model=GenerationResponse,
     responses={
+        **IMAGE_RESPONSES,
         400: {"model": ErrorResponse},
         500: {"model": ErrorResponse}
     }
 )
-async def generate_image(request: GenerationRequest):
+async def generate_image(request: GenerationRequest, response_format: Optional[str] = Depends(image_format)):
     """
     Generate or edit an image using AI.
     
@@ -23,39 +28,62 @@ async def generate_image(request: GenerationRequest):
     - If no mask, generates a new variation based on the input image
     """
     print(f"📥 Received generate request: prompt='{request.prompt[:50]}...'")
-    print(f"   Image size: {len(request.image_base64)} chars")
+    print(f"   Image size: {len(request.image_base64)} {'bytes' if isinstance(request.image_base64, bytes) else 'chars'}")
     print(f"   Mask: {'Yes' if request.mask_base64 else 'No'}")
     
     try:
-        image_url, image_base64 = await openai_service.generate_image(
+        result = await openai_service.generate_image(
             prompt=request.prompt,
             image_base64=request.image_base64,
             mask_base64=request.mask_base64,
             style=request.style.value if request.style else "photorealistic"
         )
         
-        print(f"📤 Returning generated image: {len(image_base64)} chars")
+        print(f"📤 Returning generated image: {len(result.data)} bytes")
         
-        return GenerationResponse(
-            imageUrl=image_url,
-            imageBase64=image_base64
-        )
+        return await image_response(result, response_format, GenerationResponse)
     except Exception as e:
         print(f"❌ Generation error: {str(e)}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post(
+    "/generate/upload",
+    response_model=GenerationResponse,
+    responses={
+        **IMAGE_RESPONSES,
+        400: {"model": ErrorResponse},
+        500: {"model": ErrorResponse}
+    }
+)
+async def generate_image_upload(
+    prompt: str = Form(..., min_length=1, max_length=1000),
+    image: UploadFile = File(...),
+    mask: Optional[UploadFile] = File(None),
+    style: GenerationStyle = Form(GenerationStyle.PHOTOREALISTIC),
+    response_format: Optional[str] = Depends(image_format),
+):
+    """
+    /generate with the image and optional mask as multipart file parts.
+    """
+    return await generate_image(GenerationRequest(
+        prompt=prompt,
+        imageBase64=await read_upload(image),
+        maskBase64=await read_optional_upload(mask, "mask"),
+        style=style,
+    ), response_format)
+
+
 from pydantic import BaseModel, Field
-from typing import Optional
 
 class AnalyzeRequest(BaseModel):
-    image_base64: str
+    image_base64: Union[str, bytes]
     prompt: str = "Describe this architectural image"
 
 class ReplicateGenerateRequest(BaseModel):
     prompt: str
-    image_base64: str = Field(..., alias="imageBase64")
+    image_base64: Union[str, bytes] = Field(..., alias="imageBase64")
     strength: float = 0.75  # 0.0 = keep original, 1.0 = full generation
     style: str = "architectural"
     
@@ -78,25 +106,37 @@ async def analyze_image(request: AnalyzeRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/analyze/upload")
+async def analyze_image_upload(
+    image: UploadFile = File(...),
+    prompt: str = Form("Describe this architectural image"),
+):
+    """
+    /analyze with the image as a multipart file part.
+    """
+    return await analyze_image(AnalyzeRequest(image_base64=await read_upload(image), prompt=prompt))
+
+
 @router.post(
     "/generate/replicate",
     response_model=GenerationResponse,
     responses={
+        **IMAGE_RESPONSES,
         400: {"model": ErrorResponse},
         500: {"model": ErrorResponse}
     }
 )
-async def generate_with_replicate(request: ReplicateGenerateRequest):
+async def generate_with_replicate(request: ReplicateGenerateRequest, response_format: Optional[str] = Depends(image_format)):
     """
     Generate image using Replicate SDXL img2img.
     Uses your image as starting point.
     """
     print(f"📥 Replicate generate request: prompt='{request.prompt[:50]}...'")
-    print(f"   Image size: {len(request.image_base64)} chars")
+    print(f"   Image size: {len(request.image_base64)} {'bytes' if isinstance(request.image_base64, bytes) else 'chars'}")
     print(f"   Strength: {request.strength}")
     
     try:
-        image_url, image_base64 = await replicate_service.generate_image(
+        result = await replicate_service.generate_image(
             prompt=request.prompt,
             image_base64=request.image_base64,
             strength=request.strength,
@@ -105,10 +145,7 @@ async def generate_with_replicate(request: ReplicateGenerateRequest):
         
         print(f"📤 Returning Replicate generated image")
         
-        return GenerationResponse(
-            imageUrl=image_url,
-            imageBase64=image_base64
-        )
+        return await image_response(result, response_format, GenerationResponse)
     except Exception as e:
         print(f"❌ Replicate generation error: {str(e)}")
         traceback.print_exc()
@@ -117,7 +154,7 @@ async def generate_with_replicate(request: ReplicateGenerateRequest):
 
 class StyleTransferRequest(BaseModel):
     prompt: str
-    image_base64: str = Field(..., alias="imageBase64")
+    image_base64: Union[str, bytes] = Field(..., alias="imageBase64")
     
     class Config:
         populate_by_name = True
@@ -127,32 +164,30 @@ class StyleTransferRequest(BaseModel):
     "/generate/style-transfer",
     response_model=GenerationResponse,
     responses={
+        **IMAGE_RESPONSES,
         400: {"model": ErrorResponse},
         500: {"model": ErrorResponse}
     }
 )
-async def style_transfer(request: StyleTransferRequest):
+async def style_transfer(request: StyleTransferRequest, response_format: Optional[str] = Depends(image_format)):
     """
     Pure style transfer using ControlNet.
     Preserves EXACT structure/edges, only changes style.
     This is for 1:1 photo-to-render conversion.
     """
     print(f"📥 Style transfer request: prompt='{request.prompt[:50]}...'")
-    print(f"   Image size: {len(request.image_base64)} chars")
+    print(f"   Image size: {len(request.image_base64)} {'bytes' if isinstance(request.image_base64, bytes) else 'chars'}")
     print(f"   Mode: ControlNet Canny (edge preservation)")
     
     try:
-        image_url, image_base64 = await replicate_service.style_transfer(
+        result = await replicate_service.style_transfer(
             prompt=request.prompt,
             image_base64=request.image_base64,
         )
         
         print(f"📤 Returning style-transferred image")
         
-        return GenerationResponse(
-            imageUrl=image_url,
-            imageBase64=image_base64
-        )
+        return await image_response(result, response_format, GenerationResponse)
     except Exception as e:
         print(f"❌ Style transfer error: {str(e)}")
         traceback.print_exc()
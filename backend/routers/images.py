@@ -0,0 +1,118 @@
+"""
+Image store endpoints and image-ID resolution.
+
+Upload once (or take the imageId from any result), then pass `imageId`
+instead of `imageBase64` on render / edit / red-pen requests.
+"""
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, File, HTTPException, UploadFile, Response
+from pydantic import BaseModel
+
+from routers.uploads import read_upload
+from services.image_pipeline import ImageSource, content_hash
+from services.image_result import ImageResult
+from services.image_store import image_store, is_image_id, sniff_mime_type
+
+router = APIRouter(prefix="/api", tags=["images"])
+
+# Background store writes, referenced until they finish so they aren't garbage-collected
+_pending_stores: set[asyncio.Task] = set()
+
+
+class ImageStoreResponse(BaseModel):
+    imageId: str
+    imageUrl: str
+    width: int
+    height: int
+
+
+def image_path(image_id: str) -> str:
+    return f"{router.prefix}/images/{image_id}"
+
+
+async def load_image(image_id: str, field: str = "imageId") -> bytes:
+    """Stored image bytes for an ID (400 if malformed, 404 if unknown)"""
+    if not is_image_id(image_id):
+        raise HTTPException(status_code=400, detail=f"'{field}' is not a valid image ID")
+    data = await image_store.get(image_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail=f"Image '{image_id}' not found")
+    return data
+
+
+async def resolve_image(
+    image_base64: Optional[ImageSource],
+    image_id: Optional[str],
+) -> ImageSource:
+    """The request image, inline or by ID (exactly one must be given)"""
+    if image_base64 is not None and image_id:
+        raise HTTPException(status_code=400, detail="Send either imageBase64 or imageId, not both")
+    if image_id:
+        return await load_image(image_id)
+    if image_base64 is None:
+        raise HTTPException(status_code=400, detail="imageBase64 or imageId is required")
+    return image_base64
+
+
+async def resolve_images(
+    images: Optional[list[ImageSource]],
+    image_ids: Optional[list[str]],
+) -> Optional[list[ImageSource]]:
+    """Inline images followed by the ones given by ID"""
+    resolved = list(images or [])
+    for i, image_id in enumerate(image_ids or []):
+        resolved.append(await load_image(image_id, f"referenceImageIds[{i}]"))
+    return resolved or None
+
+
+async def store_image(data: bytes, image_id: Optional[str] = None) -> Optional[str]:
+    """
+    Best-effort store of an input or result: callers still have the bytes, so
+    a store outage only costs the client its imageId.
+    """
+    try:
+        return await image_store.put(data, image_id)
+    except Exception as e:
+        print(f"⚠️ Image store write failed: {e}")
+        return None
+
+
+def store_image_later(data: bytes) -> str:
+    """
+    The ID of data, which is stored in the background: for responses that
+    carry the bytes anyway, so an S3 PUT isn't on their critical path. The
+    ID 404s until the write lands (or for good, if the store is down).
+    """
+    image_id = content_hash(data)
+    task = asyncio.ensure_future(store_image(data, image_id))
+    _pending_stores.add(task)
+    task.add_done_callback(_pending_stores.discard)
+    return image_id
+
+
+@router.post("/images", response_model=ImageStoreResponse)
+async def upload_image(image: UploadFile = File(...)):
+    """Store an image and return its content-addressed ID"""
+    data = await read_upload(image)
+    try:
+        width, height = ImageResult(data=data).size
+    except Exception:
+        raise HTTPException(status_code=400, detail="'image' is not a readable image")
+
+    image_id = await image_store.put(data)
+    return ImageStoreResponse(imageId=image_id, imageUrl=image_path(image_id), width=width, height=height)
+
+
+@router.get("/images/{image_id}")
+async def get_image(image_id: str):
+    """Stored image bytes. IDs are content hashes, so responses never change."""
+    data = await load_image(image_id)
+    return Response(
+        content=data,
+        media_type=sniff_mime_type(data),
+        headers={
+            "Cache-Control": "public, max-age=31536000, immutable",
+            "ETag": f'"{image_id}"',
+        },
+    )
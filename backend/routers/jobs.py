@@ -0,0 +1,146 @@
+"""
+Background job endpoints for long renders, edits and red-pen executions.
+
+POST /api/jobs takes {"kind": "render" | "edit" | "redpen", "request": {...}}
+where request is the body the matching endpoint takes (/api/render,
+/api/edit, /api/redpen/execute), and answers 202 with a job ID. Poll
+GET /api/jobs/{id}, then fetch GET /api/jobs/{id}/result, which negotiates
+the image format like the synchronous endpoints (JSON, ?format=png|webp|id).
+"""
+from typing import Any, Literal, Optional
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field, ValidationError
+
+from routers.fast_json import FastJSONRoute
+from routers.images import image_path, load_image
+from routers.render import (
+    EditRequest,
+    RedPenExecuteRequest,
+    RenderRequest,
+    edit_image,
+    execute_redpen,
+    render_image,
+)
+from routers.responses import ID_FORMAT, IMAGE_RESPONSES, image_format, image_response
+from services.image_result import ImageResult
+from services.job_queue import FAILED, SUCCEEDED, Job, QueueFullError, job_manager
+
+router = APIRouter(prefix="/api", tags=["jobs"], route_class=FastJSONRoute)
+
+# kind -> (request model, endpoint handler)
+JOB_ENDPOINTS = {
+    "render": (RenderRequest, render_image),
+    "edit": (EditRequest, edit_image),
+    "redpen": (RedPenExecuteRequest, execute_redpen),
+}
+
+
+class JobRequest(BaseModel):
+    kind: Literal["render", "edit", "redpen"]
+    request: dict[str, Any] = Field(..., description="Body of the matching synchronous endpoint")
+
+
+class JobResponse(BaseModel):
+    jobId: str
+    kind: str
+    status: str = Field(..., description="queued, running, succeeded, failed or cancelled")
+    createdAt: float
+    startedAt: Optional[float] = None
+    finishedAt: Optional[float] = None
+    statusUrl: str
+    resultUrl: Optional[str] = Field(None, description="Set once the job has succeeded")
+    imageId: Optional[str] = None
+    error: Optional[str] = None
+
+
+class JobResultResponse(BaseModel):
+    imageUrl: str
+    imageBase64: str
+    imageId: Optional[str] = None
+    promptPreview: Optional[str] = None
+
+
+def job_response(job: Job) -> JobResponse:
+    succeeded = job.status == SUCCEEDED
+    return JobResponse(
+        jobId=job.id,
+        kind=job.kind,
+        status=job.status,
+        createdAt=job.created_at,
+        startedAt=job.started_at,
+        finishedAt=job.finished_at,
+        statusUrl=f"{router.prefix}/jobs/{job.id}",
+        resultUrl=f"{router.prefix}/jobs/{job.id}/result" if succeeded else None,
+        imageId=job.result.get("imageId") if succeeded else None,
+        error=job.error,
+    )
+
+
+def _endpoint_runner(model: type[BaseModel], handler):
+    async def run(payload: dict) -> dict:
+        # The endpoint itself does the work; ?format=id stores the image and returns only the ID
+        response = await handler(model.model_validate(payload), ID_FORMAT)
+        return orjson.loads(response.body)
+    return run
+
+
+for _kind, (_model, _handler) in JOB_ENDPOINTS.items():
+    job_manager.register(_kind, _endpoint_runner(_model, _handler))
+
+
+async def get_job(job_id: str) -> Job:
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return job
+
+
+@router.post("/jobs", response_model=JobResponse, status_code=202)
+async def submit_job(body: JobRequest):
+    """Queue a render, edit or red-pen execution and return its job ID at once"""
+    model, _ = JOB_ENDPOINTS[body.kind]
+    try:
+        model.model_validate(body.request)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+
+    try:
+        job = await job_manager.submit(body.kind, body.request)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    return job_response(job)
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def job_status(job_id: str):
+    """Job status; resultUrl is set once it has succeeded"""
+    return job_response(await get_job(job_id))
+
+
+@router.get("/jobs/{job_id}/result", response_model=JobResultResponse, responses=IMAGE_RESPONSES)
+async def job_result(job_id: str, response_format: Optional[str] = Depends(image_format)):
+    """The result image of a succeeded job, in the negotiated format"""
+    job = await get_job(job_id)
+    if job.status == FAILED:
+        raise HTTPException(status_code=job.status_code or 500, detail=job.error)
+    if job.status != SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+
+    image_id = job.result["imageId"]
+    fields = {"promptPreview": job.result.get("promptPreview")}
+    if response_format == ID_FORMAT:
+        return JSONResponse({"imageId": image_id, "imageUrl": image_path(image_id), **fields})
+    return await image_response(ImageResult(data=await load_image(image_id)), response_format, JobResultResponse, **fields)
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=JobResponse)
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job; finished jobs are returned unchanged"""
+    job = await job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return job_response(job)
@@ -1,41 +1,108 @@
-from typing import Optional
-from fastapi import APIRouter, HTTPException
+from typing import Callable, Optional
+from fastapi import APIRouter, HTTPException, Depends, File, Form, UploadFile
 from pydantic import BaseModel, Field
 import base64
-import httpx
-import asyncio
 from PIL import Image
+import asyncio
 import io
+import time
 from config import settings
+from routers.fast_json import FastJSONRoute
+from routers.uploads import read_upload, read_optional_upload, read_uploads
+from routers.images import resolve_image, resolve_images, store_image
+from routers.events import SSE_RESPONSES, event_stream, stream_format, variant_stream
+from routers.responses import IMAGE_RESPONSES, image_format, image_response
+from services.image_result import ImageResult
 from services.replicate_service import run_with_retry
 from services.openai_service import openai_service, RenderQuality, StylePreset
+from services.image_pipeline import ImageSource, prepare_image_async, source_bytes, FLUX_IMAGE_SPEC, VISION_IMAGE_SPEC
+from services.compositing import composite_edit
+from services.circuit_breaker import CircuitOpenError, circuit_breakers, retry_after_header
+from services.hedging import Attempt, hedger
+from services.result_cache import input_hash, result_cache, result_key
+from services import progress
+from services.cpu_pool import cpu_pool
+from services.http_client import http_pool
+from services.masks import CompactMask, MaskSource, prepare_mask
 
 # Toggle between OpenAI gpt-image-1 and Replicate
-USE_OPENAI = True  # Set to False to use Replicate/Flux models
+USE_OPENAI = True  # Preferred provider; set to False to prefer Replicate/Flux (routing fails over by circuit health)
 
 # OpenAI model to use: "gpt-image-1", "gpt-image-1.5", or "dall-e-2"
 # gpt-image-1/1.5: Best quality, requires org verification
 # dall-e-2: Works without verification (lower quality, but still good)
 OPENAI_IMAGE_MODEL = "gpt-image-1.5"  # Latest model - better quality and instruction following
 
-router = APIRouter(prefix="/api", tags=["render"])
+FLUX_KONTEXT_MODEL = "black-forest-labs/flux-kontext-pro"
+FLUX_FILL_MODEL = "black-forest-labs/flux-fill-pro"
+
+# Models /render/variants can fan out to ("flux-kontext-pro" runs on Replicate)
+VARIANT_MODELS = ("gpt-image-1", "gpt-image-1.5", "dall-e-2", "flux-kontext-pro")
+
+# Cinematic architectural visualization - professional render quality
+FLUX_RENDER_PROMPT = """Transform this real-world photograph into a cinematic architectural visualization.
+
+Preserve the exact building shape, geometry, camera angle, perspective, and relative scale of all structures.
+
+Convert the scene into a high-end architectural render with golden hour lighting and soft sunlight. 
+Clean, idealized environment with lush landscaping and greenery.
+Warm reflections and polished materials throughout.
+
+Enhance building surfaces into refined architectural materials.
+Glass should be reflective and glowing. Metal should be warm-toned and premium.
+Lighting should be dramatic and directional with soft cinematic shadows.
+
+Style: Hyper-realistic architectural visualization, Unreal Engine quality, large-scale development marketing render.
+High dynamic range with soft atmospheric haze.
+
+Do NOT change the building design, alter structure, distort proportions, or change camera position.
+
+Final look: A polished real-estate architectural competition render that feels like a billion-dollar development brochure."""
+
+# Red-pen step 1: a clean render of the marked-up photo before the change pass
+REDPEN_RENDER_PROMPT = "Transform this photo into a clean professional architectural visualization render. Keep the EXACT same scene, camera angle, perspective, and all elements in their exact positions. Just change the style to a polished 3D architectural render with clean materials and professional lighting."
+
+router = APIRouter(prefix="/api", tags=["render"], route_class=FastJSONRoute)
+
+# Hosted output URLs of recent Flux renders by base_render_key(), for chaining steps without a re-upload
+flux_output_urls: dict[str, tuple[str, float]] = {}
 
 
 class RenderRequest(BaseModel):
-    imageBase64: str = Field(..., alias="imageBase64")
+    imageBase64: Optional[ImageSource] = Field(None, alias="imageBase64")
+    imageId: Optional[str] = Field(None, description="Stored image ID, in place of imageBase64")
     quality: str = Field("standard", description="Quality tier: draft, standard, or high")
     style: str = Field("real_estate", description="Style preset: real_estate, industrial, evening, modern, custom")
+    tiled: bool = Field(False, description="Render in overlapping tiles, beyond the model's maximum output size")
+    outputSize: Optional[int] = Field(None, gt=0, description="Tiled: longest output side (default: the source's, up to TILED_RENDER_MAX_SIZE)")
+    
+    class Config:
+        populate_by_name = True
+
+
+class RenderVariantsRequest(BaseModel):
+    imageBase64: Optional[ImageSource] = Field(None, alias="imageBase64")
+    imageId: Optional[str] = Field(None, description="Stored image ID, in place of imageBase64")
+    quality: str = Field("standard", description="Quality tier: draft, standard, or high")
+    styles: list[str] = Field(["real_estate"], min_length=1, description="Style presets, one variant group each (OpenAI models)")
+    models: Optional[list[str]] = Field(None, min_length=1, description=f"Models, one variant group each: {', '.join(VARIANT_MODELS)} (default: the configured one)")
+    count: int = Field(1, ge=1, description="Variants per style and model: one call with n=count on OpenAI, one seed each on Flux")
+    seed: Optional[int] = Field(None, description="Flux: seed of the first variant (the rest use seed+1, seed+2, ...)")
     
     class Config:
         populate_by_name = True
 
 
 class EditRequest(BaseModel):
-    imageBase64: str = Field(..., alias="imageBase64")
+    imageBase64: Optional[ImageSource] = Field(None, alias="imageBase64")
+    imageId: Optional[str] = Field(None, description="Stored image ID, in place of imageBase64")
     prompt: str
     quality: str = Field("standard", description="Quality tier: draft, standard, or high")
     style: str = Field("real_estate", description="Style preset: real_estate, industrial, evening, modern, custom")
-    referenceImages: Optional[list[str]] = Field(None, description="Reference images base64 (up to 5)")
+    maskBase64: Optional[ImageSource] = Field(None, description="Optional mask (white = edit, black = keep)")
+    mask: Optional[CompactMask] = Field(None, description="Optional mask as RLE, packbits or brush strokes, in place of maskBase64")
+    referenceImages: Optional[list[ImageSource]] = Field(None, description="Reference images base64 (up to 5)")
+    referenceImageIds: Optional[list[str]] = Field(None, description="Stored reference image IDs (count toward the 5)")
     renderMode: str = Field("plan_to_render", description="Mode: 'plan_to_render' for accuracy, 'pretty_render' for marketing")
     
     class Config:
@@ -46,6 +113,7 @@ class RenderResponse(BaseModel):
     imageUrl: str
     imageBase64: str
     promptPreview: Optional[str] = Field(None, description="Preview of the prompt sent to the model")
+    imageId: Optional[str] = Field(None, description="Image store ID of the result")
 
 
 def parse_quality(quality_str: str) -> RenderQuality:
@@ -70,296 +138,165 @@ def parse_style(style_str: str) -> StylePreset:
     return style_map.get(style_str.lower(), StylePreset.REAL_ESTATE)
 
 
+async def flux_kontext(prompt: str, image_uri: str, seed: Optional[int] = None) -> str:
+    """Run Flux Kontext Pro on an image (data URI or URL) and return the output image URL"""
+    input_params = {
+        "prompt": prompt,
+        "input_image": image_uri,
+        "aspect_ratio": "match_input_image",
+        "output_format": "png",
+        "safety_tolerance": 5,
+    }
+    if seed is not None:
+        input_params["seed"] = seed
+    output = await run_with_retry(FLUX_KONTEXT_MODEL, input_params)
+    
+    # Output is a URL, or a list of them
+    if isinstance(output, list) and len(output) > 0:
+        return str(output[0])
+    return str(output)
+
+
+def base_render_key(image: ImageSource, prompt: str) -> str:
+    """Result cache key of a Flux Kontext render of image with prompt"""
+    return result_key(operation="flux_render", image=input_hash(image), prompt=prompt, model=FLUX_KONTEXT_MODEL)
+
 
-@router.post("/render", response_model=RenderResponse)
-async def render_image(request: RenderRequest):
+def remember_output_url(key: str, url: str) -> None:
+    now = time.monotonic()
+    expired = [k for k, (_, at) in flux_output_urls.items() if now - at > settings.replicate_output_url_ttl]
+    for k in expired:
+        del flux_output_urls[k]
+    flux_output_urls[key] = (url, now)
+
+
+def recent_output_url(key: str) -> Optional[str]:
+    """The hosted output URL of a recent render, while Replicate still serves it"""
+    entry = flux_output_urls.get(key)
+    if entry is not None and time.monotonic() - entry[1] < settings.replicate_output_url_ttl:
+        return entry[0]
+    return None
+
+
+async def flux_render(
+    image: ImageSource,
+    prompt: str = FLUX_RENDER_PROMPT,
+    on_output_url: Optional[Callable[[str], None]] = None,
+) -> ImageResult:
     """
-    Photo-to-render conversion.
-    Uses OpenAI gpt-image-1 or Replicate Flux based on configuration.
-    Preserves original structure while applying render style.
-    
-    Quality tiers:
-    - draft: Fast, lower fidelity (512x512 for dall-e-2, 1024x1024 for gpt-image-1)
-    - standard: Default balance (1024x1024)
-    - high: Best quality with HD mode (1536x1024, quality=hd)
+    Photo-to-render with Flux Kontext Pro (no quality or style), cached by
+    input hash and prompt so /render and red-pen executions share it.
     
-    Style presets:
-    - real_estate: Bright daylight, clean landscaping, marketing quality
-    - industrial: Overcast, utilitarian aesthetic
-    - evening: Golden hour, warm tones
-    - modern: Minimalist, contemporary materials
+    on_output_url is called with the hosted output URL as soon as the
+    prediction finishes, before the download, so a chained step can start
+    from it.
     """
+    key = base_render_key(image, prompt)
     
-    # Parse quality and style
-    quality = parse_quality(request.quality)
-    style = parse_style(request.style)
-    
-    # Use OpenAI gpt-image-1 for rendering
-    if USE_OPENAI:
-        print("=" * 60)
-        print(f"🎨 RENDER REQUEST - OpenAI {OPENAI_IMAGE_MODEL}")
-        print(f"   Quality: {quality.value}, Style: {style.value}")
-        print("=" * 60)
-        
-        if not settings.openai_api_key:
-            raise HTTPException(status_code=500, detail="OpenAI API not configured")
-        
-        try:
-            result_url, result_base64 = await openai_service.render_image(
-                image_base64=request.imageBase64,
-                model=OPENAI_IMAGE_MODEL,
-                quality=quality,
-                style_preset=style,
-            )
-            
-            return RenderResponse(
-                imageUrl=result_url,
-                imageBase64=result_base64,
-                promptPreview=None,  # Render uses fixed prompt
-            )
-        except Exception as e:
-            print(f"❌ ERROR: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            raise HTTPException(status_code=500, detail=str(e))
-    
-    # Fallback to Replicate/Flux
-    print("=" * 60)
-    print("🎨 RENDER REQUEST - Using Flux Kontext")
-    print("=" * 60)
-    
-    if not settings.replicate_api_token:
-        raise HTTPException(status_code=500, detail="Replicate API not configured")
-    
-    try:
+    async def create() -> ImageResult:
         # Prepare image
         print(f"📦 Preparing image...")
-        image_data = base64.b64decode(request.imageBase64)
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Convert to RGB if needed
-        if image.mode in ('RGBA', 'P', 'LA'):
-            image = image.convert('RGB')
-        
-        # Resize if too large (max 1024 on longest side)
-        max_size = 1024
-        if max(image.size) > max_size:
-            ratio = max_size / max(image.size)
-            new_size = (int(image.size[0] * ratio), int(image.size[1] * ratio))
-            image = image.resize(new_size, Image.Resampling.LANCZOS)
-        
-        print(f"   Size: {image.size}")
-        
-        # Convert to data URI
-        buffer = io.BytesIO()
-        image.save(buffer, format="PNG")
-        buffer.seek(0)
-        image_b64 = base64.b64encode(buffer.getvalue()).decode()
-        image_uri = f"data:image/png;base64,{image_b64}"
+        progress.report("preprocessing")
+        prepared = await prepare_image_async(image, FLUX_IMAGE_SPEC)
+        print(f"   Size: {prepared.size}")
+        image_uri = prepared.data_uri
         
         print(f"🚀 Calling Flux Kontext...")
         
-        # Cinematic architectural visualization - professional render quality
-        prompt = """Transform this real-world photograph into a cinematic architectural visualization.
-
-Preserve the exact building shape, geometry, camera angle, perspective, and relative scale of all structures.
-
-Convert the scene into a high-end architectural render with golden hour lighting and soft sunlight. 
-Clean, idealized environment with lush landscaping and greenery.
-Warm reflections and polished materials throughout.
-
-Enhance building surfaces into refined architectural materials.
-Glass should be reflective and glowing. Metal should be warm-toned and premium.
-Lighting should be dramatic and directional with soft cinematic shadows.
-
-Style: Hyper-realistic architectural visualization, Unreal Engine quality, large-scale development marketing render.
-High dynamic range with soft atmospheric haze.
-
-Do NOT change the building design, alter structure, distort proportions, or change camera position.
-
-Final look: A polished real-estate architectural competition render that feels like a billion-dollar development brochure."""
-        
         # Use Flux Kontext Pro - designed for precise editing while preserving details
-        # Try with input_image parameter name
         print(f"   Image URI starts with: {image_uri[:50]}...")
-        
-        output = run_with_retry(
-            "black-forest-labs/flux-kontext-pro",
-            {
-                "prompt": prompt,
-                "input_image": image_uri,  # Try input_image instead of image
-                "aspect_ratio": "match_input_image",
-                "output_format": "png",
-                "safety_tolerance": 5,
-            }
-        )
-        
+        image_url = await flux_kontext(prompt, image_uri)
         print(f"✅ Flux Kontext response received")
-        print(f"   Output: {output}")
-        
-        # Get the result URL
-        if isinstance(output, list) and len(output) > 0:
-            image_url = str(output[0])
-        else:
-            image_url = str(output)
+        remember_output_url(key, image_url)
+        if on_output_url is not None:
+            on_output_url(image_url)
         
         print(f"   Downloading from: {image_url[:60]}...")
         
-        # Download the result with retry logic
-        image_bytes = None
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    response = await client.get(image_url)
-                    image_bytes = response.content
-                    break
-            except httpx.TimeoutException:
-                print(f"   Download attempt {attempt + 1} timed out, retrying...")
-                if attempt == max_retries - 1:
-                    raise HTTPException(status_code=500, detail="Failed to download generated image after multiple attempts")
-                await asyncio.sleep(1)
-        
-        if not image_bytes:
-            raise HTTPException(status_code=500, detail="Failed to download generated image")
+        # Download the result (pooled client, retries transient failures)
+        image_bytes = await http_pool.download(image_url)
         
         print(f"   Downloaded: {len(image_bytes)} bytes")
-        
-        # Convert to base64
-        result_base64 = base64.b64encode(image_bytes).decode()
-        result_data_url = f"data:image/png;base64,{result_base64}"
-        
-        print("=" * 60)
-        print("✅ RENDER COMPLETE")
-        print("=" * 60)
-        
-        return RenderResponse(
-            imageUrl=result_data_url,
-            imageBase64=result_base64
-        )
-        
-    except Exception as e:
-        print(f"❌ ERROR: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+        return ImageResult(data=image_bytes)
+    
+    return await result_cache.get_or_create(key, create)
 
 
-@router.post("/edit", response_model=RenderResponse)
-async def edit_image(request: EditRequest):
+async def redpen_base_render(image: ImageSource) -> tuple[str, bool]:
     """
-    Edit an existing render using natural language.
-    Uses OpenAI gpt-image-1 or Replicate Flux based on configuration.
+    Red-pen step 1, reused when it can be: the red-pen base render of this
+    photo, else a Flux /render of it, else a new one. Returns the image for
+    step 2 and whether it was reused.
     
-    Supports:
-    - Masked editing (inpainting) when maskBase64 is provided
-    - Whole-image editing when no mask
-    - Quality tiers and style presets
-    - Materials and scale specifications
+    Step 2 gets the hosted output URL whenever there is one, so the render
+    isn't downloaded and re-uploaded on the critical path; a new render is
+    downloaded (for the cache) while step 2 runs. Only a reused render
+    whose URL has expired goes back up as a data URI.
     """
+    keys = [base_render_key(image, prompt) for prompt in (REDPEN_RENDER_PROMPT, FLUX_RENDER_PROMPT)]
+    for key in keys:
+        url = recent_output_url(key)
+        if url is not None:
+            return url, True
+    for key in keys:
+        cached = await result_cache.get(key)
+        if cached is not None:
+            return cached.data_url, True
     
-    # Parse quality and style
-    quality = parse_quality(request.quality)
-    style = parse_style(request.style)
-    
-    # Use OpenAI gpt-image-1 for editing
-    if USE_OPENAI:
-        print("=" * 60)
-        print(f"✏️ EDIT REQUEST - OpenAI {OPENAI_IMAGE_MODEL}")
-        print(f"   Quality: {quality.value}, Style: {style.value}")
-        print(f"   Render Mode: {request.renderMode}")
-        print("=" * 60)
-        print(f"📝 Prompt: {request.prompt}")
-        print(f"🖼️ Reference images: {len(request.referenceImages) if request.referenceImages else 0}")
-        
-        if not settings.openai_api_key:
-            raise HTTPException(status_code=500, detail="OpenAI API not configured")
-        
-        try:
-            result_url, result_base64 = await openai_service.edit_image(
-                prompt=request.prompt,
-                image_base64=request.imageBase64,
-                mask_base64=None,  # No region selection for now
-                model=OPENAI_IMAGE_MODEL,
-                quality=quality,
-                style_preset=style,
-                reference_images=request.referenceImages,
-                render_mode=request.renderMode,
-            )
-            
-            return RenderResponse(
-                imageUrl=result_url,
-                imageBase64=result_base64,
-            )
-        except Exception as e:
-            print(f"❌ ERROR: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            raise HTTPException(status_code=500, detail=str(e))
-    
-    # Fallback to Replicate/Flux
-    print("=" * 60)
-    print("✏️ EDIT REQUEST - Using Replicate")
-    print("=" * 60)
-    
-    if not settings.replicate_api_token:
-        raise HTTPException(status_code=500, detail="Replicate API not configured")
-    
+    output_url = asyncio.get_running_loop().create_future()
+    render = asyncio.ensure_future(flux_render(image, REDPEN_RENDER_PROMPT, on_output_url=output_url.set_result))
+    # The download finishes in the background; its errors are logged by the result cache
+    render.add_done_callback(lambda done: done.cancelled() or done.exception())
     try:
+        await asyncio.wait({output_url, render}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        # Nobody has the output yet: stop the prediction (the cache cancels it with its last waiter)
+        if not output_url.done():
+            render.cancel()
+        raise
+    if output_url.done():
+        return output_url.result(), False
+    # Joined another request's render, or failed before there was an output URL
+    return render.result().data_url, False
+
+
+async def flux_edit(prompt: str, image: ImageSource, mask: Optional[MaskSource] = None) -> ImageResult:
+    """
+    Edit with Flux Fill Pro (masked) or Flux Kontext Pro (whole image) on
+    Replicate, cached like the OpenAI edit so routed traffic shares it.
+    """
+    key = result_key(
+        operation="flux_edit",
+        image=input_hash(image),
+        mask=input_hash(mask),
+        prompt=prompt,
+        model=FLUX_FILL_MODEL if mask else FLUX_KONTEXT_MODEL,
+        composite=bool(mask) and settings.composite_edits,
+        feather_px=settings.mask_feather_px,
+    )
+    
+    async def create() -> ImageResult:
         # Prepare image
         print(f"📦 Preparing image...")
-        image_data = base64.b64decode(request.imageBase64)
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Convert to RGB if needed
-        if image.mode in ('RGBA', 'P', 'LA'):
-            image = image.convert('RGB')
-        
-        # Resize if too large
-        max_size = 1024
-        if max(image.size) > max_size:
-            ratio = max_size / max(image.size)
-            new_size = (int(image.size[0] * ratio), int(image.size[1] * ratio))
-            image = image.resize(new_size, Image.Resampling.LANCZOS)
-        
-        print(f"   Size: {image.size}")
-        
-        # Convert to data URI
-        buffer = io.BytesIO()
-        image.save(buffer, format="PNG")
-        buffer.seek(0)
-        image_b64 = base64.b64encode(buffer.getvalue()).decode()
-        image_uri = f"data:image/png;base64,{image_b64}"
+        progress.report("preprocessing")
+        prepared = await prepare_image_async(image, FLUX_IMAGE_SPEC)
+        print(f"   Size: {prepared.size}")
+        image_uri = prepared.data_uri
         
         # Check if we have a mask for targeted inpainting
-        if request.maskBase64:
+        if mask:
             print(f"🎭 Mask provided - using SDXL Inpainting for precise editing")
             
             # Prepare mask
-            mask_data = base64.b64decode(request.maskBase64)
-            mask_image = Image.open(io.BytesIO(mask_data))
-            
-            # Resize mask to match image
-            mask_image = mask_image.resize(image.size, Image.Resampling.LANCZOS)
-            
-            # Convert to grayscale and ensure white = edit area
-            if mask_image.mode != 'L':
-                mask_image = mask_image.convert('L')
-            
-            # Convert mask to data URI
-            mask_buffer = io.BytesIO()
-            mask_image.save(mask_buffer, format="PNG")
-            mask_buffer.seek(0)
-            mask_b64 = base64.b64encode(mask_buffer.getvalue()).decode()
-            mask_uri = f"data:image/png;base64,{mask_b64}"
+            mask_uri = await cpu_pool.run(prepare_flux_mask, mask, prepared.size)
             
-            print(f"   Prompt: {request.prompt}")
+            print(f"   Prompt: {prompt}")
             
             # Use Flux Fill Pro for masked inpainting
-            output = run_with_retry(
-                "black-forest-labs/flux-fill-pro",
+            output = await run_with_retry(
+                FLUX_FILL_MODEL,
                 {
-                    "prompt": request.prompt,
+                    "prompt": prompt,
                     "image": image_uri,
                     "mask": mask_uri,
                     "output_format": "png",
@@ -369,13 +306,13 @@ async def edit_image(request: EditRequest):
             print(f"✅ Flux Fill Pro inpainting response received")
         else:
             print(f"🚀 No mask - using Flux Kontext for general edit...")
-            print(f"   Original prompt: {request.prompt}")
+            print(f"   Original prompt: {prompt}")
             
             # Wrap the prompt with STRONG preservation instructions
             enhanced_prompt = f"""CRITICAL: Make ONLY the specific change described below. 
 Keep EVERYTHING else EXACTLY the same - same camera angle, same lighting, same perspective, same composition.
 
-CHANGE TO MAKE: {request.prompt}
+CHANGE TO MAKE: {prompt}
 
 PRESERVE EXACTLY (do not alter in any way):
 - The exact camera position and angle
@@ -391,8 +328,8 @@ This is a surgical edit - change ONLY what is specified, nothing else."""
             print(f"   Enhanced prompt: {enhanced_prompt[:200]}...")
             
             # Use Flux Kontext for general edits without mask
-            output = run_with_retry(
-                "black-forest-labs/flux-kontext-pro",
+            output = await run_with_retry(
+                FLUX_KONTEXT_MODEL,
                 {
                     "prompt": enhanced_prompt,
                     "input_image": image_uri,
@@ -412,39 +349,382 @@ This is a surgical edit - change ONLY what is specified, nothing else."""
         
         print(f"   Downloading from: {image_url[:60]}...")
         
-        # Download the result with retry logic
-        image_bytes = None
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    response = await client.get(image_url)
-                    image_bytes = response.content
-                    break
-            except httpx.TimeoutException:
-                print(f"   Download attempt {attempt + 1} timed out, retrying...")
-                if attempt == max_retries - 1:
-                    raise HTTPException(status_code=500, detail="Failed to download generated image after multiple attempts")
-                await asyncio.sleep(1)
-        
-        if not image_bytes:
-            raise HTTPException(status_code=500, detail="Failed to download generated image")
+        # Download the result (pooled client, retries transient failures)
+        image_bytes = await http_pool.download(image_url)
         
         print(f"   Downloaded: {len(image_bytes)} bytes")
         
-        # Convert to base64
-        result_base64 = base64.b64encode(image_bytes).decode()
-        result_data_url = f"data:image/png;base64,{result_base64}"
+        if mask and settings.composite_edits:
+            progress.report("compositing")
+            image_bytes = await cpu_pool.run(composite_edit, source_bytes(image), image_bytes, mask)
+            print(f"   Composited into original: {len(image_bytes)} bytes")
+        
+        return ImageResult(data=image_bytes)
+    
+    return await result_cache.get_or_create(key, create)
+
+
+def route(flux_model: str, openai_only: bool = False) -> list[tuple[str, str]]:
+    """
+    Configured (provider, model) backends for /render and /edit, ranked by
+    circuit health (services.circuit_breaker). USE_OPENAI and
+    OPENAI_IMAGE_MODEL set the order among equally healthy ones; backends
+    with an open circuit are left out, and if that is all of them the
+    request fails at once with a 503.
+    """
+    openai_backends = []
+    if settings.openai_api_key:
+        openai_models = dict.fromkeys((OPENAI_IMAGE_MODEL, "gpt-image-1.5", "gpt-image-1"))
+        openai_backends = [("openai", model) for model in openai_models]
+    flux_backends = [("replicate", flux_model)] if settings.replicate_api_token and not openai_only else []
+    backends = openai_backends + flux_backends if USE_OPENAI else flux_backends + openai_backends
+    if not backends:
+        raise HTTPException(status_code=500, detail="No image provider configured (OPENAI_API_KEY / REPLICATE_API_TOKEN)")
+    try:
+        return circuit_breakers.rank(backends)
+    except CircuitOpenError as e:
+        print(f"🔌 {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers=retry_after_header(e))
+
+
+def failover(backends: list[tuple[str, str]], attempt: Callable[[str, str], Attempt]) -> Attempt:
+    """One attempt over backends in order; a backend whose circuit opened since routing is skipped"""
+    
+    async def create() -> ImageResult:
+        for backend in backends:
+            try:
+                _, create_one = attempt(*backend)
+                return await create_one()
+            except CircuitOpenError as e:
+                error = e
+                print(f"🔌 {e}, trying the next backend")
+        raise error
+    
+    return backends[0][0], create
+
+
+async def run_routed(endpoint: str, backends: list[tuple[str, str]], attempt: Callable[[str, str], Attempt]) -> ImageResult:
+    """
+    Run a generation on the first routed backend, falling over to the next
+    if its circuit opened since routing. With HEDGE_ENABLED it is hedged on
+    the best backend of the other provider (services.hedging).
+    """
+    primary = backends[0]
+    backup = next((backend for backend in backends if backend[0] != primary[0]), None)
+    if settings.hedge_enabled and backup is not None:
+        others = [backend for backend in backends if backend != backup]
+        return await hedger.run(endpoint, failover(others, attempt), attempt(*backup))
+    
+    _, create = failover(backends, attempt)
+    return await create()
+
+
+def prepare_flux_mask(mask: MaskSource, target_size: tuple) -> str:
+    """
+    Resize and feather a mask to the prepared image and return it as a
+    greyscale PNG data URI for Flux Fill (white = edit area). Runs on the
+    CPU pool.
+    """
+    mask_image = Image.fromarray(prepare_mask(mask, target_size, settings.mask_feather_px), mode="L")
+    
+    mask_buffer = io.BytesIO()
+    mask_image.save(mask_buffer, format="PNG")
+    mask_b64 = base64.b64encode(mask_buffer.getvalue()).decode()
+    return f"data:image/png;base64,{mask_b64}"
+
+
+@router.post("/render", response_model=RenderResponse, responses=IMAGE_RESPONSES)
+async def render_image(request: RenderRequest, response_format: Optional[str] = Depends(image_format)):
+    """
+    Photo-to-render conversion.
+    Uses OpenAI gpt-image-1 or Replicate Flux based on configuration.
+    Preserves original structure while applying render style.
+    
+    Quality tiers:
+    - draft: Fast, lower fidelity (512x512 for dall-e-2, 1024x1024 for gpt-image-1)
+    - standard: Default balance (1024x1024)
+    - high: Best quality with HD mode (1536x1024, quality=hd)
+    
+    Style presets:
+    - real_estate: Bright daylight, clean landscaping, marketing quality
+    - industrial: Overcast, utilitarian aesthetic
+    - evening: Golden hour, warm tones
+    - modern: Minimalist, contemporary materials
+    
+    tiled=true renders the output in overlapping tiles (up to outputSize on
+    the long side), several at a time, and stitches them.
+    
+    Runs on the healthiest configured backend (gpt-image-1.5, gpt-image-1,
+    Flux Kontext; see route()), failing fast with a 503 while every circuit
+    is open. With HEDGE_ENABLED, a slow render is hedged on the other
+    provider (services.hedging). Flux uses its fixed render prompt.
+    """
+    
+    image = await resolve_image(request.imageBase64, request.imageId)
+    
+    # Parse quality and style
+    quality = parse_quality(request.quality)
+    style = parse_style(request.style)
+    
+    if request.tiled:
+        if not USE_OPENAI or not OPENAI_IMAGE_MODEL.startswith("gpt-image"):
+            raise HTTPException(status_code=400, detail="Tiled renders need a gpt-image model")
+        if request.outputSize and request.outputSize > settings.tiled_render_max_size:
+            raise HTTPException(
+                status_code=400,
+                detail=f"outputSize is limited to {settings.tiled_render_max_size}px",
+            )
+        if not settings.openai_api_key:
+            raise HTTPException(status_code=500, detail="OpenAI API not configured")
+        
+        print("=" * 60)
+        print(f"🎨 TILED RENDER REQUEST - OpenAI {OPENAI_IMAGE_MODEL}, Style: {style.value}")
+        print("=" * 60)
+        
+        try:
+            result = await openai_service.render_image_tiled(
+                image_base64=image,
+                model=OPENAI_IMAGE_MODEL,
+                style_preset=style,
+                long_side=request.outputSize,
+            )
+            return await image_response(result, response_format, RenderResponse, promptPreview=None)
+        except Exception as e:
+            print(f"❌ ERROR: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    backends = route(FLUX_KONTEXT_MODEL)
+    
+    print("=" * 60)
+    print(f"🎨 RENDER REQUEST - {' / '.join(model for _, model in backends)}")
+    print(f"   Quality: {quality.value}, Style: {style.value}")
+    print("=" * 60)
+    
+    def attempt(provider: str, model: str) -> Attempt:
+        if provider == "openai":
+            return provider, lambda: openai_service.render_image(
+                image_base64=image,
+                model=model,
+                quality=quality,
+                style_preset=style,
+            )
+        return provider, lambda: flux_render(image)
+    
+    try:
+        result = await run_routed("render", backends, attempt)
         
         print("=" * 60)
-        print("✅ EDIT COMPLETE")
+        print("✅ RENDER COMPLETE")
         print("=" * 60)
         
-        return RenderResponse(
-            imageUrl=result_data_url,
-            imageBase64=result_base64
+        return await image_response(
+            result, response_format, RenderResponse,
+            promptPreview=None,  # Render uses fixed prompt
         )
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers=retry_after_header(e))
+    except Exception as e:
+        print(f"❌ ERROR: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/render/upload", response_model=RenderResponse, responses=IMAGE_RESPONSES)
+async def render_image_upload(
+    image: UploadFile = File(...),
+    quality: str = Form("standard"),
+    style: str = Form("real_estate"),
+    tiled: bool = Form(False),
+    outputSize: Optional[int] = Form(None),
+    response_format: Optional[str] = Depends(image_format),
+):
+    """
+    Photo-to-render conversion with the image as a multipart file part.
+    Same behaviour as /render without the base64 round trip.
+    """
+    return await render_image(RenderRequest(
+        imageBase64=await read_upload(image),
+        quality=quality,
+        style=style,
+        tiled=tiled,
+        outputSize=outputSize,
+    ), response_format)
+
+
+@router.post("/render/stream", responses=SSE_RESPONSES)
+async def render_image_stream(request: RenderRequest, response_format: Optional[str] = Depends(image_format)):
+    """
+    /render as Server-Sent Events: stage events and partial frames while it
+    runs, then the same JSON result (routers.events).
+    """
+    response_format = stream_format(response_format)
+    return event_stream(lambda: render_image(request, response_format))
+
+
+@router.post("/render/variants", responses=SSE_RESPONSES)
+async def render_variants(request: RenderVariantsRequest, response_format: Optional[str] = Depends(image_format)):
+    """
+    Several renders of one photo, streamed as Server-Sent Events as each
+    finishes (routers.events): one group per style x model (Flux ignores
+    styles), `count` variants per group.
+    
+    The input is decoded and prepared once per provider format, then all
+    groups run concurrently; the provider limiters keep them within quota.
+    Variants are never served from the result cache: asking again is asking
+    for new options.
+    
+    A gpt-image group whose circuit is open falls over to the healthiest
+    other gpt-image model (its events then carry `model` and
+    `requestedModel`). DALL-E 2 and Flux groups aren't rerouted: nothing
+    else renders their prompt or honours their seeds, so they fail fast
+    with a 503 error event instead.
+    """
+    response_format = stream_format(response_format)
+    image = source_bytes(await resolve_image(request.imageBase64, request.imageId))
+    quality = parse_quality(request.quality)
+    models = request.models or ([OPENAI_IMAGE_MODEL] if USE_OPENAI else ["flux-kontext-pro"])
+    unknown = sorted(set(models) - set(VARIANT_MODELS))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown models {unknown} (use {', '.join(VARIANT_MODELS)})")
+    
+    # (model, style) groups; Flux renders from one fixed prompt, so it gets a single group
+    plan = []
+    for model in dict.fromkeys(models):
+        if model == "flux-kontext-pro":
+            plan.append((model, None))
+        else:
+            plan.extend((model, style) for style in dict.fromkeys(parse_style(s) for s in request.styles))
+    total = len(plan) * request.count
+    if total > settings.render_variants_max:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{total} variants requested; the limit is {settings.render_variants_max}",
+        )
+    if any(model == "flux-kontext-pro" for model, _ in plan) and not settings.replicate_api_token:
+        raise HTTPException(status_code=500, detail="Replicate API not configured")
+    if any(model != "flux-kontext-pro" for model, _ in plan) and not settings.openai_api_key:
+        raise HTTPException(status_code=500, detail="OpenAI API not configured")
+    
+    print("=" * 60)
+    groups_label = ", ".join(f"{m}/{s.value}" if s else m for m, s in plan)
+    print(f"🎨 RENDER VARIANTS - {total} variants: {groups_label}")
+    print("=" * 60)
+    
+    # Prepare once per input format; every group after that hits the variant cache
+    specs = {openai_service.image_spec(m) if m != "flux-kontext-pro" else FLUX_IMAGE_SPEC for m, _ in plan}
+    prepared = {spec: await prepare_image_async(image, spec) for spec in specs}
+    
+    def openai_group(model: str, style: StylePreset, fields: dict):
+        def attempt(provider: str, backend_model: str) -> Attempt:
+            async def create() -> list[ImageResult]:
+                results = await openai_service.render_variations(image, request.count, backend_model, quality, style)
+                if backend_model != model:
+                    # variant_stream reads the group's fields when it finishes
+                    fields.update(model=backend_model, requestedModel=model)
+                return results
+            return provider, create
+        
+        async def run() -> list[ImageResult]:
+            backends = [("openai", model)]
+            if model.startswith("gpt-image"):
+                backends += [b for b in route(FLUX_KONTEXT_MODEL, openai_only=True) if b != ("openai", model)]
+            _, create = failover(backends, attempt)
+            try:
+                return await create()
+            except CircuitOpenError as e:
+                raise HTTPException(status_code=503, detail=str(e), headers=retry_after_header(e))
+        return run
+    
+    def flux_variant(seed: Optional[int]):
+        async def run() -> list[ImageResult]:
+            try:
+                image_url = await flux_kontext(FLUX_RENDER_PROMPT, prepared[FLUX_IMAGE_SPEC].data_uri, seed)
+            except CircuitOpenError as e:
+                raise HTTPException(status_code=503, detail=str(e), headers=retry_after_header(e))
+            return [ImageResult(data=await http_pool.download(image_url))]
+        return run
+    
+    groups = []
+    index = 0
+    for model, style in plan:
+        if style is not None:
+            indexes = list(range(index, index + request.count))
+            fields = {"model": model, "style": style.value}
+            groups.append((fields, indexes, openai_group(model, style, fields)))
+        else:
+            # Flux: one prediction per variant, so each streams on its own
+            for i in range(request.count):
+                seed = request.seed + i if request.seed is not None else None
+                groups.append(({"model": model, "seed": seed}, [index + i], flux_variant(seed)))
+        index += request.count
+    
+    return variant_stream(groups, response_format)
+
+
+@router.post("/edit", response_model=RenderResponse, responses=IMAGE_RESPONSES)
+async def edit_image(request: EditRequest, response_format: Optional[str] = Depends(image_format)):
+    """
+    Edit an existing render using natural language.
+    Uses OpenAI gpt-image-1 or Replicate Flux based on configuration.
+    
+    Supports:
+    - Masked editing (inpainting) when maskBase64 (PNG) or mask (RLE / packbits / strokes) is provided
+    - Whole-image editing when no mask
+    - Quality tiers and style presets
+    - Materials and scale specifications
+    - Routing to the healthiest backend (gpt-image-1.5, gpt-image-1, Flux
+      Kontext / Fill; OpenAI only with reference images), and hedging
+      across providers with HEDGE_ENABLED
+    """
+    
+    image = await resolve_image(request.imageBase64, request.imageId)
+    reference_images = await resolve_images(request.referenceImages, request.referenceImageIds)
+    if request.mask and request.maskBase64:
+        raise HTTPException(status_code=400, detail="Send either maskBase64 or mask, not both")
+    mask = request.mask or request.maskBase64
+    
+    # Parse quality and style
+    quality = parse_quality(request.quality)
+    style = parse_style(request.style)
+    
+    # Flux Fill for masked edits, Kontext otherwise; Flux can't take reference images
+    backends = route(FLUX_FILL_MODEL if mask else FLUX_KONTEXT_MODEL, openai_only=bool(reference_images))
+    
+    print("=" * 60)
+    print(f"✏️ EDIT REQUEST - {' / '.join(model for _, model in backends)}")
+    print(f"   Quality: {quality.value}, Style: {style.value}")
+    print(f"   Render Mode: {request.renderMode}")
+    print("=" * 60)
+    print(f"📝 Prompt: {request.prompt}")
+    print(f"🖼️ Reference images: {len(reference_images) if reference_images else 0}")
+    
+    def attempt(provider: str, model: str) -> Attempt:
+        if provider == "openai":
+            return provider, lambda: openai_service.edit_image(
+                prompt=request.prompt,
+                image_base64=image,
+                mask_base64=mask,
+                model=model,
+                quality=quality,
+                style_preset=style,
+                reference_images=reference_images,
+                render_mode=request.renderMode,
+            )
+        return provider, lambda: flux_edit(request.prompt, image, mask)
+    
+    try:
+        result = await run_routed("edit", backends, attempt)
+        
+        print("=" * 60)
+        print("✅ EDIT COMPLETE")
+        print("=" * 60)
         
+        return await image_response(result, response_format, RenderResponse)
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers=retry_after_header(e))
     except Exception as e:
         print(f"❌ ERROR: {str(e)}")
         import traceback
@@ -452,6 +732,42 @@ This is a surgical edit - change ONLY what is specified, nothing else."""
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/edit/upload", response_model=RenderResponse, responses=IMAGE_RESPONSES)
+async def edit_image_upload(
+    image: UploadFile = File(...),
+    prompt: str = Form(...),
+    quality: str = Form("standard"),
+    style: str = Form("real_estate"),
+    renderMode: str = Form("plan_to_render"),
+    mask: Optional[UploadFile] = File(None),
+    referenceImages: Optional[list[UploadFile]] = File(None),
+    response_format: Optional[str] = Depends(image_format),
+):
+    """
+    Edit with the image, optional mask and reference images as multipart
+    file parts. Same behaviour as /edit.
+    """
+    return await edit_image(EditRequest(
+        imageBase64=await read_upload(image),
+        prompt=prompt,
+        quality=quality,
+        style=style,
+        maskBase64=await read_optional_upload(mask, "mask"),
+        referenceImages=await read_uploads(referenceImages, "referenceImages"),
+        renderMode=renderMode,
+    ), response_format)
+
+
+@router.post("/edit/stream", responses=SSE_RESPONSES)
+async def edit_image_stream(request: EditRequest, response_format: Optional[str] = Depends(image_format)):
+    """
+    /edit as Server-Sent Events: stage events and partial frames while it
+    runs, then the same JSON result (routers.events).
+    """
+    response_format = stream_format(response_format)
+    return event_stream(lambda: edit_image(request, response_format))
+
+
 class PromptPreviewRequest(BaseModel):
     """Request to preview the prompt that will be generated"""
     prompt: str = Field(..., description="User's description of the change")
@@ -484,7 +800,8 @@ async def get_prompt_preview(request: PromptPreviewRequest):
 
 
 class RedPenAnalyzeRequest(BaseModel):
-    imageBase64: str = Field(..., alias="imageBase64")
+    imageBase64: Optional[ImageSource] = Field(None, alias="imageBase64")
+    imageId: Optional[str] = Field(None, description="Stored image ID, in place of imageBase64")
     
     class Config:
         populate_by_name = True
@@ -499,10 +816,12 @@ class RedPenAnalyzeResponse(BaseModel):
     analysis: str
     questions: list[QuestionWithSuggestions]
     suggestedPrompt: str
+    imageId: Optional[str] = Field(None, description="Stored ID of the analyzed image, for build-prompt / execute")
 
 
 class RedPenBuildPromptRequest(BaseModel):
-    imageBase64: str = Field(..., alias="imageBase64")
+    imageBase64: Optional[ImageSource] = Field(None, alias="imageBase64")
+    imageId: Optional[str] = Field(None, description="Stored image ID, in place of imageBase64")
     analysis: str
     questions: list[str]
     answers: list[str]
@@ -517,7 +836,8 @@ class RedPenBuildPromptResponse(BaseModel):
 
 
 class RedPenExecuteRequest(BaseModel):
-    imageBase64: str = Field(..., alias="imageBase64")
+    imageBase64: Optional[ImageSource] = Field(None, alias="imageBase64")
+    imageId: Optional[str] = Field(None, description="Stored image ID, in place of imageBase64")
     confirmedPrompt: str = Field(..., alias="confirmedPrompt")
     
     class Config:
@@ -527,6 +847,10 @@ class RedPenExecuteRequest(BaseModel):
 class RedPenExecuteResponse(BaseModel):
     imageUrl: str
     imageBase64: str
+    imageId: Optional[str] = None
+    baseRenderReused: bool = Field(False, description="Step 1 came from an earlier render of the same photo")
+    baseRenderSeconds: Optional[float] = Field(None, description="Step 1 (base render) latency")
+    changeSeconds: Optional[float] = Field(None, description="Step 2 (red-pen changes) latency")
 
 
 @router.post("/redpen/analyze", response_model=RedPenAnalyzeResponse)
@@ -538,35 +862,21 @@ async def analyze_redpen(request: RedPenAnalyzeRequest):
     print("🖊️ RED PEN ANALYZE - Understanding annotations...")
     print("=" * 60)
     
+    image = await resolve_image(request.imageBase64, request.imageId)
+    # Store inline uploads so build-prompt / execute can send the ID instead
+    image_id = request.imageId or await store_image(source_bytes(image))
+    
     if not settings.openai_api_key:
         raise HTTPException(status_code=500, detail="OpenAI API not configured")
     
     try:
-        from openai import OpenAI
         import json
         
-        # Decode image
-        image_data = base64.b64decode(request.imageBase64)
-        image = Image.open(io.BytesIO(image_data))
-        
-        if image.mode in ('RGBA', 'P', 'LA'):
-            image = image.convert('RGB')
-        
-        max_size = 1024
-        if max(image.size) > max_size:
-            ratio = max_size / max(image.size)
-            new_size = (int(image.size[0] * ratio), int(image.size[1] * ratio))
-            image = image.resize(new_size, Image.Resampling.LANCZOS)
-        
-        buffer = io.BytesIO()
-        image.save(buffer, format="PNG")
-        buffer.seek(0)
-        image_b64 = base64.b64encode(buffer.getvalue()).decode()
-        
-        openai_client = OpenAI(api_key=settings.openai_api_key)
+        # Prepare image (shared with the other vision calls on this upload)
+        prepared = await prepare_image_async(image, VISION_IMAGE_SPEC)
         
         # Ask GPT-4o to analyze AND generate questions
-        response = openai_client.chat.completions.create(
+        content = await openai_service.chat_completion(
             model="gpt-4o",
             messages=[
                 {
@@ -604,7 +914,7 @@ Be conversational and helpful like a design partner."""
                         },
                         {
                             "type": "image_url",
-                            "image_url": {"url": f"data:image/png;base64,{image_b64}"}
+                            "image_url": {"url": prepared.data_uri}
                         }
                     ]
                 }
@@ -612,7 +922,6 @@ Be conversational and helpful like a design partner."""
             max_tokens=600
         )
         
-        content = response.choices[0].message.content
         print(f"   Raw response: {content}")
         
         # Parse JSON from response
@@ -637,7 +946,8 @@ Be conversational and helpful like a design partner."""
         return RedPenAnalyzeResponse(
             analysis=result["analysis"],
             questions=questions,
-            suggestedPrompt=result["suggestedPrompt"]
+            suggestedPrompt=result["suggestedPrompt"],
+            imageId=image_id,
         )
         
     except json.JSONDecodeError as e:
@@ -646,7 +956,8 @@ Be conversational and helpful like a design partner."""
         return RedPenAnalyzeResponse(
             analysis="I can see red pen annotations on the image.",
             questions=["What would you like me to add based on your markings?"],
-            suggestedPrompt="Add the elements shown in the red pen annotations"
+            suggestedPrompt="Add the elements shown in the red pen annotations",
+            imageId=image_id,
         )
     except Exception as e:
         print(f"❌ ERROR: {str(e)}")
@@ -655,6 +966,12 @@ Be conversational and helpful like a design partner."""
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/redpen/analyze/upload", response_model=RedPenAnalyzeResponse)
+async def analyze_redpen_upload(image: UploadFile = File(...)):
+    """Step 1 with the marked-up image as a multipart file part."""
+    return await analyze_redpen(RedPenAnalyzeRequest(imageBase64=await read_upload(image)))
+
+
 @router.post("/redpen/build-prompt", response_model=RedPenBuildPromptResponse)
 async def build_redpen_prompt(request: RedPenBuildPromptRequest):
     """
@@ -664,11 +981,12 @@ async def build_redpen_prompt(request: RedPenBuildPromptRequest):
     print("🖊️ RED PEN BUILD PROMPT - GPT-4o reasoning...")
     print("=" * 60)
     
+    image = await resolve_image(request.imageBase64, request.imageId)
+    
     if not settings.openai_api_key:
         raise HTTPException(status_code=500, detail="OpenAI API not configured")
     
     try:
-        from openai import OpenAI
         import json
         
         # Build Q&A pairs
@@ -680,24 +998,10 @@ async def build_redpen_prompt(request: RedPenBuildPromptRequest):
         print(f"   Analysis: {request.analysis}")
         print(f"   Q&A:\n{qa_pairs}")
         
-        openai_client = OpenAI(api_key=settings.openai_api_key)
-        
-        # Prepare image for context
-        image_data = base64.b64decode(request.imageBase64)
-        image = Image.open(io.BytesIO(image_data))
-        if image.mode in ('RGBA', 'P', 'LA'):
-            image = image.convert('RGB')
-        max_size = 1024
-        if max(image.size) > max_size:
-            ratio = max_size / max(image.size)
-            new_size = (int(image.size[0] * ratio), int(image.size[1] * ratio))
-            image = image.resize(new_size, Image.Resampling.LANCZOS)
-        buffer = io.BytesIO()
-        image.save(buffer, format="PNG")
-        buffer.seek(0)
-        image_b64 = base64.b64encode(buffer.getvalue()).decode()
-        
-        response = openai_client.chat.completions.create(
+        # Prepare image for context (usually cached from /redpen/analyze)
+        prepared = await prepare_image_async(image, VISION_IMAGE_SPEC)
+        
+        content = await openai_service.chat_completion(
             model="gpt-4o",
             messages=[
                 {
@@ -724,7 +1028,7 @@ The prompt should tell the AI to remove the red pen marks and add the real eleme
                         },
                         {
                             "type": "image_url",
-                            "image_url": {"url": f"data:image/png;base64,{image_b64}"}
+                            "image_url": {"url": prepared.data_uri}
                         }
                     ]
                 }
@@ -732,7 +1036,6 @@ The prompt should tell the AI to remove the red pen marks and add the real eleme
             max_tokens=400
         )
         
-        content = response.choices[0].message.content
         print(f"   Raw response: {content}")
         
         if "```json" in content:
@@ -757,81 +1060,70 @@ The prompt should tell the AI to remove the red pen marks and add the real eleme
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/redpen/execute", response_model=RedPenExecuteResponse)
-async def execute_redpen(request: RedPenExecuteRequest):
+@router.post("/redpen/build-prompt/upload", response_model=RedPenBuildPromptResponse)
+async def build_redpen_prompt_upload(
+    image: UploadFile = File(...),
+    analysis: str = Form(...),
+    questions: list[str] = Form(...),
+    answers: list[str] = Form(...),
+):
+    """Step 2 with the image as a multipart file part (repeat questions / answers fields)."""
+    return await build_redpen_prompt(RedPenBuildPromptRequest(
+        imageBase64=await read_upload(image),
+        analysis=analysis,
+        questions=questions,
+        answers=answers,
+    ))
+
+
+@router.post("/redpen/execute", response_model=RedPenExecuteResponse, responses=IMAGE_RESPONSES)
+async def execute_redpen(request: RedPenExecuteRequest, response_format: Optional[str] = Depends(image_format)):
     """
     Two-step execution:
     1. First convert to architectural render (preserve scene/angle)
     2. Then apply the red pen changes
+    
+    Step 1 is cached by photo and prompt, and reuses a Flux /render of the
+    same photo, so further executions on it only pay for step 2. Step 2
+    starts from step 1's hosted output URL; only the final image is
+    downloaded on the critical path. Both latencies are reported (JSON
+    fields, X-* headers on binary responses).
     """
     print("=" * 60)
     print("🖊️ RED PEN EXECUTE - Two-Step Process")
     print("=" * 60)
     
+    image = await resolve_image(request.imageBase64, request.imageId)
+    
     if not settings.replicate_api_token:
         raise HTTPException(status_code=500, detail="Replicate API not configured")
     
     try:
-        # Decode image
-        image_data = base64.b64decode(request.imageBase64)
-        image = Image.open(io.BytesIO(image_data))
-        
-        if image.mode in ('RGBA', 'P', 'LA'):
-            image = image.convert('RGB')
-        
-        max_size = 1024
-        if max(image.size) > max_size:
-            ratio = max_size / max(image.size)
-            new_size = (int(image.size[0] * ratio), int(image.size[1] * ratio))
-            image = image.resize(new_size, Image.Resampling.LANCZOS)
-        
-        buffer = io.BytesIO()
-        image.save(buffer, format="PNG")
-        buffer.seek(0)
-        image_b64 = base64.b64encode(buffer.getvalue()).decode()
-        image_uri = f"data:image/png;base64,{image_b64}"
-        
         # === STEP 1: Convert to architectural render first ===
         print("🎨 Step 1: Converting to architectural render...")
         print("   (Preserving exact scene, angle, and composition)")
         
-        render_prompt = "Transform this photo into a clean professional architectural visualization render. Keep the EXACT same scene, camera angle, perspective, and all elements in their exact positions. Just change the style to a polished 3D architectural render with clean materials and professional lighting."
-        
-        render_output = run_with_retry(
-            "black-forest-labs/flux-kontext-pro",
-            {
-                "prompt": render_prompt,
-                "input_image": image_uri,
-                "aspect_ratio": "match_input_image",
-                "output_format": "png",
-                "safety_tolerance": 5,
-            }
-        )
-        
-        print("   ✅ Render conversion complete")
+        started = time.monotonic()
+        render_uri, reused = await redpen_base_render(image)
+        base_seconds = time.monotonic() - started
         
-        # Get the rendered image
-        if isinstance(render_output, list) and len(render_output) > 0:
-            render_url = str(render_output[0])
+        if reused:
+            print(f"   ♻️ Reused the base render of this photo ({base_seconds:.1f}s)")
         else:
-            render_url = str(render_output)
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.get(render_url)
-            render_bytes = response.content
-        
-        render_b64 = base64.b64encode(render_bytes).decode()
-        render_uri = f"data:image/png;base64,{render_b64}"
+            print(f"   ✅ Render conversion complete ({base_seconds:.1f}s)")
+        if not render_uri.startswith("data:"):
+            print(f"   Passing the hosted render to step 2: {render_uri[:60]}...")
         
         # === STEP 2: Apply the red pen changes ===
         print("🖊️ Step 2: Applying red pen changes...")
         print(f"   Changes: {request.confirmedPrompt[:80]}...")
         
         # Now apply changes to the RENDERED image
+        started = time.monotonic()
         change_prompt = f"{request.confirmedPrompt}. Keep everything else exactly the same. Maintain the professional architectural render style."
         
-        final_output = run_with_retry(
-            "black-forest-labs/flux-kontext-pro",
+        final_output = await run_with_retry(
+            FLUX_KONTEXT_MODEL,
             {
                 "prompt": change_prompt,
                 "input_image": render_uri,
@@ -848,20 +1140,24 @@ async def execute_redpen(request: RedPenExecuteRequest):
         else:
             final_url = str(final_output)
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(final_url)
-            final_bytes = response.content
-        
-        result_base64 = base64.b64encode(final_bytes).decode()
-        result_data_url = f"data:image/png;base64,{result_base64}"
+        final_bytes = await http_pool.download(final_url)
+        change_seconds = time.monotonic() - started
         
         print("=" * 60)
-        print("✅ RED PEN EXECUTION COMPLETE (2 steps)")
+        print(f"✅ RED PEN EXECUTION COMPLETE (2 steps) - base render {base_seconds:.1f}s"
+              f"{' (reused)' if reused else ''}, changes {change_seconds:.1f}s")
         print("=" * 60)
         
-        return RedPenExecuteResponse(
-            imageUrl=result_data_url,
-            imageBase64=result_base64
+        return await image_response(
+            ImageResult(data=final_bytes), response_format, RedPenExecuteResponse,
+            headers={
+                "X-Base-Render-Reused": str(reused).lower(),
+                "X-Base-Render-Seconds": f"{base_seconds:.2f}",
+                "X-Change-Seconds": f"{change_seconds:.2f}",
+            },
+            baseRenderReused=reused,
+            baseRenderSeconds=round(base_seconds, 2),
+            changeSeconds=round(change_seconds, 2),
         )
         
     except Exception as e:
@@ -869,3 +1165,16 @@ async def execute_redpen(request: RedPenExecuteRequest):
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/redpen/execute/upload", response_model=RedPenExecuteResponse, responses=IMAGE_RESPONSES)
+async def execute_redpen_upload(
+    image: UploadFile = File(...),
+    confirmedPrompt: str = Form(...),
+    response_format: Optional[str] = Depends(image_format),
+):
+    """Two-step red pen execution with the image as a multipart file part."""
+    return await execute_redpen(RedPenExecuteRequest(
+        imageBase64=await read_upload(image),
+        confirmedPrompt=confirmedPrompt,
+    ), response_format)
@@ -0,0 +1,116 @@
+"""
+Response negotiation for endpoints that return a generated image.
+
+JSON stays the default: the image is inlined as both `imageUrl` (data URL)
+and `imageBase64` (streamed, see routers.fast_json). Clients can opt into
+the raw image bytes instead, which is ~2.7x smaller:
+
+- `Accept: image/png` or `Accept: image/webp` (first listed wins; `*/*` and
+  `application/json` keep JSON)
+- or `?format=png` / `?format=webp` (`?format=json` forces JSON)
+
+Binary responses carry the image metadata in X-Image-* headers.
+
+Every result is also written to the image store: JSON responses include its
+`imageId` (binary ones an X-Image-Id header) for follow-up requests, and
+`?format=id` returns just the ID and an `imageUrl` pointing at
+GET /api/images/{id}, with no image payload at all. Only `?format=id` waits
+for the write; responses that carry the image store it in the background.
+"""
+from typing import Optional, Union
+from fastapi import HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from config import settings
+from services.cpu_pool import cpu_pool
+from routers.fast_json import image_json_response
+from routers.images import image_path, store_image, store_image_later
+from services.image_result import ImageResult, transcode
+
+BINARY_FORMATS = {"png": "image/png", "webp": "image/webp"}
+ID_FORMAT = "id"
+
+# OpenAPI: document the binary alternatives next to the JSON model
+IMAGE_RESPONSES = {
+    200: {
+        "content": {"image/png": {}, "image/webp": {}},
+        "description": (
+            "JSON by default; raw image bytes with Accept: image/png|image/webp or ?format=png|webp; "
+            "only the stored image ID with ?format=id"
+        ),
+    },
+}
+
+
+def image_format(
+    request: Request,
+    format: Optional[str] = Query(None, description="Response format: json (default), png, webp or id"),
+) -> Optional[str]:
+    """
+    Dependency: the requested binary mime type, ID_FORMAT, or None for JSON.
+    """
+    if format:
+        fmt = format.lower()
+        if fmt == "json":
+            return None
+        if fmt == ID_FORMAT:
+            return ID_FORMAT
+        if fmt not in BINARY_FORMATS:
+            raise HTTPException(status_code=400, detail=f"Unsupported format '{format}' (use json, png, webp or id)")
+        return BINARY_FORMATS[fmt]
+
+    for part in request.headers.get("accept", "").split(","):
+        media = part.split(";")[0].strip().lower()
+        if media in BINARY_FORMATS.values():
+            return media
+        if media in ("application/json", "*/*"):
+            return None
+    return None
+
+
+async def image_response(
+    result: ImageResult,
+    response_format: Optional[str],
+    model: type[BaseModel],
+    headers: Optional[dict[str, str]] = None,
+    **fields,
+) -> Union[BaseModel, Response]:
+    """
+    Store the result and build the endpoint response: the JSON model, the
+    stored ID, or the raw bytes when a binary format was negotiated.
+
+    Args:
+        result: The generated image
+        response_format: Output of the image_format dependency
+        model: JSON response model (with imageUrl / imageBase64 / imageId fields)
+        headers: Extra X-* metadata for binary responses
+        **fields: Extra JSON model fields
+    """
+    if response_format == ID_FORMAT:
+        # The ID is all the client gets, so it has to be stored before we answer
+        image_id = await store_image(result.data)
+        if image_id is None:
+            raise HTTPException(status_code=503, detail="Image store unavailable")
+        # Bypasses the response model, which requires the inline image
+        return JSONResponse({"imageId": image_id, "imageUrl": image_path(image_id), **fields})
+
+    image_id = store_image_later(result.data)
+    if response_format is None:
+        return image_json_response(result, model, imageId=image_id, **fields)
+
+    data = result.data
+    if response_format != result.mime_type:
+        data = await cpu_pool.run(transcode, data, response_format, settings.response_webp_quality)
+
+    width, height = result.size
+    return Response(
+        content=data,
+        media_type=response_format,
+        headers={
+            "X-Image-Width": str(width),
+            "X-Image-Height": str(height),
+            "X-Image-Id": image_id,
+            **(headers or {}),
+        },
+    )
@@ -0,0 +1,82 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+import base64
+
+from routers.fast_json import FastJSONRoute
+from routers.images import resolve_image, store_image
+from services.image_pipeline import ImageSource, source_bytes
+from services.segmentation import ClickPoint, DEFAULT_TOLERANCE, segment_image_async
+
+router = APIRouter(prefix="/api", tags=["segment"], route_class=FastJSONRoute)
+
+
+class SegmentPoint(BaseModel):
+    x: float = Field(..., description="Source image pixels")
+    y: float = Field(..., description="Source image pixels")
+    positive: bool = Field(True, description="False removes the region under this click")
+
+
+class SegmentRequest(BaseModel):
+    imageBase64: Optional[ImageSource] = Field(None, alias="imageBase64")
+    imageId: Optional[str] = Field(None, description="Stored image ID, in place of imageBase64")
+    points: list[SegmentPoint] = Field(..., min_length=1, max_length=50)
+    tolerance: float = Field(DEFAULT_TOLERANCE, gt=0, le=100, description="Lab colour distance from the clicked colour")
+    
+    class Config:
+        populate_by_name = True
+
+
+class MaskBounds(BaseModel):
+    x: int
+    y: int
+    width: int
+    height: int
+
+
+class SegmentResponse(BaseModel):
+    maskBase64: str = Field(..., description="1-bit PNG at image size, white = selected")
+    width: int
+    height: int
+    bounds: Optional[MaskBounds] = Field(None, description="Selected area; None if nothing was selected")
+    coverage: float = Field(..., description="Selected share of the image (0-1)")
+    imageId: Optional[str] = Field(None, description="Stored ID of the image, for the next click")
+
+
+@router.post("/segment", response_model=SegmentResponse)
+async def segment_image(request: SegmentRequest):
+    """
+    Click-to-mask: grow the regions under the clicked points into a mask.
+
+    Send the image inline on the first click and the returned imageId on
+    later ones; the colour conversion is cached per image, so repeat clicks
+    only cost the region growing.
+    """
+    image = await resolve_image(request.imageBase64, request.imageId)
+    data = source_bytes(image)
+    image_id = request.imageId or await store_image(data)
+
+    points = [ClickPoint(p.x, p.y, p.positive) for p in request.points]
+    if not any(p.positive for p in points):
+        raise HTTPException(status_code=400, detail="At least one positive point is required")
+
+    try:
+        result = await segment_image_async(data, points, request.tolerance)
+    except Exception as e:
+        print(f"❌ Segmentation error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    bounds = None
+    if result.bounds:
+        x, y, w, h = result.bounds
+        bounds = MaskBounds(x=x, y=y, width=w, height=h)
+
+    width, height = result.size
+    return SegmentResponse(
+        maskBase64=base64.b64encode(result.mask_png).decode(),
+        width=width,
+        height=height,
+        bounds=bounds,
+        coverage=result.coverage,
+        imageId=image_id,
+    )
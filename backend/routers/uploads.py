@@ -0,0 +1,41 @@
+"""
+Helpers for the multipart/form-data endpoint variants.
+
+Starlette spools each file part into a SpooledTemporaryFile while parsing the
+form (in memory up to 1 MB, then on disk), so uploads never exist as a base64
+string. The raw bytes go straight to the preprocessing pipeline, which hashes
+and decodes them like any other ImageSource.
+"""
+from typing import Optional
+from fastapi import HTTPException, UploadFile
+
+from config import settings
+
+
+async def read_upload(file: UploadFile, field: str = "image") -> bytes:
+    """Read one file part, enforcing the upload size limit"""
+    if file.size is not None and file.size > settings.max_upload_bytes:
+        raise HTTPException(
+            status_code=413,
+            detail=f"'{field}' is {file.size} bytes; limit is {settings.max_upload_bytes}",
+        )
+
+    data = await file.read()
+    await file.close()
+
+    if not data:
+        raise HTTPException(status_code=400, detail=f"'{field}' is empty")
+
+    return data
+
+
+async def read_optional_upload(file: Optional[UploadFile], field: str) -> Optional[bytes]:
+    if file is None:
+        return None
+    return await read_upload(file, field)
+
+
+async def read_uploads(files: Optional[list[UploadFile]], field: str) -> Optional[list[bytes]]:
+    if not files:
+        return None
+    return [await read_upload(f, f"{field}[{i}]") for i, f in enumerate(files)]
@@ -0,0 +1,247 @@
+"""
+Circuit breakers per provider / model, and health scores for routing.
+
+During a provider incident every call still ran its full retry schedule
+(three attempts, up to 10s apart) before failing. Each (provider, model) now
+keeps a rolling BREAKER_WINDOW_SECONDS window of outcomes:
+
+- failures are provider-side errors (5xx, timeouts, connection errors,
+  failed predictions) and calls slower than BREAKER_SLOW_CALL_SECONDS; bad
+  input, auth errors, 429s (the rate limiter's business) and predictions
+  rejected by a content filter or input check don't count
+- closed -> open once at least BREAKER_MIN_CALLS outcomes are in the window
+  and the failure share reaches BREAKER_ERROR_RATE
+- open: calls raise CircuitOpenError at once, without reaching the provider
+- after BREAKER_OPEN_SECONDS one probe call goes through (half-open); its
+  success closes the circuit with a fresh window, its failure reopens it
+
+health() scores a model for routing: 0 while open, otherwise its success
+share (blended with ROUTING_PRIOR_HEALTH while there are few recent calls,
+so an idle backend doesn't outrank a busy healthy one), discounted only when
+its median latency is above its own long-run baseline. A model that is slow
+by nature isn't demoted; one that errors, opens or slows down is. rank()
+orders the backends /render and /edit can use by that score.
+
+Usage:
+    async with circuit_breakers.get("openai", model).guard():
+        return await call()
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from config import settings
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Weight of each successful call in a breaker's long-run latency baseline
+BASELINE_WEIGHT = 0.05
+
+# Failed-prediction messages that blame the request, not the model (safety filters, bad input)
+REJECTED_PREDICTION_MARKERS = (
+    "nsfw", "safety", "sensitive", "flagged", "content policy", "moderation",
+    "invalid input", "input validation", "validation error",
+)
+
+
+class CircuitOpenError(Exception):
+    """A call refused without reaching the provider because its circuit is open"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable (circuit open, retry in {retry_after:.0f}s)")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def is_failure(error: BaseException) -> bool:
+    """Provider-side failures count against the circuit; the caller's mistakes don't"""
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    if isinstance(status, int) and 400 <= status < 500:
+        return status == 408
+    # Replicate ModelError: a finished prediction, with no status code to go by
+    prediction = getattr(error, "prediction", None)
+    if prediction is not None:
+        return is_failed_prediction(prediction)
+    return not isinstance(error, CircuitOpenError)
+
+
+def is_failed_prediction(prediction) -> bool:
+    """Did the model fail, rather than reject the input or get cancelled?"""
+    if getattr(prediction, "status", None) == "canceled":
+        return False
+    message = str(getattr(prediction, "error", None) or "").lower()
+    return not any(marker in message for marker in REJECTED_PREDICTION_MARKERS)
+
+
+class CircuitBreaker:
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self._outcomes: deque = deque()  # (finished at, ok, seconds)
+        self._opened_at = 0.0
+        self._probing = False
+        self.baseline: Optional[float] = None  # Long-run latency of successful calls (EWMA)
+        self.opens = 0
+        self.rejected = 0
+
+    def _trim(self, now: float) -> None:
+        cutoff = now - settings.breaker_window_seconds
+        while self._outcomes and self._outcomes[0][0] < cutoff:
+            self._outcomes.popleft()
+
+    def failure_rate(self) -> float:
+        self._trim(time.monotonic())
+        if not self._outcomes:
+            return 0.0
+        return sum(1 for _, ok, _ in self._outcomes if not ok) / len(self._outcomes)
+
+    def median_latency(self) -> Optional[float]:
+        latencies = sorted(seconds for _, ok, seconds in self._outcomes if ok)
+        return latencies[len(latencies) // 2] if latencies else None
+
+    def retry_after(self) -> float:
+        return max(0.0, self._opened_at + settings.breaker_open_seconds - time.monotonic())
+
+    def available(self) -> bool:
+        """Would a call be let through now (closed, or open long enough for a probe)?"""
+        if not settings.breaker_enabled or self.state == CLOSED:
+            return True
+        return not self._probing and self.retry_after() == 0
+
+    def health(self) -> float:
+        """0 (open) to 1 (no failures, median latency at or under its baseline)"""
+        if not self.available():
+            return 0.0
+        self._trim(time.monotonic())
+        # Prior as BREAKER_MIN_CALLS pseudo-calls: no data scores the prior, not a perfect 1
+        prior = settings.routing_prior_health * settings.breaker_min_calls
+        successes = sum(1 for _, ok, _ in self._outcomes if ok)
+        score = (successes + prior) / (len(self._outcomes) + settings.breaker_min_calls)
+        latency = self.median_latency()
+        if latency and self.baseline:
+            score *= min(1.0, self.baseline / latency)
+        return score
+
+    def _admit(self) -> bool:
+        """Let a call through or raise CircuitOpenError; True if it is the half-open probe"""
+        if not settings.breaker_enabled or self.state == CLOSED:
+            return False
+        if not self.available():
+            self.rejected += 1
+            raise CircuitOpenError(self.name, self.retry_after() or settings.breaker_open_seconds)
+        self.state = HALF_OPEN
+        self._probing = True
+        print(f"🔌 {self.name}: circuit half-open, probing")
+        return True
+
+    def _open(self, now: float) -> None:
+        self.state = OPEN
+        self._opened_at = now
+        self.opens += 1
+        print(f"🔌 {self.name}: circuit open for {settings.breaker_open_seconds:.0f}s "
+              f"({self.failure_rate():.0%} of {len(self._outcomes)} calls failed)")
+
+    def record(self, ok: bool, seconds: float, probe: bool = False) -> None:
+        now = time.monotonic()
+        ok = ok and seconds < settings.breaker_slow_call_seconds
+        if probe:
+            self._probing = False
+            if ok:
+                self.state = CLOSED
+                self._outcomes.clear()
+                print(f"🔌 {self.name}: circuit closed")
+            else:
+                self._open(now)
+            return
+        self._outcomes.append((now, ok, seconds))
+        self._trim(now)
+        if ok:
+            self.baseline = seconds if self.baseline is None else (
+                self.baseline + BASELINE_WEIGHT * (seconds - self.baseline))
+        if (self.state == CLOSED and len(self._outcomes) >= settings.breaker_min_calls
+                and self.failure_rate() >= settings.breaker_error_rate):
+            self._open(now)
+
+    @asynccontextmanager
+    async def guard(self) -> AsyncIterator[None]:
+        """Fail fast while open; otherwise run the call and record how it went"""
+        probe = self._admit()
+        started = time.monotonic()
+        try:
+            yield
+        except asyncio.CancelledError:
+            # Says nothing about the provider; free the probe for the next call
+            if probe:
+                self._probing = False
+            raise
+        except Exception as e:
+            if is_failure(e):
+                self.record(False, time.monotonic() - started, probe)
+            elif probe:
+                self._probing = False
+            raise
+        self.record(True, time.monotonic() - started, probe)
+
+    def stats(self) -> dict:
+        latency = self.median_latency()
+        return {
+            "state": self.state,
+            "calls": len(self._outcomes),
+            "failure_rate": round(self.failure_rate(), 2),
+            "p50_s": round(latency, 1) if latency is not None else None,
+            "baseline_s": round(self.baseline, 1) if self.baseline is not None else None,
+            "health": round(self.health(), 2),
+            "opens": self.opens,
+            "rejected": self.rejected,
+        }
+
+
+class CircuitBreakers:
+    """Breakers by (provider, model), created on first use"""
+
+    def __init__(self):
+        self._breakers: dict[tuple[str, str], CircuitBreaker] = {}
+
+    def get(self, provider: str, model: str) -> CircuitBreaker:
+        key = (provider, model)
+        if key not in self._breakers:
+            self._breakers[key] = CircuitBreaker(f"{provider}/{model}")
+        return self._breakers[key]
+
+    def rank(self, backends: list[tuple[str, str]]) -> list[tuple[str, str]]:
+        """
+        (provider, model) backends, given in order of preference, ordered for
+        routing: backends within ROUTING_HEALTH_MARGIN of the healthiest keep
+        their preference order, then the rest by health. Open circuits are
+        left out; if every circuit is open, raises CircuitOpenError for the
+        one that reopens first.
+        """
+        if not backends:
+            return []
+        scores = {backend: self.get(*backend).health() for backend in backends}
+        available = [backend for backend in backends if self.get(*backend).available()]
+        if not available:
+            soonest = min(backends, key=lambda backend: self.get(*backend).retry_after())
+            breaker = self.get(*soonest)
+            raise CircuitOpenError(breaker.name, breaker.retry_after())
+        best = max(scores[backend] for backend in available)
+        preferred = [b for b in available if scores[b] >= best - settings.routing_health_margin]
+        rest = sorted((b for b in available if b not in preferred), key=lambda b: -scores[b])
+        return preferred + rest
+
+    def stats(self) -> dict:
+        return {breaker.name: breaker.stats() for breaker in self._breakers.values()}
+
+
+def retry_after_header(error: CircuitOpenError) -> dict:
+    """Retry-After header for a 503 caused by an open circuit"""
+    return {"Retry-After": str(max(1, math.ceil(error.retry_after)))}
+
+
+# Singleton instance
+circuit_breakers = CircuitBreakers()
@@ -0,0 +1,129 @@
+"""
+Bounded worker pool for CPU-bound image work.
+
+Pillow / NumPy transforms (decode, resize, encode, mask prep) run here instead
+of inline in async handlers, where they stall the event loop, or in the
+default executor, where they compete with blocking network calls. At most
+`workers` jobs run at once; the rest wait on the event loop, which is where
+queue depth and wait time are measured.
+"""
+import asyncio
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from config import settings
+
+
+def _timed_call(fn: Callable, args: tuple, kwargs: dict) -> tuple[float, Any]:
+    """Runs in the worker; reports when the job actually started"""
+    started = time.time()
+    return started, fn(*args, **kwargs)
+
+
+def _summary(samples: deque) -> dict:
+    """avg / p95 / max of a window of millisecond samples"""
+    if not samples:
+        return {"avg": 0.0, "p95": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+    return {
+        "avg": round(sum(ordered) / len(ordered), 2),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+        "max": round(ordered[-1], 2),
+    }
+
+
+class CPUPool:
+    """
+    Threads are the default: Pillow and NumPy release the GIL in their hot
+    loops, so a thread pool scales across cores without pickling images. Use
+    "process" when the work is GIL-bound; callables and arguments must then
+    be picklable (module-level functions, bytes, dataclasses).
+    """
+
+    def __init__(self, kind: str = "thread", workers: int = 0):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown CPU pool kind: {kind!r} (expected 'thread' or 'process')")
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 1
+        self._executor: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._slots_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self._wait_ms: deque = deque(maxlen=1024)
+        self._run_ms: deque = deque(maxlen=1024)
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                # spawn, not fork: the server process already has threads running
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix="cpu-pool",
+                )
+        return self._executor
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) on the pool and await the result"""
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        if self._slots is None or self._slots_loop is not loop:
+            # A semaphore with waiters is bound to its loop; a new loop (TestClient, asyncio.run) needs its own
+            self._slots = asyncio.Semaphore(self.workers)
+            self._slots_loop = loop
+
+        submitted = time.time()
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+
+        self.active += 1
+        try:
+            started, result = await loop.run_in_executor(executor, _timed_call, fn, args, kwargs)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.active -= 1
+            self._slots.release()
+
+        self.completed += 1
+        self._wait_ms.append((started - submitted) * 1000)
+        self._run_ms.append((time.time() - started) * 1000)
+        return result
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._slots = None
+        self._slots_loop = None
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "queued": self.queued,
+            "active": self.active,
+            "completed": self.completed,
+            "failed": self.failed,
+            "wait_ms": _summary(self._wait_ms),
+            "run_ms": _summary(self._run_ms),
+        }
+
+
+# Singleton instance
+cpu_pool = CPUPool(settings.cpu_pool_kind, settings.cpu_pool_workers)
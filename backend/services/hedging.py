@@ -0,0 +1,146 @@
+"""
+Hedged generations across OpenAI and Replicate.
+
+Provider latency has a long tail: gpt-image p99 is several times its p50
+and Flux Kontext has cold starts. With HEDGE_ENABLED, /render and /edit
+start the configured provider as usual; if it hasn't answered after the
+hedge delay, the same generation starts on the other provider and whichever
+finishes first wins. A primary that fails before the delay starts the other
+provider at once. The loser is cancelled (its Replicate prediction is
+cancelled too, see replicate_service.wait_for_prediction; cached generations
+are cancelled once their last waiter is, see result_cache).
+
+The delay is the HEDGE_PERCENTILE latency of the primary provider on that
+endpoint, from recent completions; until HEDGE_MIN_SAMPLES are in, it is
+HEDGE_DEFAULT_DELAY. Hedges are capped at HEDGE_MAX_RATIO of requests so a
+provider-wide slowdown can't double the load on both.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from config import settings
+from services import progress
+
+T = TypeVar("T")
+
+# (provider name, coroutine factory) - e.g. ("openai", lambda: openai_service.render_image(...))
+Attempt = tuple[str, Callable[[], Awaitable[T]]]
+
+
+class LatencyWindow:
+    """Recent latencies (seconds) of one provider on one endpoint"""
+
+    def __init__(self, size: int = 256):
+        self._samples: deque = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Hedger:
+    def __init__(self):
+        self._latency: dict[tuple[str, str], LatencyWindow] = {}
+        self.requests = 0
+        self.hedged = 0
+        self.wins: dict[str, int] = {}
+
+    def latency(self, endpoint: str, provider: str) -> LatencyWindow:
+        key = (endpoint, provider)
+        if key not in self._latency:
+            self._latency[key] = LatencyWindow()
+        return self._latency[key]
+
+    def delay(self, endpoint: str, provider: str) -> float:
+        """Seconds to give the primary before hedging"""
+        window = self.latency(endpoint, provider)
+        if len(window) < settings.hedge_min_samples:
+            return settings.hedge_default_delay
+        return max(settings.hedge_min_delay, window.percentile(settings.hedge_percentile))
+
+    def _may_hedge(self) -> bool:
+        return self.hedged < settings.hedge_max_ratio * self.requests
+
+    async def _timed(self, endpoint: str, provider: str, create: Callable[[], Awaitable[T]]) -> T:
+        started = time.monotonic()
+        # Stage events and partial frames from both attempts share the stream; tag them
+        with progress.tagged(provider=provider):
+            try:
+                result = await create()
+            except asyncio.CancelledError:
+                # The loser's elapsed time is a lower bound on its latency; dropping it
+                # would hide exactly the tail the delay is meant to track
+                self.latency(endpoint, provider).add(time.monotonic() - started)
+                raise
+        self.latency(endpoint, provider).add(time.monotonic() - started)
+        return result
+
+    async def run(self, endpoint: str, primary: Attempt, backup: Attempt) -> T:
+        """Run primary; start backup after the hedge delay (or at once if primary fails); first success wins"""
+        self.requests += 1
+        primary_name, _ = primary
+        delay = self.delay(endpoint, primary_name)
+        tasks: dict[asyncio.Task, str] = {
+            asyncio.ensure_future(self._timed(endpoint, *primary)): primary_name,
+        }
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            failed = bool(done) and next(iter(done)).exception() is not None
+            if (not done or failed) and self._may_hedge():
+                backup_name, _ = backup
+                self.hedged += 1
+                if failed:
+                    print(f"🪁 {endpoint}: {primary_name} failed early, failing over to {backup_name}")
+                else:
+                    print(f"🪁 {endpoint}: {primary_name} slower than {delay:.1f}s, hedging on {backup_name}")
+                progress.report("hedging", provider=backup_name, after=round(delay, 1), failed=failed)
+                tasks[asyncio.ensure_future(self._timed(endpoint, *backup))] = backup_name
+
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = tasks[task]
+                        self.wins[winner] = self.wins.get(winner, 0) + 1
+                        if len(tasks) > 1:
+                            print(f"🏁 {endpoint}: {winner} won the hedge")
+                        return task.result()
+                    # A failed attempt loses; wait for the other before giving up
+                    print(f"⚠️ {endpoint}: {tasks[task]} attempt failed: {task.exception()}")
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "wins": dict(self.wins),
+            "delay_s": {
+                f"{endpoint}/{provider}": round(self.delay(endpoint, provider), 1)
+                for endpoint, provider in self._latency
+            },
+            "p50_s": {
+                f"{endpoint}/{provider}": round(window.percentile(50), 1)
+                for (endpoint, provider), window in self._latency.items() if len(window)
+            },
+        }
+
+
+# Singleton instance
+hedger = Hedger()
@@ -0,0 +1,154 @@
+"""
+Process-wide pooled HTTP client for provider result downloads.
+
+Generated images are fetched from a handful of CDN hosts (OpenAI blob
+storage, replicate.delivery). A client per download pays a TCP + TLS
+handshake every time and, without a timeout, can hang a request on a
+stalled CDN. One long-lived httpx.AsyncClient keeps connections alive
+between downloads, multiplexes them over HTTP/2 when `h2` is installed, and
+bounds every phase with a timeout.
+
+The client is opened in the app lifespan and closed on shutdown.
+
+Per-host metrics count requests, failures, bytes, latency and how many new
+connections / TLS handshakes were needed (the reuse the pool buys).
+"""
+import asyncio
+import time
+from collections import defaultdict, deque
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from config import settings
+from services import progress
+
+
+class DownloadError(Exception):
+    """A result download failed after all retries"""
+
+
+def _has_h2() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class HostStats:
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.bytes = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+        self.http_versions: dict[str, int] = defaultdict(int)
+        self._ms: deque = deque(maxlen=256)
+
+    def as_dict(self) -> dict:
+        ordered = sorted(self._ms)
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "bytes": self.bytes,
+            "connections_opened": self.connections_opened,
+            "tls_handshakes": self.tls_handshakes,
+            "http_versions": dict(self.http_versions),
+            "avg_ms": round(sum(ordered) / len(ordered), 1) if ordered else 0.0,
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1) if ordered else 0.0,
+        }
+
+
+class HTTPClientPool:
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._hosts: dict[str, HostStats] = defaultdict(HostStats)
+        self.http2 = False
+
+    async def start(self) -> None:
+        """Open the client (lifespan startup); idempotent"""
+        if self._client is not None:
+            return
+        self.http2 = settings.http_http2 and _has_h2()
+        if settings.http_http2 and not self.http2:
+            print("⚠️ HTTP/2 requested but h2 is not installed (pip install 'httpx[http2]'); using HTTP/1.1")
+        self._client = httpx.AsyncClient(
+            http2=self.http2,
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=settings.http_max_connections,
+                max_keepalive_connections=settings.http_max_keepalive_connections,
+                keepalive_expiry=settings.http_keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(
+                connect=settings.http_connect_timeout,
+                read=settings.http_read_timeout,
+                write=settings.http_read_timeout,
+                pool=settings.http_pool_timeout,
+            ),
+        )
+
+    async def aclose(self) -> None:
+        """Close pooled connections (lifespan shutdown)"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def client(self) -> httpx.AsyncClient:
+        # Scripts and benchmarks run without the app lifespan
+        if self._client is None:
+            await self.start()
+        return self._client
+
+    def _trace(self, stats: HostStats):
+        async def trace(event: str, info: dict) -> None:
+            if event == "connection.connect_tcp.complete":
+                stats.connections_opened += 1
+            elif event == "connection.start_tls.complete":
+                stats.tls_handshakes += 1
+        return trace
+
+    async def download(self, url: str) -> bytes:
+        """GET url through the pool, retrying timeouts, transport errors and 5xx"""
+        client = await self.client()
+        host = urlsplit(url).netloc or "unknown"
+        stats = self._hosts[host]
+        attempts = max(1, settings.http_download_retries)
+        progress.report("downloading", host=host)
+
+        for attempt in range(1, attempts + 1):
+            started = time.perf_counter()
+            stats.requests += 1
+            try:
+                response = await client.get(url, extensions={"trace": self._trace(stats)})
+                response.raise_for_status()
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                stats.failures += 1
+                reason = f"{type(e).__name__}: {e}"
+                retryable = not isinstance(e, httpx.HTTPStatusError) or e.response.status_code >= 500
+                if not retryable or attempt == attempts:
+                    raise DownloadError(f"Download from {host} failed after {attempt} attempt(s): {reason}") from e
+                print(f"   Download attempt {attempt} from {host} failed ({reason}), retrying...")
+                await asyncio.sleep(attempt)
+                continue
+
+            stats.bytes += len(response.content)
+            stats.http_versions[response.http_version] += 1
+            stats._ms.append((time.perf_counter() - started) * 1000)
+            return response.content
+
+    def stats(self) -> dict:
+        pool = getattr(self._client._transport, "_pool", None) if self._client else None
+        connections = list(getattr(pool, "connections", []))
+        return {
+            "http2": self.http2,
+            "open_connections": len(connections),
+            "idle_connections": sum(1 for c in connections if c.is_idle()),
+            "hosts": {host: stats.as_dict() for host, stats in self._hosts.items()},
+        }
+
+
+# Singleton instance
+http_pool = HTTPClientPool()
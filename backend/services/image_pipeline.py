@@ -0,0 +1,433 @@
+"""
+Shared image preprocessing pipeline.
+
+Every provider call needs the upload decoded, converted, downscaled and
+re-encoded before it goes over the wire. Prepared variants are cached by
+(source content hash, target spec), so the 2048px RGBA PNG for OpenAI, the
+1024px JPEG for Replicate and the 1024px PNG for Flux / GPT-4o vision are
+each built once per upload instead of once per request.
+
+Adaptive specs also pick the codec from the content: flat line art (plans,
+sketches) goes out as palette or greyscale PNG, photos as JPEG / WebP.
+"""
+import asyncio
+import base64
+import hashlib
+import io
+import random
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from enum import Enum
+from functools import cached_property
+from typing import Optional, Union
+
+import numpy as np
+from PIL import Image
+
+from config import settings
+from services.cpu_pool import cpu_pool
+
+
+# Base64 string (JSON bodies) or raw bytes (multipart uploads)
+ImageSource = Union[str, bytes]
+
+MIME_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+EXTENSIONS = {"image/png": "png", "image/jpeg": "jpg", "image/webp": "webp"}
+
+
+class ContentKind(str, Enum):
+    """What an upload looks like, for codec selection"""
+    LINE_ART = "line_art"  # Plans, sketches, elevations: few flat colours
+    PHOTO = "photo"        # Photos and renders: continuous tone
+
+
+@dataclass(frozen=True)
+class ImageSpec:
+    """Target format for a prepared image variant"""
+    max_size: int             # Longest side in pixels
+    mode: str                 # PIL mode, e.g. "RGB" or "RGBA"
+    format: str               # PIL format name, e.g. "PNG" or "JPEG"
+    quality: int = 95         # Only used for lossy formats
+    adaptive: bool = False    # Choose codec from content; mode/format become the fallback
+    photo_format: str = "JPEG"  # Adaptive: codec for photographic content
+    compress_level: int = 6   # Adaptive: zlib level for line-art PNGs (9 is ~8x slower for ~3%)
+    name: str = field(default="", compare=False)  # Label for codec stats
+
+    @property
+    def mime_type(self) -> str:
+        return MIME_TYPES[self.format]
+
+
+# Variants used by the providers
+OPENAI_IMAGE_SPEC = ImageSpec(   # gpt-image images.edit input
+    max_size=2048, mode="RGBA", format="PNG",
+    adaptive=True, photo_format="JPEG", quality=95, name="openai",
+)
+DALLE_IMAGE_SPEC = ImageSpec(    # dall-e-2 only accepts RGBA PNG
+    max_size=2048, mode="RGBA", format="PNG", name="dall-e-2",
+)
+REPLICATE_IMAGE_SPEC = ImageSpec(  # SDXL / ControlNet
+    max_size=1024, mode="RGB", format="JPEG",
+    adaptive=True, photo_format="JPEG", quality=95, name="replicate",
+)
+FLUX_IMAGE_SPEC = ImageSpec(     # Flux Kontext / Fill
+    max_size=1024, mode="RGB", format="PNG",
+    adaptive=True, photo_format="WEBP", quality=90, name="flux",
+)
+VISION_IMAGE_SPEC = ImageSpec(   # GPT-4o vision
+    max_size=1024, mode="RGB", format="PNG",
+    adaptive=True, photo_format="JPEG", quality=90, name="vision",
+)
+
+
+@dataclass
+class PreparedImage:
+    """An encoded image ready to send to a provider"""
+    data: bytes
+    size: tuple[int, int]
+    mime_type: str
+    codec: str = ""                       # e.g. "PNG/P", "JPEG/RGB"
+    content: Optional[str] = None         # ContentKind value for adaptive specs
+    encode_ms: float = 0.0
+    baseline_bytes: Optional[int] = None  # Fixed-codec size, when sampled
+
+    @property
+    def extension(self) -> str:
+        return EXTENSIONS[self.mime_type]
+
+    @cached_property
+    def base64(self) -> str:
+        return base64.b64encode(self.data).decode()
+
+    @property
+    def data_uri(self) -> str:
+        return f"data:{self.mime_type};base64,{self.base64}"
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory footprint (raw bytes plus their base64 form)"""
+        return len(self.data) + 4 * ((len(self.data) + 2) // 3)
+
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 hex digest of the source bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class PreparedImageCache:
+    """
+    Thread-safe LRU of prepared variants, bounded by total bytes rather than
+    entry count (a 2048px PNG is ~50x bigger than a 1024px JPEG).
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple, PreparedImage] = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> Optional[PreparedImage]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: tuple, value: PreparedImage) -> None:
+        size = value.nbytes
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old.nbytes
+            self._entries[key] = value
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
+
+
+# Staged reduction factor: JPEG draft decoding and Image.reduce() shrink by
+# integer factors down to this multiple of the target, LANCZOS does the rest.
+REDUCING_GAP = 2.0
+
+# Modes Pillow can resample with LANCZOS directly
+_RESAMPLE_MODES = ("RGB", "RGBA", "L", "LA")
+
+
+def _target_size(size: tuple[int, int], max_size: int) -> tuple[int, int]:
+    """Fit size within max_size on the longest side (keep aspect ratio)"""
+    ratio = max_size / max(size)
+    return (max(1, int(size[0] * ratio)), max(1, int(size[1] * ratio)))
+
+
+def load_image(data: bytes, spec: ImageSpec) -> Image.Image:
+    """
+    Decode and downscale image bytes to the target spec.
+
+    Large JPEGs (drone / DSLR photos, 6000px+) are decoded in draft mode so
+    libjpeg scales by 1/2, 1/4 or 1/8 during the IDCT, and the remaining
+    reduction is staged through Image.reduce() before the final LANCZOS pass.
+    The full-resolution bitmap is never materialized.
+    """
+    image = Image.open(io.BytesIO(data))
+
+    if max(image.size) > spec.max_size and image.format == "JPEG":
+        target = _target_size(image.size, spec.max_size)
+        image.draft(spec.mode, (int(target[0] * REDUCING_GAP), int(target[1] * REDUCING_GAP)))
+
+    # Palette / bilevel / 16-bit images can't be resampled directly
+    if image.mode not in _RESAMPLE_MODES:
+        image = image.convert(spec.mode)
+
+    # Resize before converting so RGB -> RGBA happens on the small image
+    if max(image.size) > spec.max_size:
+        new_size = _target_size(image.size, spec.max_size)
+        image = image.resize(new_size, Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+
+    if image.mode != spec.mode:
+        image = image.convert(spec.mode)
+
+    return image
+
+
+def classify_content(image: Image.Image) -> tuple[ContentKind, bool]:
+    """
+    Classify an image as line art or photo, and whether it is greyscale.
+
+    Works on a 256px thumbnail: line art concentrates almost all pixels in a
+    handful of coarse colour bins with one dominant background colour, while
+    photos and renders spread across hundreds of bins.
+    """
+    thumb = image.convert("RGB")
+    thumb.thumbnail((256, 256))
+    arr = np.asarray(thumb)
+
+    chroma = arr.max(axis=2) - arr.min(axis=2)
+    greyscale = bool(np.count_nonzero(chroma <= 12) >= 0.98 * chroma.size)
+
+    # 4 bits per channel -> 4096 bins
+    coarse = arr >> 4
+    codes = (coarse[..., 0].astype(np.uint16) << 8) | (coarse[..., 1].astype(np.uint16) << 4) | coarse[..., 2]
+    counts = np.sort(np.bincount(codes.ravel(), minlength=4096))[::-1]
+    total = codes.size
+
+    is_line_art = counts[:32].sum() >= 0.85 * total and counts[0] >= 0.2 * total
+    return (ContentKind.LINE_ART if is_line_art else ContentKind.PHOTO), greyscale
+
+
+def _save(image: Image.Image, format: str, **params) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **params)
+    return buffer.getvalue()
+
+
+def _encode_fixed(image: Image.Image, spec: ImageSpec) -> bytes:
+    """Encode with the spec's fixed codec"""
+    if spec.format in ("JPEG", "WEBP"):
+        return _save(image, spec.format, quality=spec.quality)
+    return _save(image, spec.format)
+
+
+def _encode_adaptive(image: Image.Image, spec: ImageSpec) -> tuple[bytes, str, str, Optional[ContentKind]]:
+    """
+    Pick the codec from the content.
+
+    Returns (data, format, codec label, content kind)
+    """
+    # Real transparency has to survive, so keep the lossless fallback
+    if image.mode in ("RGBA", "LA") and image.getextrema()[-1][0] < 255:
+        return _encode_fixed(image, spec), spec.format, f"{spec.format}/{image.mode}", None
+
+    kind, greyscale = classify_content(image)
+
+    if kind == ContentKind.LINE_ART:
+        if greyscale:
+            flat = image.convert("L")
+        else:
+            # Octree is ~20x faster than median cut here; no dithering keeps
+            # flat fills flat, which is what makes the PNG small
+            flat = image.convert("RGB").quantize(
+                colors=256, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE,
+            )
+        data = _save(flat, "PNG", compress_level=spec.compress_level)
+        return data, "PNG", f"PNG/{flat.mode}", kind
+
+    photo = image.convert("RGB")
+    if spec.photo_format == "WEBP":
+        data = _save(photo, "WEBP", quality=spec.quality, method=4)
+    else:
+        data = _save(photo, spec.photo_format, quality=spec.quality)
+    return data, spec.photo_format, f"{spec.photo_format}/RGB", kind
+
+
+class CodecStats:
+    """
+    Per-spec, per-codec output sizes and encode times. A sample of adaptive
+    encodes is also encoded with the fixed codec to measure bytes saved.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: dict[tuple[str, str], dict] = {}
+
+    def record(self, spec: ImageSpec, prepared: PreparedImage) -> None:
+        with self._lock:
+            entry = self._stats.setdefault((spec.name or "unnamed", prepared.codec), {
+                "variants": 0, "bytes": 0, "encode_ms": 0.0,
+                "sampled": 0, "sampled_bytes": 0, "baseline_bytes": 0,
+            })
+            entry["variants"] += 1
+            entry["bytes"] += len(prepared.data)
+            entry["encode_ms"] += prepared.encode_ms
+            if prepared.baseline_bytes is not None:
+                entry["sampled"] += 1
+                entry["sampled_bytes"] += len(prepared.data)
+                entry["baseline_bytes"] += prepared.baseline_bytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            result: dict[str, dict] = {}
+            for (name, codec), entry in self._stats.items():
+                saved = entry["baseline_bytes"] - entry["sampled_bytes"]
+                result.setdefault(name, {})[codec] = {
+                    "variants": entry["variants"],
+                    "bytes": entry["bytes"],
+                    "avg_encode_ms": round(entry["encode_ms"] / entry["variants"], 2),
+                    "sampled": entry["sampled"],
+                    "sampled_bytes_saved": saved,
+                    "saved_ratio": round(saved / entry["baseline_bytes"], 3) if entry["baseline_bytes"] else None,
+                }
+            return result
+
+
+def _build_variant(data: bytes, spec: ImageSpec, sample_baseline: bool = False) -> PreparedImage:
+    """Decode, downscale and encode one variant (runs on the CPU pool)"""
+    start_time = time.time()
+    image = load_image(data, spec)
+
+    encode_start = time.time()
+    if spec.adaptive:
+        encoded, format, codec, kind = _encode_adaptive(image, spec)
+    else:
+        encoded, format, codec, kind = _encode_fixed(image, spec), spec.format, f"{spec.format}/{image.mode}", None
+    encode_ms = (time.time() - encode_start) * 1000
+
+    baseline_bytes = None
+    if spec.adaptive and sample_baseline:
+        baseline_bytes = len(_encode_fixed(image, spec))
+
+    prepared = PreparedImage(
+        data=encoded,
+        size=image.size,
+        mime_type=MIME_TYPES[format],
+        codec=codec,
+        content=kind.value if kind else None,
+        encode_ms=encode_ms,
+        baseline_bytes=baseline_bytes,
+    )
+
+    elapsed = time.time() - start_time
+    print(f"   Prepared {image.size[0]}x{image.size[1]} {codec}{f' ({kind.value})' if kind else ''} "
+          f"{len(encoded) / 1024:.0f}KB in {elapsed*1000:.1f}ms (encode {encode_ms:.1f}ms)")
+
+    return prepared
+
+
+def _sample_baseline() -> bool:
+    return random.random() < settings.codec_baseline_sample_rate
+
+
+def source_bytes(source: ImageSource) -> bytes:
+    """Raw image bytes from a base64 string or bytes"""
+    return base64.b64decode(source) if isinstance(source, str) else source
+
+
+def _source_key(source: ImageSource, spec: ImageSpec) -> tuple[bytes, tuple]:
+    data = source_bytes(source)
+    return data, (content_hash(data), spec)
+
+
+def prepare_image(source: ImageSource, spec: ImageSpec) -> PreparedImage:
+    """
+    Prepare an image for a provider, reusing a cached variant when the same
+    source has already been prepared for this spec.
+
+    Args:
+        source: Base64 string or raw image bytes
+        spec: Target size, mode and codec
+    """
+    data, key = _source_key(source, spec)
+    cached = image_cache.get(key)
+    if cached is not None:
+        return cached
+
+    prepared = _build_variant(data, spec, _sample_baseline())
+    codec_stats.record(spec, prepared)
+    image_cache.put(key, prepared)
+    return prepared
+
+
+async def _build_variant_async(data: bytes, spec: ImageSpec, key: tuple) -> PreparedImage:
+    prepared = await cpu_pool.run(_build_variant, data, spec, _sample_baseline())
+    codec_stats.record(spec, prepared)
+    image_cache.put(key, prepared)
+    return prepared
+
+
+def _build_finished(key: tuple, task: asyncio.Task) -> None:
+    _inflight.pop(key, None)
+    # Every waiter may have gone away; don't leave the error unretrieved
+    if not task.cancelled():
+        task.exception()
+
+
+async def prepare_image_async(source: ImageSource, spec: ImageSpec) -> PreparedImage:
+    """
+    prepare_image() for async handlers: cache misses are built on the CPU
+    pool, once - concurrent requests for the same variant wait for the
+    build already running.
+    """
+    data, key = _source_key(source, spec)
+    cached = image_cache.get(key)
+    if cached is not None:
+        return cached
+
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_build_variant_async(data, spec, key))
+        _inflight[key] = task
+        task.add_done_callback(lambda done: _build_finished(key, done))
+    # Shielded: one caller going away doesn't fail the build for the others
+    return await asyncio.shield(task)
+
+
+# Singleton instances
+image_cache = PreparedImageCache(settings.image_cache_max_bytes)
+_inflight: dict[tuple, asyncio.Task] = {}  # Variant builds in progress, keyed like image_cache
+codec_stats = CodecStats()
@@ -0,0 +1,84 @@
+"""
+Generated image results.
+
+Providers hand back either base64 (OpenAI b64_json) or raw bytes (downloads
+from a result URL). ImageResult keeps whichever form it was given and only
+converts on demand, so binary responses never build the base64 / data URL
+strings and JSON responses build each of them once.
+"""
+import base64
+import binascii
+import io
+from typing import Iterator, Optional
+
+from PIL import Image
+
+
+class ImageResult:
+    """A generated image in whatever form the provider returned it"""
+
+    def __init__(
+        self,
+        data: Optional[bytes] = None,
+        base64_data: Optional[str] = None,
+        mime_type: str = "image/png",
+    ):
+        if data is None and base64_data is None:
+            raise ValueError("ImageResult needs bytes or base64 data")
+        self._data = data
+        self._base64 = base64_data
+        self.mime_type = mime_type
+
+    @property
+    def data(self) -> bytes:
+        if self._data is None:
+            self._data = base64.b64decode(self._base64)
+        return self._data
+
+    @property
+    def base64(self) -> str:
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self._data).decode()
+        return self._base64
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.base64}"
+
+    @property
+    def base64_length(self) -> int:
+        if self._base64 is not None:
+            return len(self._base64)
+        return (len(self._data) + 2) // 3 * 4
+
+    def iter_base64(self, chunk_bytes: int = 3 * 256 * 1024) -> Iterator[bytes]:
+        """
+        The base64 form as ASCII chunks, encoding at most chunk_bytes of image
+        per step (rounded to a multiple of 3 so chunks concatenate cleanly).
+        """
+        chunk_bytes = max(3, chunk_bytes - chunk_bytes % 3)
+        if self._base64 is not None:
+            chunk_chars = chunk_bytes // 3 * 4
+            for start in range(0, len(self._base64), chunk_chars):
+                yield self._base64[start:start + chunk_chars].encode("ascii")
+            return
+        view = memoryview(self._data)
+        for start in range(0, len(view), chunk_bytes):
+            yield binascii.b2a_base64(view[start:start + chunk_bytes], newline=False)
+
+    @property
+    def size(self) -> tuple[int, int]:
+        """(width, height) from the image header, without decoding pixels"""
+        with Image.open(io.BytesIO(self.data)) as image:
+            return image.size
+
+
+def transcode(data: bytes, mime_type: str, quality: int = 90) -> bytes:
+    """Re-encode result bytes for a binary response (runs on the CPU pool)"""
+    image = Image.open(io.BytesIO(data))
+    buffer = io.BytesIO()
+    if mime_type == "image/webp":
+        image.save(buffer, format="WEBP", quality=quality, method=4)
+    else:
+        image.save(buffer, format="PNG")
+    return buffer.getvalue()
@@ -0,0 +1,201 @@
+"""
+Content-addressed image store.
+
+Images are stored under the SHA-256 of their bytes (the same hash the
+preprocessing pipeline keys its variant cache on), so clients can refer to a
+previous upload or render by a 64-character ID instead of re-sending it, and
+the prepared variants for that ID are reused.
+
+Backends:
+- local: sharded files under IMAGE_STORE_PATH, pruned oldest-first past
+  IMAGE_STORE_MAX_BYTES
+- s3: any S3-compatible bucket (AWS, MinIO, R2...); needs boto3
+"""
+import asyncio
+import os
+import re
+import tempfile
+import threading
+from typing import Optional
+
+from config import settings
+from services.image_pipeline import content_hash
+
+IMAGE_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+# Prefix of in-progress writes (write-then-rename), which pruning leaves alone
+TEMP_PREFIX = "tmp"
+
+
+def is_image_id(value: str) -> bool:
+    return bool(IMAGE_ID_PATTERN.match(value))
+
+
+def sniff_mime_type(data: bytes) -> str:
+    """Image mime type from the file signature"""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    return "application/octet-stream"
+
+
+class LocalImageStore:
+    """Files under <root>/<id[:2]>/<id>"""
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._puts_since_prune = 0
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, image_id: str) -> str:
+        return os.path.join(self.root, image_id[:2], image_id)
+
+    def get(self, image_id: str) -> Optional[bytes]:
+        try:
+            with open(self._path(image_id), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        # Touch so pruning is least-recently-used rather than oldest-written
+        try:
+            os.utime(self._path(image_id))
+        except FileNotFoundError:
+            pass  # Pruned since the read; the bytes are still good
+        return data
+
+    def put(self, image_id: str, data: bytes) -> None:
+        path = self._path(image_id)
+        if os.path.exists(path):
+            try:
+                os.utime(path)
+                return
+            except FileNotFoundError:
+                pass  # Pruned in between: write it again
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write-then-rename so readers never see a partial file
+        fd, tmp = tempfile.mkstemp(prefix=TEMP_PREFIX, dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+
+        with self._lock:
+            self._puts_since_prune += 1
+            should_prune = self._puts_since_prune >= 50
+            if should_prune:
+                self._puts_since_prune = 0
+        if should_prune:
+            self.prune()
+
+    def prune(self) -> None:
+        """Delete least-recently-used files until under max_bytes"""
+        entries = []
+        total = 0
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.startswith(TEMP_PREFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+class S3ImageStore:
+    """Objects at s3://<bucket>/<prefix><id>"""
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str = "", region: str = ""):
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError as e:
+            raise RuntimeError("IMAGE_STORE_BACKEND=s3 requires boto3 (pip install boto3)") from e
+        if not bucket:
+            raise RuntimeError("IMAGE_STORE_BACKEND=s3 requires S3_BUCKET")
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client_error = ClientError
+        self._client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url or None,
+            region_name=region or None,
+        )
+
+    def get(self, image_id: str) -> Optional[bytes]:
+        try:
+            response = self._client.get_object(Bucket=self.bucket, Key=self.prefix + image_id)
+        except self._client_error as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return None
+            raise
+        return response["Body"].read()
+
+    def put(self, image_id: str, data: bytes) -> None:
+        self._client.put_object(
+            Bucket=self.bucket,
+            Key=self.prefix + image_id,
+            Body=data,
+            ContentType=sniff_mime_type(data),
+        )
+
+
+class ImageStore:
+    """Async front end; backend I/O runs in worker threads"""
+
+    def __init__(self):
+        self._backend = None
+
+    @property
+    def backend(self):
+        # Created on first use so a misconfigured S3 backend fails the request, not the import
+        if self._backend is None:
+            if settings.image_store_backend == "s3":
+                self._backend = S3ImageStore(
+                    settings.s3_bucket, settings.s3_prefix, settings.s3_endpoint_url, settings.s3_region,
+                )
+            else:
+                self._backend = LocalImageStore(settings.image_store_path, settings.image_store_max_bytes)
+        return self._backend
+
+    async def put(self, data: bytes, image_id: Optional[str] = None) -> str:
+        """Store image bytes, returning their ID (content_hash(data), if the caller has it)"""
+        image_id = image_id or content_hash(data)
+        await asyncio.to_thread(self.backend.put, image_id, data)
+        return image_id
+
+    async def get(self, image_id: str) -> Optional[bytes]:
+        """Image bytes for an ID, or None if unknown"""
+        if not is_image_id(image_id):
+            return None
+        return await asyncio.to_thread(self.backend.get, image_id)
+
+
+# Singleton instance
+image_store = ImageStore()
@@ -0,0 +1,381 @@
+"""
+Background jobs for long generations.
+
+A high-quality edit or a two-step red-pen execution can run for more than a
+minute, longer than many proxies keep an idle request open. Jobs take the
+same request body, return an ID at once, and run on a bounded pool of
+JOB_WORKERS workers; clients poll the status and fetch the result image
+when it is done.
+
+Backends (job records, request payloads and the queue):
+- memory: in-process; jobs are lost on restart
+- redis: any Redis-protocol server (Redis, Valkey, or a local stand-in);
+  needs redis-py. Records and payloads are JSON strings with a
+  JOB_TTL_SECONDS expiry and the queue is a list, so several API processes
+  can share one queue.
+
+Jobs run through runners registered by kind; a runner takes the stored
+payload and returns the result fields (imageId, imageUrl, ...). Errors with
+`status_code` / `detail` (HTTPException) keep them in the job record.
+Cancelling a running job cancels its task; workers check for cancellation
+requested through another process every JOB_CANCEL_POLL seconds.
+"""
+import asyncio
+import base64
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+import orjson
+
+from config import settings
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+# Runs one job: stored payload -> result fields
+JobRunner = Callable[[dict], Awaitable[dict]]
+# Status transition for JobBackend.update(): mutates the job, False to leave it unchanged
+JobChange = Callable[["Job"], bool]
+
+
+class QueueFullError(Exception):
+    """JOB_MAX_QUEUED jobs are already waiting"""
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    status_code: Optional[int] = None
+    cancel_requested: bool = False
+
+
+def _encode_bytes(value: Any) -> Any:
+    # Image fields arrive decoded; base64 is what the request models accept back
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def _start(job: Job) -> bool:
+    """QUEUED -> RUNNING; anything else (cancelled meanwhile, expired) is skipped"""
+    if job.status != QUEUED:
+        return False
+    job.status = RUNNING
+    job.started_at = time.time()
+    return True
+
+
+def _request_cancel(job: Job) -> bool:
+    """QUEUED -> CANCELLED; RUNNING -> cancel_requested (the worker cancels it)"""
+    if job.status == QUEUED:
+        job.status = CANCELLED
+        job.finished_at = time.time()
+        return True
+    if job.status == RUNNING and not job.cancel_requested:
+        job.cancel_requested = True
+        return True
+    return False
+
+
+class MemoryJobBackend:
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._jobs: dict[str, dict] = {}
+        self._payloads: dict[str, dict] = {}
+        self._queue: Optional[asyncio.Queue] = None
+
+    @property
+    def queue(self) -> asyncio.Queue:
+        # Created on first use, inside the running loop
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        return self._queue
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["status"] in FINISHED and job["finished_at"] < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    async def save(self, job: Job) -> None:
+        # Stored as a copy, like the Redis backend, so callers can't mutate records in place
+        self._jobs[job.id] = asdict(job)
+
+    async def load(self, job_id: str) -> Optional[Job]:
+        record = self._jobs.get(job_id)
+        return Job(**record) if record is not None else None
+
+    async def update(self, job_id: str, change: JobChange) -> tuple[Optional[Job], bool]:
+        """Check-then-set with no await in between, so it is atomic on the event loop"""
+        record = self._jobs.get(job_id)
+        if record is None:
+            return None, False
+        job = Job(**record)
+        if not change(job):
+            return job, False
+        self._jobs[job_id] = asdict(job)
+        return job, True
+
+    async def enqueue(self, job: Job, payload: dict) -> None:
+        self._prune()
+        await self.save(job)
+        self._payloads[job.id] = payload
+        self.queue.put_nowait(job.id)
+
+    async def dequeue(self, timeout: float) -> Optional[str]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def take_payload(self, job_id: str) -> Optional[dict]:
+        return self._payloads.pop(job_id, None)
+
+    async def queued(self) -> int:
+        return self.queue.qsize()
+
+    async def aclose(self) -> None:
+        pass
+
+
+class RedisJobBackend:
+    """Keys: <prefix><id>, <prefix><id>:payload, list <prefix>queue"""
+
+    def __init__(self, url: str, prefix: str, ttl: int):
+        try:
+            import redis.asyncio as redis
+            from redis.exceptions import WatchError
+        except ImportError as e:
+            raise RuntimeError("JOB_BACKEND=redis requires redis (pip install redis)") from e
+        self._watch_error = WatchError
+        self.prefix = prefix
+        self.ttl = ttl
+        self._redis = redis.from_url(url)
+
+    def _key(self, job_id: str) -> str:
+        return f"{self.prefix}{job_id}"
+
+    async def save(self, job: Job) -> None:
+        await self._redis.set(self._key(job.id), orjson.dumps(asdict(job)), ex=self.ttl)
+
+    async def load(self, job_id: str) -> Optional[Job]:
+        record = await self._redis.get(self._key(job_id))
+        return Job(**orjson.loads(record)) if record is not None else None
+
+    async def update(self, job_id: str, change: JobChange) -> tuple[Optional[Job], bool]:
+        """Compare-and-set with WATCH / MULTI; retried if another process wrote the job meanwhile"""
+        key = self._key(job_id)
+        while True:
+            async with self._redis.pipeline(transaction=True) as pipe:
+                try:
+                    await pipe.watch(key)
+                    record = await pipe.get(key)
+                    if record is None:
+                        return None, False
+                    job = Job(**orjson.loads(record))
+                    if not change(job):
+                        return job, False
+                    pipe.multi()
+                    pipe.set(key, orjson.dumps(asdict(job)), ex=self.ttl)
+                    await pipe.execute()
+                    return job, True
+                except self._watch_error:
+                    continue
+
+    async def enqueue(self, job: Job, payload: dict) -> None:
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.set(self._key(job.id), orjson.dumps(asdict(job)), ex=self.ttl)
+            pipe.set(self._key(job.id) + ":payload", orjson.dumps(payload, default=_encode_bytes), ex=self.ttl)
+            pipe.lpush(self.prefix + "queue", job.id)
+            await pipe.execute()
+
+    async def dequeue(self, timeout: float) -> Optional[str]:
+        popped = await self._redis.brpop([self.prefix + "queue"], timeout=max(1, round(timeout)))
+        return popped[1].decode() if popped else None
+
+    async def take_payload(self, job_id: str) -> Optional[dict]:
+        # GET + DEL in one transaction (GETDEL needs Redis 6.2; stand-ins may lack it)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.get(self._key(job_id) + ":payload")
+            pipe.delete(self._key(job_id) + ":payload")
+            payload, _ = await pipe.execute()
+        return orjson.loads(payload) if payload is not None else None
+
+    async def queued(self) -> int:
+        return await self._redis.llen(self.prefix + "queue")
+
+    async def aclose(self) -> None:
+        await self._redis.aclose()
+
+
+class JobManager:
+    def __init__(self):
+        self._backend = None
+        self._runners: dict[str, JobRunner] = {}
+        self._workers: list[asyncio.Task] = []
+        self._running: dict[str, asyncio.Task] = {}
+        self.counts = {"submitted": 0, SUCCEEDED: 0, FAILED: 0, CANCELLED: 0}
+
+    @property
+    def backend(self):
+        # Created on first use so a misconfigured Redis backend fails the request, not the import
+        if self._backend is None:
+            if settings.job_backend == "redis":
+                self._backend = RedisJobBackend(settings.redis_url, settings.job_redis_prefix, settings.job_ttl_seconds)
+            else:
+                self._backend = MemoryJobBackend(settings.job_ttl_seconds)
+        return self._backend
+
+    def register(self, kind: str, runner: JobRunner) -> None:
+        self._runners[kind] = runner
+
+    @property
+    def kinds(self) -> list[str]:
+        return sorted(self._runners)
+
+    async def start(self) -> None:
+        """Start the worker pool (lifespan startup); idempotent"""
+        if self._workers:
+            return
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"job-worker-{i}")
+            for i in range(max(1, settings.job_workers))
+        ]
+
+    async def aclose(self) -> None:
+        """Stop the workers; running jobs fail as interrupted (lifespan shutdown)"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._backend is not None:
+            await self._backend.aclose()
+
+    async def submit(self, kind: str, payload: dict) -> Job:
+        if kind not in self._runners:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        if await self.backend.queued() >= settings.job_max_queued:
+            raise QueueFullError(f"{settings.job_max_queued} jobs are already queued")
+        job = Job(id=uuid.uuid4().hex, kind=kind)
+        await self.backend.enqueue(job, payload)
+        self.counts["submitted"] += 1
+        print(f"📋 Job {job.id[:8]} ({kind}) queued")
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return await self.backend.load(job_id)
+
+    async def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued or running job (finished jobs are returned unchanged)"""
+        job, changed = await self.backend.update(job_id, _request_cancel)
+        if not changed:
+            return job
+        if job.status == CANCELLED:
+            # The worker that dequeues it skips it
+            self.counts[CANCELLED] += 1
+        else:
+            task = self._running.get(job_id)
+            if task is not None:
+                task.cancel()
+        print(f"🛑 Job {job_id[:8]} cancel requested ({job.status})")
+        return job
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                job_id = await self.backend.dequeue(timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Backend outage: keep the worker alive and try again
+                print(f"⚠️ Job queue read failed: {e}")
+                await asyncio.sleep(1)
+                continue
+            if job_id is None:
+                continue
+            # Conditional, so a cancel that lands after the dequeue isn't overwritten
+            job, started = await self.backend.update(job_id, _start)
+            if not started:
+                await self.backend.take_payload(job_id)
+                continue
+            await self._run(job)
+
+    async def _run(self, job: Job) -> None:
+        print(f"▶️ Job {job.id[:8]} ({job.kind}) started after {job.started_at - job.created_at:.1f}s in queue")
+
+        payload = await self.backend.take_payload(job.id)
+        if payload is None:
+            await self._finish(job, FAILED, error="Job payload expired", status_code=410)
+            return
+
+        task = asyncio.ensure_future(self._runners[job.kind](payload))
+        self._running[job.id] = task
+        try:
+            while not task.done():
+                await asyncio.wait({task}, timeout=settings.job_cancel_poll)
+                if task.done():
+                    break
+                # Cancellation requested through another process
+                current = await self.backend.load(job.id)
+                if current is not None and current.cancel_requested:
+                    task.cancel()
+                    await asyncio.wait({task})
+        except asyncio.CancelledError:
+            # Worker shutdown
+            task.cancel()
+            await self._finish(job, FAILED, error="Interrupted by server shutdown", status_code=503)
+            raise
+        finally:
+            self._running.pop(job.id, None)
+
+        if task.cancelled():
+            await self._finish(job, CANCELLED)
+        elif task.exception() is not None:
+            e = task.exception()
+            await self._finish(
+                job, FAILED,
+                error=str(getattr(e, "detail", e)),
+                status_code=getattr(e, "status_code", 500),
+            )
+        else:
+            job.result = task.result()
+            await self._finish(job, SUCCEEDED)
+
+    async def _finish(self, job: Job, status: str, error: Optional[str] = None, status_code: Optional[int] = None) -> None:
+        job.status = status
+        job.error = error
+        job.status_code = status_code
+        job.finished_at = time.time()
+        await asyncio.shield(self.backend.save(job))
+        self.counts[status] += 1
+        emoji = {SUCCEEDED: "✅", FAILED: "❌", CANCELLED: "🛑"}[status]
+        print(f"{emoji} Job {job.id[:8]} ({job.kind}) {status} in {job.finished_at - job.started_at:.1f}s"
+              + (f": {error}" if error else ""))
+
+    def stats(self) -> dict:
+        return {
+            "backend": settings.job_backend,
+            "workers": len(self._workers),
+            "running": len(self._running),
+            **self.counts,
+        }
+
+
+# Singleton instance
+job_manager = JobManager()
@@ -1,17 +1,36 @@
 import base64
-from openai import OpenAI
+from openai import AsyncOpenAI
+from openai.types import Image as ImageData, ImagesResponse
 import openai
 from typing import Optional, Literal
 import io
-from PIL import Image, ImageFilter
+from PIL import Image
 import asyncio
-from functools import partial
 from enum import Enum
 import numpy as np
 import time
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 
 from config import settings
+from services.image_pipeline import (
+    ImageSource,
+    PreparedImage,
+    prepare_image_async,
+    source_bytes,
+    OPENAI_IMAGE_SPEC,
+    DALLE_IMAGE_SPEC,
+    VISION_IMAGE_SPEC,
+)
+from services.compositing import composite_edit
+from services import progress
+from services.cpu_pool import cpu_pool
+from services.http_client import http_pool
+from services.masks import MaskSource, prepare_mask
+from services.circuit_breaker import circuit_breakers
+from services.rate_limiter import parse_reset, rate_limiters
+from services.result_cache import input_hash, result_cache, result_key
+from services.tiled_render import Tile, TileGrid, render_tiled
+from services.image_result import ImageResult
 
 
 # =============================================================================
@@ -156,6 +175,42 @@ Improve the overall visual quality by:
 The final image should look like a premium architectural marketing render of the existing site, not a redesign or a new building."""
 
 
+def build_tile_prompt(style_preset: StylePreset, tile: Tile, grid: TileGrid) -> str:
+    """
+    Render prompt for one tile of a tiled render. Image 1 is the tile, image 2
+    the whole photo, so every tile is graded against the same scene.
+    """
+    return f"""{build_render_prompt(style_preset)}
+
+TILED RENDER: Image 1 is one tile (row {tile.row + 1} of {grid.rows}, column {tile.col + 1} of {grid.cols}) of a larger photo. Image 2 is the whole photo, for context only.
+- Render ONLY image 1, keeping its exact framing: do not zoom, pan, crop or add borders
+- Match the lighting, sky, color grading and materials to how the whole scene in image 2 should look
+- Content cut off at the tile edges continues in neighbouring tiles; keep it cut off exactly where it is"""
+
+
+_connection_backoff = wait_exponential(multiplier=1, min=2, max=10)
+
+
+def _retry_wait(retry_state) -> float:
+    # Rate-limited calls wait at the limiter, which knows when the quota resets
+    if isinstance(retry_state.outcome.exception(), openai.RateLimitError):
+        return 0
+    return _connection_backoff(retry_state)
+
+
+def openai_reset_hint(error: openai.RateLimitError) -> Optional[float]:
+    """Seconds until the quota resets, from the 429's retry-after / x-ratelimit-reset-* headers"""
+    headers = error.response.headers
+    retry_after_ms = parse_reset(headers.get("retry-after-ms"))
+    if retry_after_ms is not None:
+        return retry_after_ms / 1000
+    for header in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+        seconds = parse_reset(headers.get(header))
+        if seconds is not None:
+            return seconds
+    return None
+
+
 class OpenAIService:
     """
     OpenAI Image Service using gpt-image-1
@@ -169,31 +224,80 @@ class OpenAIService:
     """
     
     def __init__(self):
+        # One async client for the process: calls are awaited on the event
+        # loop, so concurrency is bounded by its connection pool rather than
+        # by executor threads. Retries are ours (tenacity, async sleeps).
         if settings.openai_api_key:
-            self.client = OpenAI(api_key=settings.openai_api_key)
+            self.client = AsyncOpenAI(api_key=settings.openai_api_key, max_retries=0)
         else:
             self.client = None
     
+    async def _request(self, create, model: str, limit: str = "openai", **kwargs) -> any:
+        """
+        One provider call, admitted by the shared per-model limiter (limit:
+        "openai" for image calls, "openai_chat" for chat, which has its own
+        request rate). A 429
+        is reported to the limiter with OpenAI's reset hint, so queued calls
+        wait for the quota instead of all retrying into it. The model's
+        circuit breaker fails it at once (CircuitOpenError, not retried)
+        while OpenAI is failing.
+        """
+        async with circuit_breakers.get("openai", model).guard(), \
+                rate_limiters.get(limit, model).slot() as slot:
+            try:
+                return await create(model=model, **kwargs)
+            except openai.RateLimitError as e:
+                slot.throttled(openai_reset_hint(e))
+                print(f"⚠️ Rate limited, retrying... {e}")
+                raise  # Will be retried
+            except openai.APIConnectionError as e:
+                print(f"⚠️ Connection error, retrying... {e}")
+                raise  # Will be retried
+    
+    async def _stream_images_edit(self, **kwargs) -> ImagesResponse:
+        """
+        images.edit as a stream: partial frames go to the progress listener
+        and the completed image comes back as a regular ImagesResponse.
+        """
+        progress.report("uploading", provider="openai", model=kwargs["model"])
+        stream = await self.client.images.edit(
+            stream=True, partial_images=settings.stream_partial_images, **kwargs
+        )
+        progress.report("generating", provider="openai", model=kwargs["model"])
+        async for event in stream:
+            if event.type == "image_edit.partial_image":
+                progress.report_partial(event.partial_image_index, event.b64_json)
+            elif event.type == "image_edit.completed":
+                return ImagesResponse(created=event.created_at, data=[ImageData(b64_json=event.b64_json)])
+        raise ValueError("Image stream ended without a result")
+    
     @retry(
         stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=10),
+        wait=_retry_wait,
         retry=retry_if_exception_type((openai.RateLimitError, openai.APIConnectionError)),
         reraise=True,
     )
-    def _call_images_edit(self, **kwargs) -> any:
+    async def _call_images_edit(self, stream_partials: bool = False, **kwargs) -> any:
         """
         Call OpenAI images.edit with retry logic for transient errors.
         
         Retries on:
-        - RateLimitError (429) - with exponential backoff
-        - APIConnectionError - network issues
+        - RateLimitError (429) - once the limiter's pause is over
+        - APIConnectionError - network issues, with exponential backoff
         
         Does NOT retry on:
         - BadRequestError (400) - invalid inputs
         - AuthenticationError (401) - bad API key
+        
+        With stream_partials, gpt-image calls stream partial frames when a
+        progress listener (an SSE endpoint) is waiting for them.
         """
+        create = self.client.images.edit
+        if (stream_partials and progress.listening() and settings.stream_partial_images > 0
+                and kwargs["model"].startswith("gpt-image")):
+            create = self._stream_images_edit
         try:
-            return self.client.images.edit(**kwargs)
+            return await self._request(create, **kwargs)
         except openai.BadRequestError as e:
             # Don't retry - user needs to fix their input
             print(f"❌ OpenAI BadRequest: {e}")
@@ -201,82 +305,49 @@ class OpenAIService:
         except openai.AuthenticationError as e:
             print(f"❌ OpenAI Auth Error: {e}")
             raise ValueError("OpenAI API key is invalid")
-        except openai.RateLimitError as e:
-            print(f"⚠️ Rate limited, retrying... {e}")
-            raise  # Will be retried
-        except openai.APIConnectionError as e:
-            print(f"⚠️ Connection error, retrying... {e}")
-            raise  # Will be retried
     
-    def _prepare_image_bytes(self, image_base64: str, max_size: int = 2048) -> bytes:
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=_retry_wait,
+        retry=retry_if_exception_type((openai.RateLimitError, openai.APIConnectionError)),
+        reraise=True,
+    )
+    async def chat_completion(self, **kwargs) -> str:
         """
-        Prepare image for OpenAI Images API.
-        Returns PNG bytes.
+        GPT-4o chat / vision call with the same retry policy as images.edit.
+        Returns the first choice's message content.
         """
-        # Decode base64
-        image_data = base64.b64decode(image_base64)
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Convert to RGBA (required for edit endpoint with masks)
-        if image.mode != "RGBA":
-            image = image.convert("RGBA")
-        
-        # Resize if too large (keep aspect ratio)
-        if max(image.size) > max_size:
-            ratio = max_size / max(image.size)
-            new_size = (int(image.size[0] * ratio), int(image.size[1] * ratio))
-            image = image.resize(new_size, Image.Resampling.LANCZOS)
-        
-        # Convert to bytes
-        buffer = io.BytesIO()
-        image.save(buffer, format="PNG")
-        buffer.seek(0)
-        
-        return buffer.read(), image.size
+        if not self.client:
+            raise ValueError("OpenAI API key not configured")
+        response = await self._request(self.client.chat.completions.create, limit="openai_chat", **kwargs)
+        return response.choices[0].message.content
+    
+    @staticmethod
+    def image_spec(model: str):
+        """gpt-image models take PNG/JPEG/WebP; dall-e-2 only RGBA PNG"""
+        return OPENAI_IMAGE_SPEC if model.startswith("gpt-image") else DALLE_IMAGE_SPEC
     
-    def _prepare_mask_bytes(self, mask_base64: str, target_size: tuple, feather_radius: int = 2) -> bytes:
+    @staticmethod
+    def _prepare_mask_bytes(mask_base64: MaskSource, target_size: tuple, feather_px: float = settings.mask_feather_px) -> bytes:
         """
-        Prepare mask for OpenAI Images API using NumPy (10-100x faster).
+        Prepare mask for OpenAI Images API.
         
         OpenAI expects: transparent areas = edit, opaque areas = keep
         Our mask: white = edit, black = keep
         
         Args:
-            mask_base64: Base64 encoded mask image
+            mask_base64: Base64 PNG mask (or raw bytes), or a compact RLE / packbits / strokes mask
             target_size: Size to resize mask to (width, height)
-            feather_radius: Blur radius for edge feathering (0 to disable)
+            feather_px: Edge feather in pixels at 1024px output, scaled to target_size (0 to disable)
         """
         start_time = time.time()
         
-        # Decode base64
-        mask_data = base64.b64decode(mask_base64)
-        mask = Image.open(io.BytesIO(mask_data))
-        
-        # Resize to match image
-        mask = mask.resize(target_size, Image.Resampling.LANCZOS)
-        
-        # Convert to RGB for brightness calculation
-        if mask.mode != "RGB":
-            mask = mask.convert("RGB")
-        
-        # Convert to NumPy array for fast processing
-        arr = np.array(mask)
-        
-        # Calculate brightness (mean of RGB channels) - vectorized operation
-        brightness = arr.mean(axis=2)
+        # Edit coverage: 255 = edit, ramping to 0 across the feathered edge
+        coverage = prepare_mask(mask_base64, target_size, feather_px)
         
-        # Create alpha channel: white (edit) -> 0 (transparent), black (keep) -> 255 (opaque)
-        alpha = np.where(brightness > 128, 0, 255).astype(np.uint8)
-        
-        # Optional: feather edges for smoother blending
-        if feather_radius > 0:
-            alpha_img = Image.fromarray(alpha, mode='L')
-            alpha_img = alpha_img.filter(ImageFilter.GaussianBlur(radius=feather_radius))
-            alpha = np.array(alpha_img)
-        
-        # Create RGBA image with black RGB and computed alpha
-        rgba = np.zeros((arr.shape[0], arr.shape[1], 4), dtype=np.uint8)
-        rgba[:, :, 3] = alpha  # Set alpha channel
+        # Create RGBA image with black RGB; alpha 0 (transparent) where editing
+        rgba = np.zeros((coverage.shape[0], coverage.shape[1], 4), dtype=np.uint8)
+        rgba[:, :, 3] = 255 - coverage
         
         # Convert back to PIL Image
         result = Image.fromarray(rgba, mode='RGBA')
@@ -287,21 +358,21 @@ class OpenAIService:
         buffer.seek(0)
         
         elapsed = time.time() - start_time
-        print(f"   Mask processed in {elapsed*1000:.1f}ms (NumPy accelerated)")
+        print(f"   Mask processed in {elapsed*1000:.1f}ms")
         
         return buffer.read()
     
-    def _edit_image_sync(
+    async def _edit_image(
         self,
         prompt: str,
-        image_base64: str,
-        mask_base64: Optional[str] = None,
+        image: PreparedImage,
+        mask_bytes: Optional[bytes] = None,
         model: str = "gpt-image-1",
         quality: RenderQuality = RenderQuality.STANDARD,
         style_preset: StylePreset = StylePreset.REAL_ESTATE,
-        reference_images: Optional[list[str]] = None,
+        reference_images: Optional[list[PreparedImage]] = None,
         render_mode: str = "plan_to_render",
-    ) -> tuple[str, str]:
+    ) -> ImageResult:
         """
         Edit an image using OpenAI's gpt-image-1 model.
         
@@ -314,14 +385,14 @@ class OpenAIService:
         
         Args:
             prompt: User's description of the desired change
-            image_base64: Base64 encoded source image
-            mask_base64: Optional mask (white=edit, black=keep)
+            image: Source image, already prepared on the CPU pool
+            mask_bytes: Optional prepared OpenAI mask (transparent=edit)
             model: OpenAI model to use
             quality: RenderQuality tier (draft/standard/high)
             style_preset: Architectural style preset
             materials: List of materials to use
             scale: Scale description (e.g., "40 feet tall")
-            reference_images: Optional list of reference image base64 strings
+            reference_images: Optional list of prepared reference images
             creative_mode: 'edit' for strict preservation, 'reimagine' for creative interpretation
             lifestyle_preset: Optional lifestyle preset (marketing, clean, evening, community)
         """
@@ -333,16 +404,13 @@ class OpenAIService:
         print(f"{mode_emoji} OPENAI IMAGE {render_mode.upper()} - {model} ({quality.value} quality)")
         print("=" * 60)
         
-        # Prepare the main image
-        image_bytes, image_size = self._prepare_image_bytes(image_base64)
-        print(f"📦 Main image prepared: {image_size}")
+        print(f"📦 Main image prepared: {image.size}")
         
-        # Prepare reference images if provided (up to 9 refs + 1 main = 10 total)
+        # Reference images (up to 9 refs + 1 main = 10 total)
         ref_image_files = []
         if reference_images:
-            for i, ref_base64 in enumerate(reference_images[:9]):
-                ref_bytes, _ = self._prepare_image_bytes(ref_base64)
-                ref_file = (f"reference_{i+1}.png", ref_bytes, "image/png")
+            for i, ref in enumerate(reference_images[:9]):
+                ref_file = (f"reference_{i+1}.{ref.extension}", ref.data, ref.mime_type)
                 ref_image_files.append(ref_file)
             print(f"📦 Reference images prepared: {len(ref_image_files)}")
         
@@ -378,7 +446,7 @@ class OpenAIService:
             print("🔒 Quality: HIGH | Input fidelity: HIGH | Output: PNG (lossless)")
         
         # Create main image file tuple
-        main_image_file = ("image.png", image_bytes, "image/png")
+        main_image_file = (f"image.{image.extension}", image.data, image.mime_type)
         
         # Build image array: main image first, then references
         if ref_image_files:
@@ -390,32 +458,25 @@ class OpenAIService:
             # Single image
             api_params["image"] = main_image_file
         
-        if mask_base64:
+        if mask_bytes:
             # Use edit endpoint with mask for targeted inpainting
             print("🎭 Using masked edit (inpainting)")
-            mask_bytes = self._prepare_mask_bytes(mask_base64, image_size)
             mask_file = ("mask.png", mask_bytes, "image/png")
             api_params["mask"] = mask_file
         else:
             print("🖼️ Using whole-image edit")
         
-        response = self._call_images_edit(**api_params)
+        response = await self._call_images_edit(stream_partials=True, **api_params)
         
         # Get the result
         result = response.data[0]
         
         # Handle both URL and b64_json responses
         if hasattr(result, 'b64_json') and result.b64_json:
-            result_base64 = result.b64_json
-            result_url = f"data:image/png;base64,{result_base64}"
+            image_result = ImageResult(base64_data=result.b64_json)
         elif hasattr(result, 'url') and result.url:
-            # Download the image from URL
-            import httpx
-            with httpx.Client(timeout=30.0) as client:
-                img_response = client.get(result.url)
-                img_bytes = img_response.content
-            result_base64 = base64.b64encode(img_bytes).decode()
-            result_url = f"data:image/png;base64,{result_base64}"
+            # Download the image from URL (pooled connection)
+            image_result = ImageResult(data=await http_pool.download(result.url))
         else:
             raise ValueError("No image data in response")
         
@@ -423,42 +484,42 @@ class OpenAIService:
         print("✅ OPENAI EDIT COMPLETE")
         print("=" * 60)
         
-        return result_url, result_base64
+        return image_result
     
-    def _render_image_sync(
+    async def _render_image(
         self,
-        image_base64: str,
+        image: PreparedImage,
         model: str = "gpt-image-1",
         quality: RenderQuality = RenderQuality.STANDARD,
         style_preset: StylePreset = StylePreset.REAL_ESTATE,
-    ) -> tuple[str, str]:
+        n: int = 1,
+    ) -> list[ImageResult]:
         """
         Convert a photo to an architectural render style.
         Uses gpt-image-1 with a render-focused prompt.
         
         Args:
-            image_base64: Base64 encoded source image
+            image: Source image, already prepared on the CPU pool
             model: OpenAI model to use
             quality: RenderQuality tier (draft/standard/high)
             style_preset: Architectural style preset
+            n: Renders to generate from the one upload
         """
         if not self.client:
             raise ValueError("OpenAI API key not configured")
         
         print("=" * 60)
-        print(f"🏛️ OPENAI RENDER - Photo to Arch Viz ({model}, {quality.value})")
+        print(f"🏛️ OPENAI RENDER - Photo to Arch Viz ({model}, {quality.value}{f', n={n}' if n > 1 else ''})")
         print("=" * 60)
         
-        # Prepare the image
-        image_bytes, image_size = self._prepare_image_bytes(image_base64)
-        print(f"📦 Image prepared: {image_size}")
+        print(f"📦 Image prepared: {image.size}")
         
         # Build prompt using template
         render_prompt = build_render_prompt(style_preset)
         print(f"🎨 Style preset: {style_preset.value}")
 
         # Create file tuple with proper MIME type
-        image_file = ("image.png", image_bytes, "image/png")
+        image_file = (f"image.{image.extension}", image.data, image.mime_type)
         
         # Determine size based on model - ALWAYS use max size for quality
         if model == "dall-e-2":
@@ -472,7 +533,7 @@ class OpenAIService:
             "model": model,
             "image": image_file,
             "prompt": render_prompt,
-            "n": 1,
+            "n": n,
             "size": size,
             "output_format": "png",  # CRITICAL: Lossless output format
         }
@@ -483,29 +544,63 @@ class OpenAIService:
             api_params["input_fidelity"] = "high"  # Preserve details
             print("🔒 Quality: HIGH | Input fidelity: HIGH | Output: PNG (lossless)")
 
-        response = self._call_images_edit(**api_params)
+        response = await self._call_images_edit(stream_partials=n == 1, **api_params)
         
-        # Get the result
+        image_results = []
+        for result in response.data:
+            if hasattr(result, 'b64_json') and result.b64_json:
+                image_results.append(ImageResult(base64_data=result.b64_json))
+            elif hasattr(result, 'url') and result.url:
+                image_results.append(ImageResult(data=await http_pool.download(result.url)))
+        if not image_results:
+            raise ValueError("No image data in response")
+        
+        print("=" * 60)
+        print("✅ OPENAI RENDER COMPLETE")
+        print("=" * 60)
+        
+        return image_results
+    
+    async def _render_tile(
+        self,
+        tile_image: PreparedImage,
+        overview: PreparedImage,
+        tile: Tile,
+        grid: TileGrid,
+        model: str,
+        style_preset: StylePreset,
+    ) -> bytes:
+        """Render one tile of a tiled render; returns the provider's image bytes"""
+        if not self.client:
+            raise ValueError("OpenAI API key not configured")
+        
+        api_params = {
+            "model": model,
+            "image": [
+                (f"tile.{tile_image.extension}", tile_image.data, tile_image.mime_type),
+                (f"image.{overview.extension}", overview.data, overview.mime_type),
+            ],
+            "prompt": build_tile_prompt(style_preset, tile, grid),
+            "n": 1,
+            "size": f"{settings.tiled_render_tile}x{settings.tiled_render_tile}",
+            "output_format": "png",
+            "quality": "high",
+            "input_fidelity": "high",
+        }
+        
+        started = time.time()
+        response = await self._call_images_edit(**api_params)
         result = response.data[0]
         
         if hasattr(result, 'b64_json') and result.b64_json:
-            result_base64 = result.b64_json
-            result_url = f"data:image/png;base64,{result_base64}"
+            data = base64.b64decode(result.b64_json)
         elif hasattr(result, 'url') and result.url:
-            import httpx
-            with httpx.Client(timeout=30.0) as client:
-                img_response = client.get(result.url)
-                img_bytes = img_response.content
-            result_base64 = base64.b64encode(img_bytes).decode()
-            result_url = f"data:image/png;base64,{result_base64}"
+            data = await http_pool.download(result.url)
         else:
             raise ValueError("No image data in response")
         
-        print("=" * 60)
-        print("✅ OPENAI RENDER COMPLETE")
-        print("=" * 60)
-        
-        return result_url, result_base64
+        print(f"   🧩 Tile ({tile.row + 1}, {tile.col + 1}) of {grid.rows}x{grid.cols} in {time.time() - started:.1f}s")
+        return data
     
     def get_prompt_preview(
         self,
@@ -525,62 +620,179 @@ class OpenAIService:
     async def edit_image(
         self,
         prompt: str,
-        image_base64: str,
-        mask_base64: Optional[str] = None,
+        image_base64: ImageSource,
+        mask_base64: Optional[MaskSource] = None,
         model: str = "gpt-image-1",
         quality: RenderQuality = RenderQuality.STANDARD,
         style_preset: StylePreset = StylePreset.REAL_ESTATE,
-        reference_images: Optional[list[str]] = None,
+        reference_images: Optional[list[ImageSource]] = None,
         render_mode: str = "plan_to_render",
-    ) -> tuple[str, str]:
+    ) -> ImageResult:
         """
-        Edit an image using OpenAI's image models (async wrapper).
+        Edit an image using OpenAI's image models.
         
         Modes:
         - plan_to_render: Accurate preservation of geometry
         - pretty_render: Creative marketing-quality visualization
         
-        Returns (image_url, image_base64)
+        Masked edits come back at the original's resolution, with only the
+        masked area taken from the provider (services.compositing).
+        
+        Returns an ImageResult
         """
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            None,
-            partial(
-                self._edit_image_sync, 
-                prompt, 
-                image_base64, 
-                mask_base64, 
+        references = reference_images[:9] if reference_images else None
+        key = result_key(
+            operation="edit",
+            image=input_hash(image_base64),
+            mask=input_hash(mask_base64),
+            references=input_hash(references),
+            prompt=build_edit_prompt(prompt, style_preset, len(references or ()), render_mode),
+            model=model,
+            quality=quality.value,
+            style=style_preset.value,
+            mode=render_mode,
+            composite=bool(mask_base64) and settings.composite_edits,
+            feather_px=settings.mask_feather_px,
+        )
+        
+        async def create() -> ImageResult:
+            # Image prep runs on the CPU pool; the provider call awaits on the event loop
+            progress.report("preprocessing")
+            spec = self.image_spec(model)
+            image = await prepare_image_async(image_base64, spec)
+            prepared_references = None
+            if references:
+                prepared_references = await asyncio.gather(*(
+                    prepare_image_async(ref, spec) for ref in references
+                ))
+            mask_bytes = None
+            if mask_base64:
+                mask_bytes = await cpu_pool.run(self._prepare_mask_bytes, mask_base64, image.size)
+            
+            result = await self._edit_image(
+                prompt,
+                image,
+                mask_bytes,
                 model,
                 quality,
                 style_preset,
-                reference_images,
+                prepared_references,
                 render_mode,
             )
-        )
+            
+            # Keep everything outside the mask pixel-identical to the upload
+            if mask_base64 and settings.composite_edits:
+                progress.report("compositing")
+                result = ImageResult(data=await cpu_pool.run(
+                    composite_edit, source_bytes(image_base64), result.data, mask_base64
+                ))
+            return result
+        
+        return await result_cache.get_or_create(key, create)
     
     async def render_image(
         self,
-        image_base64: str,
+        image_base64: ImageSource,
         model: str = "gpt-image-1",
         quality: RenderQuality = RenderQuality.STANDARD,
         style_preset: StylePreset = StylePreset.REAL_ESTATE,
-    ) -> tuple[str, str]:
+    ) -> ImageResult:
         """
-        Convert photo to architectural render using OpenAI's image models (async wrapper).
-        Returns (image_url, image_base64)
+        Convert photo to architectural render using OpenAI's image models.
+        Returns an ImageResult
         """
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            None,
-            partial(self._render_image_sync, image_base64, model, quality, style_preset)
+        key = result_key(
+            operation="render",
+            image=input_hash(image_base64),
+            prompt=build_render_prompt(style_preset),
+            model=model,
+            quality=quality.value,
+            style=style_preset.value,
         )
+        
+        async def create() -> ImageResult:
+            progress.report("preprocessing")
+            image = await prepare_image_async(image_base64, self.image_spec(model))
+            return (await self._render_image(image, model, quality, style_preset))[0]
+        
+        return await result_cache.get_or_create(key, create)
     
-    def _analyze_sync(self, image_base64: str, prompt: str) -> str:
-        """Analyze an image using GPT-4o vision"""
-        if not self.client:
-            raise ValueError("OpenAI API key not configured")
+    async def render_variations(
+        self,
+        image_base64: ImageSource,
+        n: int,
+        model: str = "gpt-image-1",
+        quality: RenderQuality = RenderQuality.STANDARD,
+        style_preset: StylePreset = StylePreset.REAL_ESTATE,
+    ) -> list[ImageResult]:
+        """
+        n renders of one photo and style from a single call, so the image is
+        uploaded once. Not cached: asking again is asking for new options.
+        """
+        image = await prepare_image_async(image_base64, self.image_spec(model))
+        return await self._render_image(image, model, quality, style_preset, n)
+    
+    async def render_image_tiled(
+        self,
+        image_base64: ImageSource,
+        model: str = "gpt-image-1",
+        style_preset: StylePreset = StylePreset.REAL_ESTATE,
+        long_side: Optional[int] = None,
+    ) -> ImageResult:
+        """
+        Photo-to-render at up to TILED_RENDER_MAX_SIZE on the long side, one
+        provider call per tile (services.tiled_render).
+        Returns an ImageResult
+        """
+        if not model.startswith("gpt-image"):
+            raise ValueError(f"Tiled renders need a gpt-image model, not {model}")
+        
+        key = result_key(
+            operation="render_tiled",
+            image=input_hash(image_base64),
+            prompt=build_render_prompt(style_preset),
+            model=model,
+            style=style_preset.value,
+            long_side=long_side,
+            tile=settings.tiled_render_tile,
+            overlap=settings.tiled_render_overlap,
+        )
+        
+        async def create() -> ImageResult:
+            # Whole-photo context shared by every tile
+            progress.report("preprocessing")
+            overview = await prepare_image_async(image_base64, self.image_spec(model))
+            
+            async def render_tile(tile_image: PreparedImage, tile: Tile, grid: TileGrid) -> bytes:
+                return await self._render_tile(tile_image, overview, tile, grid, model, style_preset)
             
-        response = self.client.chat.completions.create(
+            return await render_tiled(source_bytes(image_base64), render_tile, long_side)
+        
+        return await result_cache.get_or_create(key, create)
+    
+    async def generate_image(
+        self,
+        prompt: str,
+        image_base64: ImageSource,
+        mask_base64: Optional[MaskSource] = None,
+        style: str = "photorealistic",
+    ) -> ImageResult:
+        """
+        Legacy /api/generate entry point: a custom-style edit, masked
+        (inpainting) when a mask is given.
+        Returns an ImageResult
+        """
+        return await self.edit_image(
+            prompt=f"{prompt}. Style: {style}",
+            image_base64=image_base64,
+            mask_base64=mask_base64,
+            style_preset=StylePreset.CUSTOM,
+        )
+    
+    async def analyze_image(self, image_base64: ImageSource, prompt: str) -> str:
+        """Use GPT-4o to analyze an image"""
+        image = await prepare_image_async(image_base64, VISION_IMAGE_SPEC)
+        return await self.chat_completion(
             model="gpt-4o",
             messages=[
                 {
@@ -590,7 +802,7 @@ class OpenAIService:
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/png;base64,{image_base64}"
+                                "url": image.data_uri
                             }
                         }
                     ]
@@ -598,16 +810,6 @@ class OpenAIService:
             ],
             max_tokens=500
         )
-        
-        return response.choices[0].message.content
-
-    async def analyze_image(self, image_base64: str, prompt: str) -> str:
-        """Use GPT-4o to analyze an image (async wrapper)"""
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            None,
-            partial(self._analyze_sync, image_base64, prompt)
-        )
 
 
 # Singleton instance
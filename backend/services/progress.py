@@ -0,0 +1,60 @@
+"""
+Progress events for streamed generations.
+
+The streaming endpoints (routers.events) run the regular handlers with a
+listener installed in a context variable; code along the way reports what
+it is doing without any listener being threaded through its signature:
+
+- report(stage, **fields): preprocessing, queued, uploading, generating,
+  downloading, compositing
+- report_partial(index, b64_json): a partial frame from a streamed
+  gpt-image call
+
+tagged(**fields) adds fields to everything reported inside it, e.g. the
+provider of each attempt of a hedged request. All are no-ops when nobody is
+listening, which is every non-streaming request. Tasks inherit the listener from the context they are created in.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, Optional
+
+ProgressListener = Callable[[dict], None]
+
+_listener: ContextVar[Optional[ProgressListener]] = ContextVar("progress_listener", default=None)
+
+
+def listening() -> bool:
+    return _listener.get() is not None
+
+
+def report(stage: str, **fields) -> None:
+    listener = _listener.get()
+    if listener is not None:
+        listener({"stage": stage, **fields})
+
+
+def report_partial(index: int, b64_json: str) -> None:
+    listener = _listener.get()
+    if listener is not None:
+        listener({"partial": index, "b64_json": b64_json})
+
+
+@contextmanager
+def listen(listener: ProgressListener) -> Iterator[None]:
+    """Deliver events reported in this context (and tasks created in it) to listener"""
+    token = _listener.set(listener)
+    try:
+        yield
+    finally:
+        _listener.reset(token)
+
+
+@contextmanager
+def tagged(**fields) -> Iterator[None]:
+    """Add fields to every event reported in this context (no-op when nobody is listening)"""
+    listener = _listener.get()
+    if listener is None:
+        yield
+        return
+    with listen(lambda event: listener({**event, **fields})):
+        yield
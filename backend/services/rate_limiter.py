@@ -0,0 +1,227 @@
+"""
+Adaptive per-provider / per-model request limiting.
+
+Provider quotas are shared by every request in the process, but retries
+were per request: under a burst, every in-flight call got a 429 at the same
+moment, all backed off together and all came back together. Calls now go
+through one limiter per (provider, model):
+
+- token bucket: requests start at most at the configured rate (RPM), with a
+  small burst allowance
+- AIMD window: at most `window` calls in flight. Each success grows the
+  window by 1/window (about +1 per window of successes); a 429 halves it,
+  once per round, so a burst of 429s from the same round counts as one
+- reset hints: a 429's reset time ("resets in ~5s", retry-after) pauses the
+  limiter, so queued calls wait for the quota instead of spending retries
+
+Usage:
+    async with rate_limiters.get("openai", model).slot() as slot:
+        try:
+            return await call()
+        except RateLimitError as e:
+            slot.throttled(reset_after)
+            raise
+"""
+import asyncio
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from config import settings
+from services import progress
+
+# Pause after a 429 that carries no reset hint
+DEFAULT_PAUSE = 1.0
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """Seconds from a reset / retry-after value: "12", "1.5s", "6m0s", "20ms" (None if unparseable)"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts or "".join(n + u for n, u in parts) != value:
+        return None
+    scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(number) * scale[unit] for number, unit in parts)
+
+
+class Slot:
+    """One admitted call; report a 429 with throttled()"""
+
+    def __init__(self, epoch: int):
+        self.epoch = epoch
+        self.throttled_for: Optional[float] = None
+
+    def throttled(self, reset_after: Optional[float] = None) -> None:
+        self.throttled_for = DEFAULT_PAUSE if reset_after is None else reset_after
+
+
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: float,
+        burst: int,
+        initial_window: int,
+        max_window: int,
+        backoff: float,
+    ):
+        self.name = name
+        self.rate = requests_per_minute / 60.0
+        self.burst = max(1, burst)
+        self.window = float(max(1, min(initial_window, max_window)))
+        self.max_window = max(1, max_window)
+        self.backoff = backoff
+        self.in_flight = 0
+        self.waiting = 0
+        self.epoch = 0  # Bumped on every decrease; 429s from older calls don't shrink again
+        self._tokens = float(self.burst)
+        self._refilled = time.monotonic()
+        self._resume_at = 0.0
+        self._cond: Optional[asyncio.Condition] = None
+        self.successes = 0
+        self.throttles = 0
+        self.decreases = 0
+        self._wait_ms: deque = deque(maxlen=256)
+
+    @property
+    def cond(self) -> asyncio.Condition:
+        # Created on first use, inside the running loop
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    def _refill(self, now: float) -> None:
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        else:
+            self._tokens = float(self.burst)  # No request rate configured: window only
+        self._refilled = now
+
+    def _admit_after(self, now: float) -> Optional[float]:
+        """0 if a call can start now, else seconds to wait (None: until a slot frees)"""
+        if now < self._resume_at:
+            return self._resume_at - now
+        if self.in_flight >= int(self.window):
+            return None
+        self._refill(now)
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    async def acquire(self) -> Slot:
+        started = time.monotonic()
+        async with self.cond:
+            self.waiting += 1
+            reported = False
+            try:
+                while True:
+                    wait = self._admit_after(time.monotonic())
+                    if wait == 0.0:
+                        break
+                    if not reported:
+                        progress.report("queued", limiter=self.name, waiting=self.waiting)
+                        reported = True
+                    try:
+                        await asyncio.wait_for(self.cond.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                self.waiting -= 1
+            self._tokens -= 1
+            self.in_flight += 1
+        self._wait_ms.append((time.monotonic() - started) * 1000)
+        return Slot(self.epoch)
+
+    async def release(self, slot: Slot, succeeded: bool) -> None:
+        async with self.cond:
+            self.in_flight -= 1
+            if slot.throttled_for is not None:
+                self.throttles += 1
+                self._tokens = 0.0
+                self._resume_at = max(self._resume_at, time.monotonic() + slot.throttled_for)
+                if slot.epoch == self.epoch:
+                    self.window = max(1.0, self.window * self.backoff)
+                    self.epoch += 1
+                    self.decreases += 1
+                    print(f"🚦 {self.name}: 429, window -> {int(self.window)}, "
+                          f"paused {slot.throttled_for:.1f}s")
+            elif succeeded:
+                self.successes += 1
+                self.window = min(float(self.max_window), self.window + 1 / self.window)
+            self.cond.notify_all()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[Slot]:
+        """Wait for admission; the slot is released (and the window adjusted) on exit"""
+        if not settings.rate_limit_enabled:
+            yield Slot(self.epoch)
+            return
+        slot = await self.acquire()
+        succeeded = False
+        try:
+            yield slot
+            succeeded = True
+        finally:
+            # A cancelled caller must not leak its slot
+            await asyncio.shield(self.release(slot, succeeded))
+
+    def stats(self) -> dict:
+        ordered = sorted(self._wait_ms)
+        return {
+            "window": int(self.window),
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "paused_s": round(max(0.0, self._resume_at - time.monotonic()), 1),
+            "successes": self.successes,
+            "throttles": self.throttles,
+            "decreases": self.decreases,
+            "p95_wait_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1) if ordered else 0.0,
+        }
+
+
+class RateLimiters:
+    """Limiters by (provider, model), created on first use"""
+
+    def __init__(self):
+        self._limiters: dict[tuple[str, str], AdaptiveLimiter] = {}
+
+    def get(self, provider: str, model: str) -> AdaptiveLimiter:
+        """provider: "openai" (images), "openai_chat" (chat / vision) or "replicate" (predictions)"""
+        key = (provider, model)
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            rpm = {
+                "openai": settings.openai_requests_per_minute,
+                "openai_chat": settings.openai_chat_requests_per_minute,
+                "replicate": settings.replicate_requests_per_minute,
+            }.get(provider, 0.0)
+            initial_window = {
+                "openai_chat": settings.openai_chat_initial_window,
+            }.get(provider, settings.rate_limit_initial_window)
+            limiter = AdaptiveLimiter(
+                name=f"{provider}/{model}",
+                requests_per_minute=rpm,
+                burst=settings.rate_limit_burst,
+                initial_window=initial_window,
+                max_window=settings.rate_limit_max_window,
+                backoff=settings.rate_limit_backoff,
+            )
+            self._limiters[key] = limiter
+        return limiter
+
+    def stats(self) -> dict:
+        return {limiter.name: limiter.stats() for limiter in self._limiters.values()}
+
+
+# Singleton instance
+rate_limiters = RateLimiters()
@@ -1,27 +1,127 @@
 import replicate
 import replicate.exceptions
 import base64
-import httpx
 from typing import Optional
 import io
 import time
 import re
 from PIL import Image
 import asyncio
-from functools import partial
 
 from config import settings
+from services import progress
+from services.http_client import http_pool
+from services.image_result import ImageResult
+from services.image_pipeline import ImageSource, prepare_image_async, REPLICATE_IMAGE_SPEC
+from services.circuit_breaker import circuit_breakers
+from services.rate_limiter import rate_limiters
 
+# "Request was throttled. Your rate limit resets in ~5s."
+RATE_LIMIT_RESET = re.compile(r'resets in ~?(\d+)s')
 
-def run_with_retry(
+_client: Optional[replicate.Client] = None
+
+
+def get_client() -> replicate.Client:
+    """Shared Replicate client (one pooled async HTTP client for every prediction)"""
+    global _client
+    if _client is None:
+        _client = replicate.Client(api_token=settings.replicate_api_token or None)
+    return _client
+
+
+def is_rate_limited(error: Exception) -> bool:
+    if getattr(error, "status", None) == 429:
+        return True
+    error_str = str(error).lower()
+    return "429" in error_str or "throttled" in error_str or "rate limit" in error_str
+
+
+def retry_delay(error: Exception, attempt: int, initial_delay: float = 2.0) -> float:
+    """Seconds to wait after a 429: the "resets in ~Ns" hint + 1s, else exponential backoff, capped at 60s"""
+    reset_match = RATE_LIMIT_RESET.search(str(error))
+    if reset_match:
+        wait_time = int(reset_match.group(1)) + 1  # Add 1s buffer
+    else:
+        # Exponential backoff: 2s, 4s, 8s, 16s, 32s
+        wait_time = initial_delay * (2 ** attempt)
+    return min(wait_time, 60)
+
+
+async def create_prediction(model: str, input_params: dict) -> replicate.prediction.Prediction:
+    """
+    Start a prediction without waiting for it.
+    
+    Args:
+        model: "owner/name" (official model) or "owner/name:version"
+        input_params: Input parameters for the model
+    """
+    client = get_client()
+    name, _, version = model.partition(":")
+    if version:
+        return await client.predictions.async_create(version=version, input=input_params)
+    return await client.models.predictions.async_create(model=name, input=input_params)
+
+
+async def wait_for_prediction(prediction: replicate.prediction.Prediction) -> any:
+    """
+    Poll a prediction until it finishes and return its output. The
+    prediction is cancelled on Replicate if it times out or the caller goes
+    away, so abandoned requests stop using GPU time.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.replicate_prediction_timeout
+    attempt = 0
+    reported = (None, None)
+    
+    try:
+        while prediction.status not in ("succeeded", "failed", "canceled"):
+            # Replicate's own queue ("starting"), then the model's log tail as it runs
+            log = (prediction.logs or "").strip().rsplit("\n", 1)[-1]
+            if (prediction.status, log) != reported:
+                reported = (prediction.status, log)
+                if prediction.status == "starting":
+                    progress.report("queued", provider="replicate")
+                else:
+                    progress.report("generating", provider="replicate", log=log or None)
+            if loop.time() > deadline:
+                raise TimeoutError(
+                    f"Prediction {prediction.id} still {prediction.status} after {settings.replicate_prediction_timeout:.0f}s"
+                )
+            await asyncio.sleep(settings.replicate_poll_interval)
+            try:
+                await prediction.async_reload()
+                attempt = 0
+            except replicate.exceptions.ReplicateError as e:
+                if not is_rate_limited(e):
+                    raise
+                await asyncio.sleep(retry_delay(e, attempt))
+                attempt += 1
+    except (asyncio.CancelledError, TimeoutError):
+        try:
+            await prediction.async_cancel()
+            print(f"🛑 Cancelled prediction {prediction.id}")
+        except Exception as e:
+            print(f"⚠️ Failed to cancel prediction {prediction.id}: {e}")
+        raise
+    
+    if prediction.status != "succeeded":
+        raise replicate.exceptions.ModelError(prediction)
+    return prediction.output
+
+
+async def run_with_retry(
     model: str,
     input_params: dict,
     max_retries: int = 5,
     initial_delay: float = 2.0,
 ) -> any:
     """
-    Run a Replicate model with automatic retry on rate limit (429) errors.
-    Uses exponential backoff with jitter.
+    Run a Replicate model without blocking the event loop: create the
+    prediction and poll it with asyncio.sleep. Runs are admitted by the
+    shared per-model limiter; a 429 pauses it for the reset time Replicate
+    reports (or exponential backoff), and the retry queues there. While the
+    model's circuit breaker is open, it fails at once with CircuitOpenError.
     
     Args:
         model: The Replicate model identifier
@@ -30,110 +130,59 @@ def run_with_retry(
         initial_delay: Initial delay in seconds before first retry (default 2.0)
     
     Returns:
-        The model output
+        The model output (a URL or list of URLs for image models)
     
     Raises:
         replicate.exceptions.ReplicateError: If all retries are exhausted
+        replicate.exceptions.ModelError: If the prediction fails or is cancelled
+        TimeoutError: If it runs past REPLICATE_PREDICTION_TIMEOUT
+        CircuitOpenError: If the model's circuit is open
     """
-    last_error = None
+    limiter = rate_limiters.get("replicate", model.split(":")[0])
+    breaker = circuit_breakers.get("replicate", model.split(":")[0])
     
-    for attempt in range(max_retries + 1):
-        try:
-            return replicate.run(model, input=input_params)
-        except replicate.exceptions.ReplicateError as e:
-            last_error = e
-            error_str = str(e)
-            
-            # Check if this is a rate limit error (429)
-            if "429" in error_str or "throttled" in error_str.lower() or "rate limit" in error_str.lower():
-                if attempt < max_retries:
-                    # Parse reset time from error message if available
-                    reset_match = re.search(r'resets in ~?(\d+)s', error_str)
-                    if reset_match:
-                        wait_time = int(reset_match.group(1)) + 1  # Add 1s buffer
-                    else:
-                        # Exponential backoff: 2s, 4s, 8s, 16s, 32s
-                        wait_time = initial_delay * (2 ** attempt)
-                    
-                    # Cap at 60 seconds
-                    wait_time = min(wait_time, 60)
-                    
-                    print(f"⏳ Rate limited (attempt {attempt + 1}/{max_retries + 1}). Waiting {wait_time:.1f}s before retry...")
-                    time.sleep(wait_time)
+    async with breaker.guard():
+        for attempt in range(max_retries + 1):
+            # The slot is held until the prediction finishes: the window bounds running predictions
+            async with limiter.slot() as slot:
+                started = time.time()
+                progress.report("uploading", provider="replicate", model=model.split(":")[0])
+                try:
+                    prediction = await create_prediction(model, input_params)
+                except replicate.exceptions.ReplicateError as e:
+                    if not is_rate_limited(e) or attempt == max_retries:
+                        raise
+                    wait_time = retry_delay(e, attempt, initial_delay)
+                    slot.throttled(wait_time)
+                    print(f"⏳ Rate limited (attempt {attempt + 1}/{max_retries + 1}). Retrying in {wait_time:.1f}s...")
                     continue
-            
-            # Not a rate limit error, or we've exhausted retries - re-raise
-            raise
-    
-    # If we've exhausted all retries, raise the last error
-    raise last_error
-
-
-async def run_with_retry_async(
-    model: str,
-    input_params: dict,
-    max_retries: int = 5,
-    initial_delay: float = 2.0,
-) -> any:
-    """
-    Async version of run_with_retry. Runs the synchronous Replicate call
-    in a thread pool to avoid blocking.
-    """
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(
-        None,
-        partial(run_with_retry, model, input_params, max_retries, initial_delay)
-    )
+                output = await wait_for_prediction(prediction)
+                print(f"   Prediction {prediction.id} ({model.split(':')[0]}) finished in {time.time() - started:.1f}s")
+                return output
 
 
 class ReplicateService:
     def __init__(self):
-        self.configured = False
-        if settings.replicate_api_token:
-            # Set the API token for replicate
-            import os
-            os.environ["REPLICATE_API_TOKEN"] = settings.replicate_api_token
-            self.configured = True
+        # Predictions go through the shared client from get_client()
+        self.configured = bool(settings.replicate_api_token)
     
     def _image_to_data_uri(self, image_base64: str) -> str:
         """Convert base64 to data URI for Replicate"""
         return f"data:image/png;base64,{image_base64}"
     
-    def _prepare_image(self, image_base64: str, max_size: int = 1024) -> tuple[str, int, int]:
-        """Prepare and resize image, return as data URI with dimensions"""
-        image_data = base64.b64decode(image_base64)
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Convert to RGB if needed (Flux doesn't like RGBA)
-        if image.mode in ('RGBA', 'P'):
-            image = image.convert('RGB')
-        
-        # Resize if too large
-        if max(image.size) > max_size:
-            ratio = max_size / max(image.size)
-            new_size = (int(image.size[0] * ratio), int(image.size[1] * ratio))
-            image = image.resize(new_size, Image.Resampling.LANCZOS)
-        
-        width, height = image.size
-        
-        # Convert back to base64
-        buffer = io.BytesIO()
-        image.save(buffer, format="JPEG", quality=95)
-        new_base64 = base64.b64encode(buffer.getvalue()).decode()
-        
-        return f"data:image/jpeg;base64,{new_base64}", width, height
-    
-    def _run_replicate_sync(self, model: str, input_params: dict):
-        """Run replicate synchronously with retry logic (will be wrapped in async executor)"""
-        return run_with_retry(model, input_params)
+    async def _prepare_image(self, image_base64: ImageSource) -> tuple[str, int, int]:
+        """Prepare and resize image (RGB JPEG, max 1024px), return as data URI with dimensions"""
+        prepared = await prepare_image_async(image_base64, REPLICATE_IMAGE_SPEC)
+        width, height = prepared.size
+        return prepared.data_uri, width, height
     
     async def generate_image(
         self,
         prompt: str,
-        image_base64: str,
+        image_base64: ImageSource,
         strength: float = 0.75,
         style: str = "architectural"
-    ) -> tuple[str, str]:
+    ) -> ImageResult:
         """
         Generate image using SDXL img2img on Replicate.
         Uses the actual image as starting point!
@@ -145,13 +194,13 @@ class ReplicateService:
             style: Style preset
         
         Returns:
-            (image_url, image_base64)
+            ImageResult with the generated image
         """
         if not self.configured:
             raise ValueError("Replicate API token not configured. Set REPLICATE_API_TOKEN in .env")
         
         # Prepare the image and get dimensions
-        image_uri, width, height = self._prepare_image(image_base64)
+        image_uri, width, height = await self._prepare_image(image_base64)
         
         # Enhance prompt for architectural renders
         style_additions = {
@@ -172,25 +221,20 @@ class ReplicateService:
         
         # Use stability-ai/sdxl with img2img mode
         # This ACTUALLY uses your image as the starting point
-        loop = asyncio.get_event_loop()
-        output = await loop.run_in_executor(
-            None,
-            partial(
-                self._run_replicate_sync,
-                "stability-ai/sdxl:7762fd07cf82c948538e41f63f77d685e02b063e37e496e96eefd46c929f9bdc",
-                {
-                    "prompt": enhanced_prompt,
-                    "image": image_uri,  # THIS is the key - init image
-                    "prompt_strength": strength,  # How much to deviate from init image
-                    "num_outputs": 1,
-                    "scheduler": "K_EULER",
-                    "num_inference_steps": 30,
-                    "guidance_scale": 7.5,
-                    "negative_prompt": "blurry, low quality, distorted, ugly, bad proportions, unrealistic",
-                    "refine": "expert_ensemble_refiner",
-                    "refine_steps": 10,
-                }
-            )
+        output = await run_with_retry(
+            "stability-ai/sdxl:7762fd07cf82c948538e41f63f77d685e02b063e37e496e96eefd46c929f9bdc",
+            {
+                "prompt": enhanced_prompt,
+                "image": image_uri,  # THIS is the key - init image
+                "prompt_strength": strength,  # How much to deviate from init image
+                "num_outputs": 1,
+                "scheduler": "K_EULER",
+                "num_inference_steps": 30,
+                "guidance_scale": 7.5,
+                "negative_prompt": "blurry, low quality, distorted, ugly, bad proportions, unrealistic",
+                "refine": "expert_ensemble_refiner",
+                "refine_steps": 10,
+            }
         )
         
         print(f"✅ Replicate: SDXL img2img complete!")
@@ -202,23 +246,15 @@ class ReplicateService:
             image_url = str(output)
         
         # Download the image
-        async with httpx.AsyncClient() as client:
-            response = await client.get(image_url)
-            image_bytes = response.content
-        
-        # Convert to base64
-        image_base64_result = base64.b64encode(image_bytes).decode()
+        image_bytes = await http_pool.download(image_url)
         
-        # Create data URL
-        data_url = f"data:image/png;base64,{image_base64_result}"
-        
-        return data_url, image_base64_result
+        return ImageResult(data=image_bytes)
     
     async def style_transfer(
         self,
         prompt: str,
-        image_base64: str,
-    ) -> tuple[str, str]:
+        image_base64: ImageSource,
+    ) -> ImageResult:
         """
         Pure style transfer using ControlNet Canny.
         Extracts edges from your photo and generates a render following those EXACT edges.
@@ -227,30 +263,25 @@ class ReplicateService:
         if not self.configured:
             raise ValueError("Replicate API token not configured. Set REPLICATE_API_TOKEN in .env")
         
-        image_uri, width, height = self._prepare_image(image_base64)
+        image_uri, width, height = await self._prepare_image(image_base64)
         
         print(f"🎨 Replicate: Style transfer with ControlNet Canny...")
         print(f"   This preserves EXACT edges and structure")
         print(f"   Prompt: {prompt[:80]}...")
         
         # Use a modern SDXL ControlNet model
-        loop = asyncio.get_event_loop()
-        output = await loop.run_in_executor(
-            None,
-            partial(
-                self._run_replicate_sync,
-                "xlabs-ai/flux-dev-controlnet:f2c31c31d81278a91b2447a304dae654c64a5d5a70340fba811bb1cbd41019a2",
-                {
-                    "prompt": prompt,
-                    "control_image": image_uri,
-                    "control_type": "canny",
-                    "control_strength": 0.9,  # HIGH - follow edges closely
-                    "num_outputs": 1,
-                    "guidance_scale": 3.5,
-                    "num_inference_steps": 28,
-                    "output_format": "png",
-                }
-            )
+        output = await run_with_retry(
+            "xlabs-ai/flux-dev-controlnet:f2c31c31d81278a91b2447a304dae654c64a5d5a70340fba811bb1cbd41019a2",
+            {
+                "prompt": prompt,
+                "control_image": image_uri,
+                "control_type": "canny",
+                "control_strength": 0.9,  # HIGH - follow edges closely
+                "num_outputs": 1,
+                "guidance_scale": 3.5,
+                "num_inference_steps": 28,
+                "output_format": "png",
+            }
         )
         
         if isinstance(output, list) and len(output) > 0:
@@ -260,16 +291,11 @@ class ReplicateService:
         
         print(f"   Output URL: {image_url[:50]}...")
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(image_url)
-            image_bytes = response.content
-        
-        image_base64_result = base64.b64encode(image_bytes).decode()
-        data_url = f"data:image/png;base64,{image_base64_result}"
+        image_bytes = await http_pool.download(image_url)
         
         print("✅ Replicate: ControlNet style transfer complete!")
         
-        return data_url, image_base64_result
+        return ImageResult(data=image_bytes)
 
 
 # Singleton instance
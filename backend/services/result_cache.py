@@ -0,0 +1,191 @@
+"""
+Generation result cache with single-flight deduplication.
+
+A render or edit costs 30-90 seconds of provider time, and the same request
+arrives again more often than you'd think: double-clicked Generate buttons,
+frontend retries after a timeout, re-rendering an upload with the same
+preset. Results are cached under a hash of everything that determines them
+(input / mask / reference image hashes, the final provider prompt, model,
+quality, style, mode), in two tiers:
+
+- memory: byte-bounded LRU (the prepared-variant cache class)
+- disk: files under RESULT_CACHE_PATH, pruned least-recently-used past
+  RESULT_CACHE_DISK_BYTES (the local image store class)
+
+Identical requests that arrive while the first is still running attach to
+its task instead of calling the provider again. The shared task is shielded,
+so the first client disconnecting doesn't fail the others; once every waiter
+is gone (disconnected, or the losing side of a hedge) the task is cancelled
+along with its provider call.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional
+
+from pydantic import BaseModel
+
+from config import settings
+from services.image_pipeline import PreparedImageCache, content_hash, source_bytes
+from services.image_result import ImageResult
+from services.image_store import LocalImageStore, sniff_mime_type
+
+
+@dataclass
+class CachedResult:
+    data: bytes
+    mime_type: str
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.data)
+
+
+def input_hash(source: Any) -> Any:
+    """Hash of an image, compact mask or list of either (None stays None)"""
+    if source is None:
+        return None
+    if isinstance(source, (list, tuple)):
+        return [input_hash(item) for item in source]
+    if isinstance(source, BaseModel):
+        return hashlib.sha256(source.model_dump_json().encode()).hexdigest()
+    return content_hash(source_bytes(source))
+
+
+def result_key(**parts: Any) -> str:
+    """Cache key for a generation; parts must be JSON-serializable (hash images with input_hash)"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ResultCache:
+    def __init__(self):
+        self.memory = PreparedImageCache(settings.result_cache_memory_bytes)
+        self._disk: Optional[LocalImageStore] = None
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._waiters: dict[asyncio.Task, int] = {}
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.joined = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    @property
+    def disk(self) -> Optional[LocalImageStore]:
+        if self._disk is None and settings.result_cache_disk_bytes > 0:
+            self._disk = LocalImageStore(settings.result_cache_path, settings.result_cache_disk_bytes)
+        return self._disk
+
+    def _count(self, counter: str, saved: int = 0) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+            self.bytes_saved += saved
+
+    async def _lookup(self, key: str) -> Optional[CachedResult]:
+        cached = self.memory.get(key)
+        if cached is not None:
+            self._count("memory_hits", cached.nbytes)
+            return cached
+        try:
+            disk = self.disk
+            data = await asyncio.to_thread(disk.get, key) if disk is not None else None
+        except OSError as e:
+            print(f"⚠️ Result cache read failed: {e}")
+            return None
+        if data is None:
+            return None
+        cached = CachedResult(data=data, mime_type=sniff_mime_type(data))
+        self.memory.put(key, cached)
+        self._count("disk_hits", cached.nbytes)
+        return cached
+
+    async def _store(self, key: str, result: ImageResult) -> None:
+        cached = CachedResult(data=result.data, mime_type=result.mime_type)
+        self.memory.put(key, cached)
+        try:
+            disk = self.disk
+            if disk is not None:
+                await asyncio.to_thread(disk.put, key, cached.data)
+        except OSError as e:
+            # A full or read-only disk costs a future cache hit, not this request
+            print(f"⚠️ Result cache write failed: {e}")
+
+    async def get(self, key: str) -> Optional[ImageResult]:
+        """The cached result for key or the in-flight one; None (nothing started) if neither"""
+        if not settings.result_cache_enabled:
+            return None
+
+        cached = await self._lookup(key)
+        if cached is not None:
+            print(f"♻️ Result cache hit ({key[:12]})")
+            return ImageResult(data=cached.data, mime_type=cached.mime_type)
+
+        task = self._inflight.get(key)
+        if task is not None:
+            print(f"🔗 Joining in-flight generation ({key[:12]})")
+            result = await self._wait(key, task)
+            self._count("joined", len(result.data))
+            return result
+        return None
+
+    async def get_or_create(self, key: str, create: Callable[[], Awaitable[ImageResult]]) -> ImageResult:
+        """The cached result for key, the in-flight one, or a new one from create()"""
+        if not settings.result_cache_enabled:
+            return await create()
+
+        result = await self.get(key)
+        if result is not None:
+            return result
+
+        async def run() -> ImageResult:
+            result = await create()
+            await self._store(key, result)
+            return result
+
+        self._count("misses")
+        task = asyncio.ensure_future(run())
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._finished(key, done))
+        return await self._wait(key, task)
+
+    async def _wait(self, key: str, task: asyncio.Task) -> ImageResult:
+        """Await the shared task; the last waiter to be cancelled cancels it too"""
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters[task] == 1 and not task.done():
+                print(f"🛑 No one waiting, cancelling generation ({key[:12]})")
+                task.cancel()
+            raise
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+
+    def _finished(self, key: str, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        # Every waiter may have disconnected; don't leave the error unretrieved
+        if not task.cancelled() and task.exception() is not None:
+            print(f"⚠️ Generation failed, not cached ({key[:12]}): {task.exception()}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits + self.joined
+            total = hits + self.misses
+            return {
+                "memory": self.memory.stats(),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "joined_in_flight": self.joined,
+                "misses": self.misses,
+                "in_flight": len(self._inflight),
+                "hit_ratio": hits / total if total else 0.0,
+                "bytes_saved": self.bytes_saved,
+            }
+
+
+# Singleton instance
+result_cache = ResultCache()
@@ -0,0 +1,210 @@
+"""
+Click-to-mask segmentation.
+
+Replaces the frontend's RGB flood fill. Each click grows a region of
+perceptually similar colour (CIELAB distance to the clicked colour) that is
+connected to the click, computed as one vectorized threshold plus
+scipy.ndimage.label instead of a pixel-by-pixel fill. Positive clicks are
+unioned and cleaned up morphologically, negative clicks then carve their
+region back out, and the result is scaled to the source resolution.
+
+The smoothed Lab image is the expensive part (decode, downscale, bilateral
+filter, colour conversion), so it is cached per source image: the first
+click on an image pays for it, later clicks only threshold and label. A
+burst of clicks on a new image waits for the one conversion in progress.
+"""
+import asyncio
+import io
+from dataclasses import dataclass
+from typing import Optional
+
+import cv2
+import numpy as np
+from PIL import Image
+from scipy import ndimage
+
+from config import settings
+from services.cpu_pool import cpu_pool
+from services.image_pipeline import ImageSpec, PreparedImageCache, content_hash, load_image
+
+# Working resolution for segmentation; masks are scaled back up to the source
+SEGMENT_IMAGE_SPEC = ImageSpec(max_size=settings.segment_max_size, mode="RGB", format="PNG", name="segment")
+
+# Default CIE76 distance from the clicked colour (roughly the old RGB tolerance of 32)
+DEFAULT_TOLERANCE = 12.0
+
+# Half-width of the window averaged for the clicked colour
+SEED_RADIUS = 2
+
+
+@dataclass
+class LabImage:
+    """Smoothed working-resolution Lab pixels for a source image"""
+    lab: np.ndarray  # (h, w, 3) float32: L in 0-100, a/b roughly -128-127
+    source_size: tuple[int, int]  # (width, height) of the source image
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self.lab.shape[1], self.lab.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.lab.nbytes
+
+
+@dataclass
+class ClickPoint:
+    x: float  # Source image pixels
+    y: float
+    positive: bool = True
+
+
+@dataclass
+class SegmentResult:
+    mask_png: bytes  # 1-bit PNG at source size, white = selected
+    size: tuple[int, int]
+    bounds: Optional[tuple[int, int, int, int]]  # (x, y, width, height) in source pixels
+    coverage: float  # Selected share of the image
+
+
+def build_lab_image(data: bytes) -> LabImage:
+    """Decode, downscale and smooth an image into Lab (runs on the CPU pool)"""
+    with Image.open(io.BytesIO(data)) as header:
+        source_size = header.size
+
+    rgb = np.asarray(load_image(data, SEGMENT_IMAGE_SPEC))
+    # Edge-preserving smoothing so texture and JPEG noise don't fragment regions
+    rgb = cv2.bilateralFilter(rgb, d=7, sigmaColor=30, sigmaSpace=7)
+    lab = cv2.cvtColor(rgb.astype(np.float32) / 255.0, cv2.COLOR_RGB2Lab)
+    return LabImage(lab=lab, source_size=source_size)
+
+
+def _to_working(image: LabImage, point: ClickPoint) -> tuple[int, int]:
+    width, height = image.size
+    source_width, source_height = image.source_size
+    x = int(point.x * width / source_width)
+    y = int(point.y * height / source_height)
+    return min(max(x, 0), width - 1), min(max(y, 0), height - 1)
+
+
+def _grow_region(lab: np.ndarray, x: int, y: int, tolerance: float) -> np.ndarray:
+    """Pixels within tolerance of the clicked colour and connected to the click"""
+    window = lab[max(0, y - SEED_RADIUS):y + SEED_RADIUS + 1, max(0, x - SEED_RADIUS):x + SEED_RADIUS + 1]
+    seed = window.reshape(-1, 3).mean(axis=0)
+
+    diff = lab - seed
+    similar = np.einsum("ijk,ijk->ij", diff, diff) <= tolerance * tolerance
+
+    labels, _ = ndimage.label(similar)
+    region_label = labels[y, x]
+    if region_label == 0:
+        # The clicked pixel itself is an outlier against its neighbourhood
+        return np.zeros(similar.shape, dtype=bool)
+    return labels == region_label
+
+
+def _fill_holes(mask: np.ndarray) -> np.ndarray:
+    """
+    Unselected components that don't touch the border are holes (windows,
+    signage). One labelling pass; ~3x faster than ndimage.binary_fill_holes.
+    """
+    labels, count = ndimage.label(~mask)
+    is_hole = np.ones(count + 1, dtype=bool)
+    is_hole[0] = False
+    is_hole[labels[0]] = is_hole[labels[-1]] = is_hole[labels[:, 0]] = is_hole[labels[:, -1]] = False
+    return mask | is_hole[labels]
+
+
+def _clean_mask(mask: np.ndarray, seeds: list[tuple[int, int]]) -> np.ndarray:
+    """Drop speckle and thin bridges, seal cracks, fill holes; keep the clicked components"""
+    radius = max(1, round(min(mask.shape) / 300))
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * radius + 1, 2 * radius + 1))
+    cleaned = cv2.morphologyEx(mask.astype(np.uint8), cv2.MORPH_OPEN, kernel)
+    cleaned = cv2.morphologyEx(cleaned, cv2.MORPH_CLOSE, kernel).astype(bool)
+    cleaned = _fill_holes(cleaned)
+
+    # Opening can split off fragments; keep only components under a click
+    labels, count = ndimage.label(cleaned)
+    keep = np.zeros(count + 1, dtype=bool)
+    for x, y in seeds:
+        keep[labels[y, x]] = True
+    keep[0] = False
+    if not keep.any():
+        # Every click landed on something the opening removed (thin poles, wires)
+        return mask
+    return keep[labels]
+
+
+def segment(image: LabImage, points: list[ClickPoint], tolerance: float = DEFAULT_TOLERANCE) -> SegmentResult:
+    """Mask for a set of clicks (runs on the CPU pool)"""
+    mask = np.zeros(image.lab.shape[:2], dtype=bool)
+    seeds = []
+    for point in points:
+        if point.positive:
+            x, y = _to_working(image, point)
+            mask |= _grow_region(image.lab, x, y, tolerance)
+            seeds.append((x, y))
+    if mask.any():
+        mask = _clean_mask(mask, seeds)
+    # After the cleanup, whose hole filling would put back a region carved out of the middle
+    for point in points:
+        if not point.positive:
+            mask &= ~_grow_region(image.lab, *_to_working(image, point), tolerance)
+
+    # Linear upscale then threshold gives smooth edges instead of working-res stair steps
+    source_width, source_height = image.source_size
+    full = cv2.resize(mask.astype(np.uint8) * 255, image.source_size, interpolation=cv2.INTER_LINEAR) >= 128
+
+    bounds = None
+    ys, xs = np.nonzero(full.any(axis=1))[0], np.nonzero(full.any(axis=0))[0]
+    if len(xs):
+        bounds = (int(xs[0]), int(ys[0]), int(xs[-1] - xs[0] + 1), int(ys[-1] - ys[0] + 1))
+
+    # 1-bit PNG: zlib sees 8x less data than an 8-bit mask, ~2x faster to encode
+    packed = Image.frombytes("1", image.source_size, np.packbits(full, axis=1).tobytes())
+    buffer = io.BytesIO()
+    packed.save(buffer, format="PNG", compress_level=1)
+
+    return SegmentResult(
+        mask_png=buffer.getvalue(),
+        size=(source_width, source_height),
+        bounds=bounds,
+        coverage=float(mask.mean()),
+    )
+
+
+async def segment_image_async(
+    data: bytes,
+    points: list[ClickPoint],
+    tolerance: float = DEFAULT_TOLERANCE,
+) -> SegmentResult:
+    """segment() for async handlers, reusing the cached Lab image for repeat clicks"""
+    key = (content_hash(data), SEGMENT_IMAGE_SPEC)
+    image = lab_cache.get(key)
+    if image is None:
+        task = _inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(_build_lab_async(data, key))
+            _inflight[key] = task
+            task.add_done_callback(lambda done: _build_finished(key, done))
+        # Shielded: one click's request going away doesn't fail the build for the others
+        image = await asyncio.shield(task)
+    return await cpu_pool.run(segment, image, points, tolerance)
+
+
+async def _build_lab_async(data: bytes, key: tuple) -> LabImage:
+    image = await cpu_pool.run(build_lab_image, data)
+    lab_cache.put(key, image)
+    return image
+
+
+def _build_finished(key: tuple, task: asyncio.Task) -> None:
+    _inflight.pop(key, None)
+    # Every waiter may have gone away; don't leave the error unretrieved
+    if not task.cancelled():
+        task.exception()
+
+
+# Singleton instances
+lab_cache = PreparedImageCache(settings.segment_cache_max_bytes)
+_inflight: dict[tuple, asyncio.Task] = {}  # Lab conversions in progress, keyed like lab_cache
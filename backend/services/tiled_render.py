@@ -0,0 +1,188 @@
+"""
+Tiled high-resolution renders.
+
+gpt-image-1 outputs at most 1536x1024, so a render of a 6000px photo comes
+back at a sixth of its resolution. Tiled mode splits the output frame into
+overlapping square tiles, renders each tile from the matching window of the
+source, and stitches the results:
+
+- every tile gets the same prompt plus the whole (downscaled) photo as
+  context, so lighting, sky and grading agree across tiles
+- up to TILED_RENDER_CONCURRENCY tiles are in flight at once, so a render
+  takes roughly one tile's latency per round rather than one per tile
+- tiles are blended over their left / top neighbours with linear ramps across
+  the overlap, which hides the seams
+- the canvas is a memory-mapped file, so an 8K render doesn't hold a
+  full-resolution working copy in RAM
+
+The provider call is a callback, so this module knows nothing about OpenAI.
+"""
+import asyncio
+import io
+import math
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from config import settings
+from services.compositing import blend, resample_window
+from services import progress
+from services.cpu_pool import cpu_pool
+from services.image_pipeline import ImageSpec, PreparedImage, load_image
+from services.image_result import ImageResult
+
+
+@dataclass(frozen=True)
+class Tile:
+    """One output tile, in output-frame pixels"""
+    row: int
+    col: int
+    x: int
+    y: int
+    width: int
+    height: int
+    overlap_left: int  # Columns shared with the tile to the left (0 on the first column)
+    overlap_top: int   # Rows shared with the tile above (0 on the first row)
+
+
+@dataclass(frozen=True)
+class TileGrid:
+    size: tuple[int, int]  # Output (width, height)
+    rows: int
+    cols: int
+    tiles: list[Tile]
+
+
+# Renders one tile: (tile input image, tile, grid) -> provider output bytes
+RenderTile = Callable[[PreparedImage, Tile, TileGrid], Awaitable[bytes]]
+
+
+def output_size(source_size: tuple[int, int], long_side: Optional[int] = None) -> tuple[int, int]:
+    """The source scaled to long_side (default: its own size, capped at TILED_RENDER_MAX_SIZE)"""
+    long_side = min(long_side or max(source_size), settings.tiled_render_max_size)
+    ratio = long_side / max(source_size)
+    return max(1, round(source_size[0] * ratio)), max(1, round(source_size[1] * ratio))
+
+
+def _axis(length: int, tile: int, overlap: int) -> list[tuple[int, int, int]]:
+    """(start, extent, overlap with the previous tile) along one axis"""
+    if length <= tile:
+        return [(0, length, 0)]
+    count = math.ceil((length - overlap) / (tile - overlap))
+    # Spread evenly, so every overlap is at least `overlap`; with few tiles on an axis it
+    # can be several times that (2000px in 1024px tiles overlaps by 536px), which only
+    # widens the blend ramps
+    starts = [round(i * (length - tile) / (count - 1)) for i in range(count)]
+    return [(start, tile, (starts[i - 1] + tile - start) if i else 0) for i, start in enumerate(starts)]
+
+
+def plan_tiles(size: tuple[int, int], tile: int, overlap: int) -> TileGrid:
+    """Row-major tiles covering size, each tile x tile except on frames smaller than a tile"""
+    if not 0 <= overlap < tile:
+        raise ValueError(f"Tile overlap must be in [0, {tile}), got {overlap}")
+    columns = _axis(size[0], tile, overlap)
+    rows = _axis(size[1], tile, overlap)
+    tiles = [
+        Tile(row=r, col=c, x=x, y=y, width=w, height=h, overlap_left=ol, overlap_top=ot)
+        for r, (y, h, ot) in enumerate(rows)
+        for c, (x, w, ol) in enumerate(columns)
+    ]
+    return TileGrid(size=size, rows=len(rows), cols=len(columns), tiles=tiles)
+
+
+def decode_source(data: bytes, size: tuple[int, int]) -> np.ndarray:
+    """RGB source pixels, downscaled (never upscaled) toward the output size"""
+    spec = ImageSpec(max_size=max(size), mode="RGB", format="PNG", name="tiled")
+    return np.asarray(load_image(data, spec))
+
+
+def tile_input(source: np.ndarray, grid: TileGrid, tile: Tile) -> PreparedImage:
+    """The source window under a tile, resampled to the tile's output size, as PNG"""
+    pixels = resample_window(source, grid.size, tile.x, tile.y, (tile.width, tile.height))
+    buffer = io.BytesIO()
+    Image.fromarray(pixels, mode="RGB").save(buffer, format="PNG", compress_level=1)
+    return PreparedImage(data=buffer.getvalue(), size=(tile.width, tile.height), mime_type="image/png")
+
+
+def _seam_weights(tile: Tile) -> np.ndarray:
+    """uint8 alpha for a tile: 0 -> 255 across its left / top overlaps, 255 elsewhere"""
+    def ramp(length: int, overlap: int) -> np.ndarray:
+        if not overlap:
+            return np.ones(length, dtype=np.float32)
+        return np.clip((np.arange(length, dtype=np.float32) + 0.5) / overlap, 0.0, 1.0)
+
+    weights = np.outer(ramp(tile.height, tile.overlap_top), ramp(tile.width, tile.overlap_left))
+    return (weights * 255 + 0.5).astype(np.uint8)
+
+
+def stitch_tiles(grid: TileGrid, results: list[bytes]) -> bytes:
+    """
+    Blend tile outputs, in row-major order, into a memory-mapped canvas and
+    encode it as PNG (runs on the CPU pool).
+    """
+    width, height = grid.size
+    fd, path = tempfile.mkstemp(suffix=".canvas", dir=settings.tiled_render_scratch_dir or None)
+    os.close(fd)
+    try:
+        # BGR, so the canvas feeds cv2.imencode without a converted copy
+        canvas = np.memmap(path, dtype=np.uint8, mode="w+", shape=(height, width, 3))
+        for tile, data in zip(grid.tiles, results):
+            pixels = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if pixels is None:
+                raise ValueError(f"Tile ({tile.row}, {tile.col}) output is not a readable image")
+            if pixels.shape[:2] != (tile.height, tile.width):
+                pixels = cv2.resize(pixels, (tile.width, tile.height), interpolation=cv2.INTER_AREA)
+            region = canvas[tile.y:tile.y + tile.height, tile.x:tile.x + tile.width]
+            blend(region, pixels, _seam_weights(tile))
+
+        # Level 1: 8K PNGs, where higher levels cost seconds for a few percent
+        ok, encoded = cv2.imencode(".png", canvas, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+        if not ok:
+            raise ValueError("Failed to encode the stitched render")
+        del canvas
+        return encoded.tobytes()
+    finally:
+        os.remove(path)
+
+
+async def render_tiled(
+    data: bytes,
+    render_tile: RenderTile,
+    long_side: Optional[int] = None,
+) -> ImageResult:
+    """Render data tile by tile through render_tile and stitch the results"""
+    with Image.open(io.BytesIO(data)) as header:
+        size = output_size(header.size, long_side)
+    grid = plan_tiles(size, settings.tiled_render_tile, settings.tiled_render_overlap)
+    source = await cpu_pool.run(decode_source, data, size)
+    print(f"🧩 Tiled render: {size[0]}x{size[1]} as {grid.rows}x{grid.cols} tiles, "
+          f"{settings.tiled_render_concurrency} in flight")
+
+    slots = asyncio.Semaphore(max(1, settings.tiled_render_concurrency))
+    done = 0
+
+    async def run(tile: Tile) -> bytes:
+        nonlocal done
+        async with slots:
+            image = await cpu_pool.run(tile_input, source, grid, tile)
+            result = await render_tile(image, tile, grid)
+        done += 1
+        progress.report("generating", tilesDone=done, tiles=len(grid.tiles))
+        return result
+
+    tasks = [asyncio.ensure_future(run(tile)) for tile in grid.tiles]
+    try:
+        results = await asyncio.gather(*tasks)
+    finally:
+        # One failed tile fails the render: don't pay for tiles nobody will stitch
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    del source
+    progress.report("compositing")
+    return ImageResult(data=await cpu_pool.run(stitch_tiles, grid, results))
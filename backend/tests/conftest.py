@@ -0,0 +1,10 @@
+"""
+Backend tests: run with `python -m pytest` from backend/.
+
+Provider clients are never called; tests drive the pure logic directly and
+stand in for provider calls with coroutines.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,215 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from replicate.exceptions import ModelError
+
+from config import settings
+from services import circuit_breaker
+from services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakers, CircuitOpenError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def breaker_settings(monkeypatch):
+    monkeypatch.setattr(settings, "breaker_enabled", True)
+    monkeypatch.setattr(settings, "breaker_window_seconds", 120.0)
+    monkeypatch.setattr(settings, "breaker_min_calls", 5)
+    monkeypatch.setattr(settings, "breaker_error_rate", 0.5)
+    monkeypatch.setattr(settings, "breaker_slow_call_seconds", 150.0)
+    monkeypatch.setattr(settings, "breaker_open_seconds", 30.0)
+    monkeypatch.setattr(settings, "routing_health_margin", 0.2)
+    monkeypatch.setattr(settings, "routing_prior_health", 0.9)
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", clock)
+    return clock
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def test_opens_at_error_rate_after_min_calls(clock):
+    breaker = CircuitBreaker("test")
+    for _ in range(4):
+        breaker.record(False, 1.0)
+    # Four failures are under BREAKER_MIN_CALLS
+    assert breaker.state == CLOSED
+    breaker.record(False, 1.0)
+    assert breaker.state == OPEN
+    assert breaker.opens == 1
+
+
+def test_slow_calls_count_as_failures(clock):
+    breaker = CircuitBreaker("test")
+    for _ in range(5):
+        breaker.record(True, 200.0)
+    assert breaker.state == OPEN
+
+
+def test_old_outcomes_leave_the_window(clock):
+    breaker = CircuitBreaker("test")
+    for _ in range(4):
+        breaker.record(False, 1.0)
+    clock.now += 121
+    breaker.record(False, 1.0)
+    assert breaker.state == CLOSED
+    assert breaker.failure_rate() == 1.0
+
+
+def test_open_fails_fast_then_probes(clock):
+    breaker = CircuitBreaker("test")
+    for _ in range(5):
+        breaker.record(False, 1.0)
+    with pytest.raises(CircuitOpenError) as raised:
+        breaker._admit()
+    assert raised.value.retry_after == pytest.approx(30.0)
+    assert breaker.rejected == 1
+
+    clock.now += 30
+    assert breaker._admit() is True
+    assert breaker.state == HALF_OPEN
+    # Only one probe at a time
+    with pytest.raises(CircuitOpenError):
+        breaker._admit()
+
+    breaker.record(True, 1.0, probe=True)
+    assert breaker.state == CLOSED
+    assert breaker.failure_rate() == 0.0
+
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker("test")
+    for _ in range(5):
+        breaker.record(False, 1.0)
+    clock.now += 30
+    assert breaker._admit() is True
+    breaker.record(False, 1.0, probe=True)
+    assert breaker.state == OPEN
+    assert breaker.opens == 2
+    assert not breaker.available()
+
+
+def test_guard_records_provider_failures_only():
+    breaker = CircuitBreaker("test")
+
+    async def call(error: Exception) -> None:
+        async with breaker.guard():
+            raise error
+
+    for status in (400, 401, 422, 429):
+        with pytest.raises(ProviderError):
+            asyncio.run(call(ProviderError(status)))
+    assert breaker.failure_rate() == 0.0 and not breaker._outcomes
+
+    for _ in range(5):
+        with pytest.raises(ProviderError):
+            asyncio.run(call(ProviderError(502)))
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(call(ProviderError(502)))
+
+
+def test_cancelled_probe_frees_the_slot(clock):
+    breaker = CircuitBreaker("test")
+    for _ in range(5):
+        breaker.record(False, 1.0)
+    clock.now += 30
+
+    async def cancelled_probe() -> None:
+        async with breaker.guard():
+            raise asyncio.CancelledError
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(cancelled_probe())
+    assert breaker.available()
+
+
+@pytest.mark.parametrize("status, failure", [(400, False), (404, False), (408, True), (429, False), (500, True), (503, True)])
+def test_is_failure_by_status(status, failure):
+    assert circuit_breaker.is_failure(ProviderError(status)) is failure
+
+
+def test_is_failure_ignores_open_circuits():
+    assert not circuit_breaker.is_failure(CircuitOpenError("test", 1.0))
+    assert circuit_breaker.is_failure(TimeoutError("slow"))
+
+
+@pytest.mark.parametrize("status, message, failure", [
+    ("failed", "CUDA out of memory", True),
+    ("failed", None, True),
+    ("failed", "Prediction failed: NSFW content detected", False),
+    ("failed", "Your input was flagged as sensitive. Please try again with different inputs. (E005)", False),
+    ("failed", "Invalid input: image must be at least 256px", False),
+    ("canceled", None, False),
+])
+def test_is_failure_classifies_failed_predictions(status, message, failure):
+    prediction = SimpleNamespace(id="p", status=status, error=message)
+    assert circuit_breaker.is_failure(ModelError(prediction)) is failure
+
+
+def test_no_data_scores_the_prior_not_the_maximum(clock):
+    breaker = CircuitBreaker("test")
+    assert breaker.health() == pytest.approx(0.9)
+
+
+def test_latency_is_scored_against_own_baseline(clock):
+    slow, fast = CircuitBreaker("slow"), CircuitBreaker("fast")
+    for _ in range(10):
+        slow.record(True, 45.0)
+        fast.record(True, 5.0)
+    # Each at its usual latency: equally healthy
+    assert slow.health() == pytest.approx(fast.health())
+
+    for _ in range(10):
+        fast.record(True, 20.0)
+    # Slower than its own baseline: discounted
+    assert fast.health() < slow.health()
+
+
+def test_rank_keeps_healthy_slow_primary_first(clock):
+    breakers = CircuitBreakers()
+    backends = [("openai", "gpt-image-1.5"), ("openai", "gpt-image-1"), ("replicate", "flux-kontext-pro")]
+    for _ in range(10):
+        breakers.get("openai", "gpt-image-1.5").record(True, 45.0)
+    assert breakers.rank(backends) == backends
+
+
+def test_rank_demotes_failing_and_drops_open_backends(clock):
+    breakers = CircuitBreakers()
+    backends = [("openai", "gpt-image-1.5"), ("openai", "gpt-image-1"), ("replicate", "flux-kontext-pro")]
+    primary = breakers.get("openai", "gpt-image-1.5")
+    for ok in (True, False, False, False):
+        primary.record(ok, 30.0)
+    # Mostly failing, but too few calls to open: ranked after the others
+    assert primary.state == CLOSED
+    assert breakers.rank(backends)[-1] == ("openai", "gpt-image-1.5")
+
+    primary.record(False, 30.0)
+    assert primary.state == OPEN
+    assert breakers.rank(backends) == backends[1:]
+
+
+def test_rank_raises_when_every_circuit_is_open(clock):
+    breakers = CircuitBreakers()
+    backends = [("openai", "gpt-image-1"), ("replicate", "flux-kontext-pro")]
+    for backend in backends:
+        for _ in range(5):
+            breakers.get(*backend).record(False, 1.0)
+    clock.now += 10
+    with pytest.raises(CircuitOpenError) as raised:
+        breakers.rank(backends)
+    assert raised.value.retry_after == pytest.approx(20.0)
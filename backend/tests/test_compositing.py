@@ -0,0 +1,53 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from services.compositing import composite_edit
+from services.masks import RLEMask
+
+
+def encode(pixels: np.ndarray, fmt: str = "PNG") -> bytes:
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def box_mask(width: int, height: int, box: tuple[int, int, int, int]) -> RLEMask:
+    selected = np.zeros((height, width), dtype=bool)
+    x0, y0, x1, y1 = box
+    selected[y0:y1, x0:x1] = True
+    flat = selected.ravel()
+    edges = np.flatnonzero(np.diff(flat.astype(np.int8))) + 1
+    bounds = np.concatenate(([0], edges, [flat.size]))
+    counts = np.diff(bounds).tolist()
+    if flat[0]:
+        counts = [0] + counts
+    return RLEMask(format="rle", width=width, height=height, counts=counts)
+
+
+def test_pixels_outside_the_mask_are_unchanged():
+    rng = np.random.default_rng(0)
+    original = rng.integers(0, 256, (300, 400, 3), dtype=np.uint8)
+    # Provider output at a different (smaller) resolution, all red
+    edited = np.zeros((150, 200, 3), dtype=np.uint8)
+    edited[..., 0] = 255
+
+    result = composite_edit(encode(original), encode(edited), box_mask(400, 300, (150, 100, 250, 200)), feather_px=4)
+    pixels = np.asarray(Image.open(io.BytesIO(result)).convert("RGB"))
+
+    assert pixels.shape == original.shape
+    # Outside the feathered band: bit-exact original
+    outside = np.ones((300, 400), dtype=bool)
+    outside[80:220, 130:270] = False
+    assert np.array_equal(pixels[outside], original[outside])
+    # Well inside the mask: the provider pixels
+    assert (pixels[130:170, 180:220, 0] >= 250).all()
+    assert (pixels[130:170, 180:220, 1:] <= 5).all()
+
+
+def test_empty_mask_returns_the_original():
+    original = np.full((64, 96, 3), 77, dtype=np.uint8)
+    edited = np.zeros((64, 96, 3), dtype=np.uint8)
+    result = composite_edit(encode(original), encode(edited), box_mask(96, 64, (0, 0, 0, 0)))
+    assert np.array_equal(np.asarray(Image.open(io.BytesIO(result)).convert("RGB")), original)
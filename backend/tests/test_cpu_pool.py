@@ -0,0 +1,20 @@
+import asyncio
+import time
+
+from services.cpu_pool import CPUPool
+
+
+def test_pool_works_across_event_loops():
+    # One worker, so calls queue on the semaphore and bind it to the running loop
+    pool = CPUPool(workers=1)
+
+    async def burst():
+        return await asyncio.gather(*(pool.run(time.sleep, 0.01) for _ in range(3)))
+
+    try:
+        for _ in range(2):
+            asyncio.run(burst())
+    finally:
+        pool.shutdown()
+    assert pool.completed == 6
+    assert pool.queued == 0 and pool.active == 0
@@ -0,0 +1,185 @@
+import asyncio
+import base64
+import io
+
+import orjson
+import pytest
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from PIL import Image
+
+from config import settings
+from routers import images, render
+from routers.events import event_stream, variant_stream
+from routers.render import RenderVariantsRequest
+from services import progress
+from services.circuit_breaker import circuit_breakers
+from services.image_result import ImageResult
+from services.image_store import LocalImageStore, image_store
+from services.openai_service import openai_service
+
+
+def png_bytes(size=(64, 48), color=(200, 120, 40)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def local_store(monkeypatch, tmp_path):
+    monkeypatch.setattr(image_store, "_backend", LocalImageStore(str(tmp_path / "images"), max_bytes=1 << 20))
+
+
+def parse_events(body: bytes) -> list[tuple[str, object]]:
+    """(event, parsed data) pairs of a stream; comment lines are skipped"""
+    events = []
+    for frame in body.split(b"\n\n"):
+        lines = [line for line in frame.split(b"\n") if line and not line.startswith(b":")]
+        if not lines:
+            continue
+        event = lines[0].removeprefix(b"event: ").decode()
+        data = b"\n".join(lines[1:]).removeprefix(b"data: ")
+        events.append((event, orjson.loads(data)))
+    return events
+
+
+def read_events(make_response) -> list[tuple[str, object]]:
+    async def collect() -> bytes:
+        response = make_response()
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        await asyncio.gather(*images._pending_stores)
+        return body
+
+    return parse_events(asyncio.run(collect()))
+
+
+def test_event_stream_frames_stages_partials_and_result():
+    async def handler():
+        progress.report("preprocessing")
+        progress.report_partial(0, base64.b64encode(png_bytes((2048, 1536))).decode())
+        # Truncated frame: skipped, the generation carries on
+        progress.report_partial(1, base64.b64encode(png_bytes()[:40]).decode())
+        await asyncio.sleep(0)
+        progress.report("downloading", provider="openai")
+        return JSONResponse({"imageId": "abc"})
+
+    events = read_events(lambda: event_stream(handler))
+    assert [name for name, _ in events] == ["stage", "partial", "stage", "result"]
+    stage, partial, downloading, result = (data for _, data in events)
+    assert stage["stage"] == "preprocessing" and "elapsed" in stage
+    assert partial["index"] == 0 and partial["imageUrl"].startswith("data:image/jpeg;base64,")
+    assert max(partial["width"], partial["height"]) <= settings.stream_preview_size
+    assert downloading == {"stage": "downloading", "provider": "openai", "elapsed": downloading["elapsed"]}
+    assert result == {"imageId": "abc"}
+
+
+@pytest.mark.parametrize("error, status", [
+    (HTTPException(status_code=422, detail="bad prompt"), 422),
+    (RuntimeError("provider down"), 500),
+])
+def test_event_stream_reports_handler_errors(error, status):
+    async def handler():
+        progress.report("generating")
+        raise error
+
+    events = read_events(lambda: event_stream(handler))
+    assert [name for name, _ in events] == ["stage", "error"]
+    assert events[-1][1]["status"] == status
+
+
+def test_variant_stream_streams_each_group_and_failures():
+    async def ok(color):
+        await asyncio.sleep(0.01)
+        return [ImageResult(data=png_bytes(color=color))]
+
+    async def fails():
+        raise HTTPException(status_code=503, detail="circuit open")
+
+    groups = [
+        ({"style": "day"}, [0], lambda: ok((10, 20, 30))),
+        ({"style": "night"}, [1, 2], fails),
+        ({"style": "evening"}, [3], lambda: ok((40, 50, 60))),
+    ]
+    events = read_events(lambda: variant_stream(groups, None))
+    names = [name for name, _ in events]
+    assert sorted(names[:-1]) == ["error", "variant", "variant"] and names[-1] == "done"
+
+    variants = {data["index"]: data for name, data in events if name == "variant"}
+    assert set(variants) == {0, 3}
+    assert variants[0]["style"] == "day" and variants[0]["imageUrl"].startswith("data:image/png;base64,")
+    assert len(variants[0]["imageId"]) == 64
+    error = next(data for name, data in events if name == "error")
+    assert error == {"index": [1, 2], "style": "night", "status": 503, "detail": "circuit open"}
+    assert events[-1][1]["variants"] == 2 and events[-1][1]["failed"] == 2
+
+
+@pytest.fixture
+def variant_providers(monkeypatch):
+    """Both providers configured, fresh circuits, and a fake render_variations that records its calls"""
+    monkeypatch.setattr(settings, "openai_api_key", "test")
+    monkeypatch.setattr(settings, "replicate_api_token", "test")
+    monkeypatch.setattr(circuit_breakers, "_breakers", {})
+    calls = []
+
+    async def render_variations(image, n, model, quality, style):
+        calls.append((model, n))
+        return [ImageResult(data=png_bytes(color=(len(calls), 0, 0))) for _ in range(n)]
+
+    async def cached_render(*args, **kwargs):
+        raise AssertionError("variants must not go through the cached render_image")
+
+    monkeypatch.setattr(openai_service, "render_variations", render_variations)
+    monkeypatch.setattr(openai_service, "render_image", cached_render)
+    return calls
+
+
+def variants_request(**fields) -> RenderVariantsRequest:
+    return RenderVariantsRequest(imageBase64=base64.b64encode(png_bytes()).decode(), **fields)
+
+
+def variant_events(request: RenderVariantsRequest) -> list[tuple[str, object]]:
+    async def collect():
+        response = await render.render_variants(request, None)
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        await asyncio.gather(*images._pending_stores)
+        return body
+
+    return parse_events(asyncio.run(collect()))
+
+
+def test_single_variants_are_not_cached(variant_providers):
+    request = variants_request(models=["gpt-image-1"], styles=["real_estate", "evening"])
+    for _ in range(2):
+        events = variant_events(request)
+        assert [name for name, _ in events].count("variant") == 2
+    # Every request asks the provider again, one n=1 call per style
+    assert variant_providers == [("gpt-image-1", 1)] * 4
+
+
+def test_open_circuit_falls_over_to_another_gpt_image_model(variant_providers, monkeypatch):
+    breaker = circuit_breakers.get("openai", "gpt-image-1")
+    for _ in range(5):
+        breaker.record(False, 1.0)
+
+    def guarded(render_variations):
+        async def call(image, n, model, quality, style):
+            async with circuit_breakers.get("openai", model).guard():
+                return await render_variations(image, n, model, quality, style)
+        return call
+
+    monkeypatch.setattr(openai_service, "render_variations", guarded(openai_service.render_variations))
+    events = variant_events(variants_request(models=["gpt-image-1"]))
+    (name, data), (done, _) = events
+    assert name == "variant" and done == "done"
+    assert data["model"] != "gpt-image-1" and data["requestedModel"] == "gpt-image-1"
+    assert variant_providers == [(data["model"], 1)]
+
+
+def test_open_flux_circuit_is_a_503_error_event(variant_providers):
+    breaker = circuit_breakers.get("replicate", render.FLUX_KONTEXT_MODEL)
+    for _ in range(5):
+        breaker.record(False, 1.0)
+    events = variant_events(variants_request(models=["flux-kontext-pro"], count=2))
+    errors = [data for name, data in events if name == "error"]
+    assert len(errors) == 2 and all(error["status"] == 503 for error in errors)
+    assert events[-1][1]["failed"] == 2
@@ -0,0 +1,83 @@
+import asyncio
+import base64
+import json
+import os
+
+import orjson
+import pytest
+
+from routers import fast_json
+from routers.fast_json import BLOB_MIN_CHARS, image_json_response, parse_json_body
+from routers.render import RenderResponse
+from services.image_result import ImageResult
+
+
+def parse(body) -> object:
+    return asyncio.run(parse_json_body(orjson.dumps(body) if not isinstance(body, bytes) else body))
+
+
+def test_image_fields_decode_to_bytes():
+    image = os.urandom(BLOB_MIN_CHARS)
+    parsed = parse({"imageBase64": base64.b64encode(image).decode(), "prompt": "add a tree", "quality": "high"})
+    assert parsed == {"imageBase64": image, "prompt": "add a tree", "quality": "high"}
+
+
+def test_nested_and_listed_image_fields_decode():
+    images = [os.urandom(BLOB_MIN_CHARS), os.urandom(BLOB_MIN_CHARS + 3)]
+    parsed = parse({"request": {"referenceImages": [base64.b64encode(i).decode() for i in images], "n": 1}})
+    assert parsed == {"request": {"referenceImages": images, "n": 1}}
+
+
+def test_long_strings_outside_image_fields_stay_strings():
+    text = base64.b64encode(os.urandom(BLOB_MIN_CHARS)).decode()
+    assert parse({"prompt": text}) == {"prompt": text}
+
+
+def test_non_base64_image_value_stays_a_string():
+    value = "data:image/png;base64," + "A" * BLOB_MIN_CHARS
+    assert parse({"imageBase64": value}) == {"imageBase64": value}
+
+
+def test_escaped_long_strings_go_through_orjson():
+    value = "line\\n" * BLOB_MIN_CHARS
+    body = json.dumps({"imageBase64": value, "prompt": 'say "hi"'}).encode()
+    assert parse(body) == json.loads(body)
+
+
+def test_matches_json_loads_for_mixed_bodies():
+    body = {
+        "imageBase64": base64.b64encode(os.urandom(2 * BLOB_MIN_CHARS)).decode(),
+        "maskBase64": None,
+        "values": [1, 2.5, True, None, {"k": "é ✓"}],
+        "empty": "",
+    }
+    parsed = parse(body)
+    assert parsed["imageBase64"] == base64.b64decode(body["imageBase64"])
+    assert {k: v for k, v in parsed.items() if k != "imageBase64"} == {k: v for k, v in body.items() if k != "imageBase64"}
+
+
+def test_large_blobs_decode_across_chunks(monkeypatch):
+    monkeypatch.setattr(fast_json, "CHUNK_CHARS", 4 * 1024)
+    image = os.urandom(3 * BLOB_MIN_CHARS + 1)
+    assert parse({"imageBase64": base64.b64encode(image).decode()}) == {"imageBase64": image}
+
+
+def test_invalid_json_raises():
+    with pytest.raises(orjson.JSONDecodeError):
+        parse(b'{"imageBase64": "' + b"A" * BLOB_MIN_CHARS + b'", }')
+
+
+def test_image_json_response_streams_the_model():
+    data = os.urandom(100_000)
+    response = image_json_response(ImageResult(data=data, mime_type="image/png"), RenderResponse, imageId="abc")
+
+    async def read() -> bytes:
+        return b"".join([chunk async for chunk in response.body_iterator])
+
+    body = asyncio.run(read())
+    assert int(response.headers["content-length"]) == len(body)
+    decoded = orjson.loads(body)
+    encoded = base64.b64encode(data).decode()
+    assert decoded["imageBase64"] == encoded
+    assert decoded["imageUrl"] == f"data:image/png;base64,{encoded}"
+    assert decoded["imageId"] == "abc"
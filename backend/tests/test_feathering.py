@@ -0,0 +1,32 @@
+import numpy as np
+
+from services.masks import feather_mask, feather_radius
+
+
+def test_feather_mask_zero_radius_is_hard():
+    selected = np.zeros((12, 20), dtype=bool)
+    selected[3:9, 5:15] = True
+    coverage = feather_mask(selected, radius=0)
+    assert set(np.unique(coverage)) <= {0, 255}
+    assert np.array_equal(coverage == 255, selected)
+
+
+def test_feather_mask_ramps_across_the_edge_only():
+    selected = np.zeros((200, 200), dtype=bool)
+    selected[:, 100:] = True
+    coverage = feather_mask(selected, radius=8)
+    row = coverage[50].astype(int)
+    # Far from the edge: untouched
+    assert row[0] == 0 and row[199] == 255
+    assert (row[:90] == 0).all() and (row[110:] == 255).all()
+    # Across the edge: monotonic ramp through mid-grey
+    ramp = row[90:110]
+    assert (np.diff(ramp) >= 0).all()
+    assert 100 <= row[99] <= 155 or 100 <= row[100] <= 155
+    # Same along the whole edge (tiles stitch without seams)
+    assert (coverage == coverage[50]).all()
+
+
+def test_feather_radius_scales_with_output_size():
+    assert feather_radius((1024, 768), 4) == 4
+    assert feather_radius((4096, 3072), 4) == 16
@@ -0,0 +1,238 @@
+import asyncio
+import io
+
+import pytest
+from PIL import Image
+
+from config import settings
+from routers import render
+from services import replicate_service
+from services.circuit_breaker import CircuitOpenError
+from services.hedging import Hedger, LatencyWindow
+from services.image_result import ImageResult
+from services.result_cache import ResultCache, result_key
+
+
+@pytest.fixture(autouse=True)
+def hedging(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "hedge_default_delay", 0.05)
+    monkeypatch.setattr(settings, "hedge_min_delay", 0.0)
+    monkeypatch.setattr(settings, "hedge_max_ratio", 1.0)
+    monkeypatch.setattr(settings, "result_cache_enabled", True)
+    monkeypatch.setattr(settings, "result_cache_disk_bytes", 0)
+
+
+def png_bytes() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 32), (200, 80, 40)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class Provider:
+    """Fake provider call: answers after `seconds` (or fails), records whether it was cancelled"""
+
+    def __init__(self, name: str, seconds: float, fail: bool = False):
+        self.name = name
+        self.seconds = seconds
+        self.fail = fail
+        self.started = False
+        self.cancelled = False
+
+    async def __call__(self) -> ImageResult:
+        self.started = True
+        try:
+            await asyncio.sleep(self.seconds)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.fail:
+            raise RuntimeError(f"{self.name} failed")
+        return ImageResult(data=self.name.encode(), mime_type="image/png")
+
+
+def test_latency_window_percentile():
+    window = LatencyWindow()
+    assert window.percentile(95) is None
+    for seconds in range(1, 101):
+        window.add(float(seconds))
+    assert window.percentile(50) == 51.0
+    assert window.percentile(95) == 96.0
+
+
+def test_fast_primary_is_not_hedged():
+    hedger = Hedger()
+    primary, backup = Provider("openai", 0.0), Provider("replicate", 0.0)
+    result = asyncio.run(hedger.run("render", (primary.name, primary), (backup.name, backup)))
+    assert result.data == b"openai"
+    assert not backup.started
+    assert hedger.hedged == 0
+
+
+def test_backup_wins_and_slow_primary_is_cancelled():
+    hedger = Hedger()
+    primary, backup = Provider("openai", 5.0), Provider("replicate", 0.01)
+    result = asyncio.run(hedger.run("render", (primary.name, primary), (backup.name, backup)))
+    assert result.data == b"replicate"
+    assert primary.cancelled
+    assert hedger.wins == {"replicate": 1}
+    # The loser's elapsed time still counts towards its latency window
+    assert len(hedger.latency("render", "openai")) == 1
+
+
+def test_primary_wins_and_backup_is_cancelled():
+    hedger = Hedger()
+    primary, backup = Provider("openai", 0.1), Provider("replicate", 5.0)
+    result = asyncio.run(hedger.run("render", (primary.name, primary), (backup.name, backup)))
+    assert result.data == b"openai"
+    assert backup.started and backup.cancelled
+
+
+def test_loser_inside_result_cache_is_cancelled():
+    # The cache shields its shared task; the hedge loser must still stop the provider call
+    hedger = Hedger()
+    cache = ResultCache()
+    primary, backup = Provider("openai", 5.0), Provider("replicate", 0.01)
+
+    async def run():
+        result = await hedger.run(
+            "render",
+            ("openai", lambda: cache.get_or_create(result_key(provider="openai"), primary)),
+            ("replicate", lambda: cache.get_or_create(result_key(provider="replicate"), backup)),
+        )
+        await asyncio.sleep(0)
+        # Checked before asyncio.run() cancels whatever is left over
+        return result, primary.cancelled, cache.stats()["in_flight"]
+
+    result, cancelled, in_flight = asyncio.run(run())
+    assert result.data == b"replicate"
+    assert cancelled
+    assert in_flight == 0
+
+
+def test_early_primary_failure_starts_backup_at_once(monkeypatch):
+    monkeypatch.setattr(settings, "hedge_default_delay", 5.0)
+    hedger = Hedger()
+    primary, backup = Provider("openai", 0.0, fail=True), Provider("replicate", 0.0)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        result = await hedger.run("render", (primary.name, primary), (backup.name, backup))
+        return result, loop.time() - started
+
+    result, elapsed = asyncio.run(run())
+    assert result.data == b"replicate"
+    assert elapsed < 1.0
+    assert hedger.hedged == 1
+
+
+def test_early_failure_past_hedge_cap_raises(monkeypatch):
+    monkeypatch.setattr(settings, "hedge_max_ratio", 0.0)
+    hedger = Hedger()
+    primary, backup = Provider("openai", 0.0, fail=True), Provider("replicate", 0.0)
+    with pytest.raises(RuntimeError, match="openai failed"):
+        asyncio.run(hedger.run("render", (primary.name, primary), (backup.name, backup)))
+    assert not backup.started
+
+
+def test_both_fail_raises_first_error():
+    hedger = Hedger()
+    primary, backup = Provider("openai", 0.1, fail=True), Provider("replicate", 0.2, fail=True)
+    with pytest.raises(RuntimeError, match="openai failed"):
+        asyncio.run(hedger.run("render", (primary.name, primary), (backup.name, backup)))
+
+
+class FakePrediction:
+    """A Replicate prediction that never finishes on its own"""
+
+    def __init__(self):
+        self.id = "fake"
+        self.status = "processing"
+        self.logs = ""
+        self.cancelled = False
+
+    async def async_reload(self):
+        pass
+
+    async def async_cancel(self):
+        self.cancelled = True
+
+
+def test_losing_flux_render_cancels_its_prediction(monkeypatch):
+    prediction = FakePrediction()
+
+    async def create_prediction(model, input_params):
+        return prediction
+
+    monkeypatch.setattr(replicate_service, "create_prediction", create_prediction)
+    monkeypatch.setattr(settings, "replicate_poll_interval", 0.01)
+    hedger = Hedger()
+    image = png_bytes()
+    backup = Provider("openai", 0.2)
+
+    async def run():
+        result = await hedger.run("render", ("replicate", lambda: render.flux_render(image)), ("openai", backup))
+        return result, prediction.cancelled
+
+    result, cancelled = asyncio.run(run())
+    assert result.data == b"openai"
+    assert cancelled
+
+
+def test_abandoned_redpen_base_render_cancels_its_prediction(monkeypatch):
+    prediction = FakePrediction()
+
+    async def create_prediction(model, input_params):
+        return prediction
+
+    monkeypatch.setattr(replicate_service, "create_prediction", create_prediction)
+    monkeypatch.setattr(settings, "replicate_poll_interval", 0.01)
+    image = png_bytes()
+
+    async def run():
+        step = asyncio.ensure_future(render.redpen_base_render(image))
+        await asyncio.sleep(0.1)
+        # The client goes away before the prediction has an output URL
+        step.cancel()
+        await asyncio.gather(step, return_exceptions=True)
+        await asyncio.sleep(0.05)
+        return prediction.cancelled, render.result_cache.stats()["in_flight"]
+
+    cancelled, in_flight = asyncio.run(run())
+    assert cancelled
+    assert in_flight == 0
+
+
+def routed_attempts(open_circuits: set, calls: list):
+    """attempt() for run_routed: backends in open_circuits fail fast, the rest answer with their model"""
+
+    def attempt(provider: str, model: str):
+        async def create() -> ImageResult:
+            calls.append(model)
+            if model in open_circuits:
+                raise CircuitOpenError(f"{provider}/{model}", 30.0)
+            return ImageResult(data=model.encode(), mime_type="image/png")
+
+        return provider, create
+
+    return attempt
+
+
+@pytest.mark.parametrize("hedge", [False, True])
+def test_run_routed_skips_circuit_opened_since_routing(monkeypatch, hedge):
+    monkeypatch.setattr(settings, "hedge_enabled", hedge)
+    monkeypatch.setattr(settings, "hedge_max_ratio", 0.0)
+    monkeypatch.setattr(render, "hedger", Hedger())
+    backends = [("openai", "gpt-image-1.5"), ("openai", "gpt-image-1"), ("replicate", "flux-kontext-pro")]
+    calls = []
+    result = asyncio.run(render.run_routed("render", backends, routed_attempts({"gpt-image-1.5"}, calls)))
+    # Falls to the next ranked backend, not a 503 (and not to the hedge backup early)
+    assert result.data == b"gpt-image-1"
+    assert calls == ["gpt-image-1.5", "gpt-image-1"]
+
+
+def test_run_routed_raises_when_every_circuit_opened():
+    backends = [("openai", "gpt-image-1"), ("replicate", "flux-kontext-pro")]
+    open_circuits = {"gpt-image-1", "flux-kontext-pro"}
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(render.run_routed("render", backends, routed_attempts(open_circuits, [])))
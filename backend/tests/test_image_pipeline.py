@@ -0,0 +1,136 @@
+import asyncio
+import io
+
+import numpy as np
+from PIL import Image
+
+from services import image_pipeline
+from services.image_pipeline import (
+    DALLE_IMAGE_SPEC, FLUX_IMAGE_SPEC, OPENAI_IMAGE_SPEC, CodecStats, ContentKind, ImageSpec, _build_variant,
+    classify_content, prepare_image_async,
+)
+
+
+def png_bytes(size=(64, 48), color=(40, 120, 200)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_prepare_image_async_builds_concurrent_requests_once(monkeypatch):
+    spec = ImageSpec(max_size=32, mode="RGB", format="PNG", name="test")
+    builds = []
+    build_variant = image_pipeline._build_variant
+
+    def counting_build(*args):
+        builds.append(args[1])
+        return build_variant(*args)
+
+    monkeypatch.setattr(image_pipeline, "_build_variant", counting_build)
+    image_pipeline.image_cache.clear()
+    data = png_bytes()
+
+    async def main():
+        return await asyncio.gather(*(prepare_image_async(data, spec) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert len(builds) == 1
+    assert all(result is results[0] for result in results)
+    assert max(results[0].size) == 32
+    assert not image_pipeline._inflight
+
+
+def test_prepare_image_async_caller_cancel_keeps_build_for_others(monkeypatch):
+    spec = ImageSpec(max_size=24, mode="RGB", format="PNG", name="test")
+    image_pipeline.image_cache.clear()
+    data = png_bytes(color=(1, 2, 3))
+
+    async def main():
+        first = asyncio.ensure_future(prepare_image_async(data, spec))
+        second = asyncio.ensure_future(prepare_image_async(data, spec))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    prepared = asyncio.run(main())
+    assert max(prepared.size) == 24
+
+
+def encode(pixels: np.ndarray, mode: str = "RGB") -> bytes:
+    buffer = io.BytesIO()
+    Image.fromarray(pixels, mode=mode).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def plan_drawing(colored: bool = False) -> np.ndarray:
+    """Line art: white sheet, thin black wall lines (and flat colour-coded rooms)"""
+    pixels = np.full((300, 400, 3), 255, dtype=np.uint8)
+    if colored:
+        pixels[32:100, 22:200] = (250, 220, 160)
+        pixels[102:170, 202:380] = (170, 210, 250)
+    for x in range(20, 400, 60):
+        pixels[:, x:x + 2] = 0
+    for y in range(30, 300, 70):
+        pixels[y:y + 2, :] = 0
+    return pixels
+
+
+def photo() -> np.ndarray:
+    """Continuous tone: colour gradients plus sensor-like noise"""
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[0:300, 0:400].astype(np.float32)
+    base = np.stack([xx / 400 * 200 + 30, yy / 300 * 180 + 40, (xx + yy) / 700 * 150 + 60], axis=-1)
+    return np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+
+
+def test_classify_content():
+    assert classify_content(Image.fromarray(plan_drawing())) == (ContentKind.LINE_ART, True)
+    assert classify_content(Image.fromarray(plan_drawing(colored=True))) == (ContentKind.LINE_ART, False)
+    assert classify_content(Image.fromarray(photo())) == (ContentKind.PHOTO, False)
+
+
+def test_line_art_becomes_a_small_png():
+    grey = _build_variant(encode(plan_drawing()), OPENAI_IMAGE_SPEC)
+    assert (grey.codec, grey.mime_type, grey.content) == ("PNG/L", "image/png", "line_art")
+
+    colored = _build_variant(encode(plan_drawing(colored=True)), FLUX_IMAGE_SPEC)
+    assert (colored.codec, colored.mime_type) == ("PNG/P", "image/png")
+    # Palette PNG keeps the drawing's colours exactly
+    decoded = np.asarray(Image.open(io.BytesIO(colored.data)).convert("RGB"))
+    assert (decoded == plan_drawing(colored=True)).all()
+
+
+def test_photos_use_each_providers_lossy_codec():
+    data = encode(photo())
+    openai = _build_variant(data, OPENAI_IMAGE_SPEC)
+    assert (openai.codec, openai.mime_type, openai.content) == ("JPEG/RGB", "image/jpeg", "photo")
+    flux = _build_variant(data, FLUX_IMAGE_SPEC)
+    assert (flux.codec, flux.mime_type) == ("WEBP/RGB", "image/webp")
+    assert len(openai.data) < len(data) and len(flux.data) < len(data)
+
+
+def test_dalle_stays_rgba_png():
+    prepared = _build_variant(encode(photo()), DALLE_IMAGE_SPEC)
+    assert (prepared.codec, prepared.mime_type, prepared.content) == ("PNG/RGBA", "image/png", None)
+    assert Image.open(io.BytesIO(prepared.data)).mode == "RGBA"
+
+
+def test_real_transparency_keeps_the_lossless_fallback():
+    pixels = np.dstack([photo(), np.full((300, 400), 255, dtype=np.uint8)])
+    pixels[:50, :50, 3] = 0
+    prepared = _build_variant(encode(pixels, mode="RGBA"), OPENAI_IMAGE_SPEC)
+    assert (prepared.codec, prepared.mime_type) == ("PNG/RGBA", "image/png")
+
+
+def test_codec_stats_record_the_savings():
+    stats = CodecStats()
+    spec = OPENAI_IMAGE_SPEC
+    sampled = _build_variant(encode(photo()), spec, sample_baseline=True)
+    assert sampled.baseline_bytes > len(sampled.data)
+    stats.record(spec, sampled)
+    stats.record(spec, _build_variant(encode(photo()[:200]), spec))
+
+    entry = stats.stats()["openai"]["JPEG/RGB"]
+    assert entry["variants"] == 2 and entry["sampled"] == 1
+    assert entry["sampled_bytes_saved"] == sampled.baseline_bytes - len(sampled.data)
+    assert 0 < entry["saved_ratio"] < 1
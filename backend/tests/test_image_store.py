@@ -0,0 +1,165 @@
+import asyncio
+import io
+import os
+
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+
+from routers import images
+from routers.images import load_image, resolve_image
+from routers.render import RenderResponse
+from routers.responses import ID_FORMAT, image_response
+from services import image_store as image_store_module
+from services.image_pipeline import content_hash
+from services.image_result import ImageResult
+from services.image_store import LocalImageStore, image_store, is_image_id, sniff_mime_type
+
+
+def png_bytes(color=(30, 90, 150)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (16, 16), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def local_store(monkeypatch, tmp_path) -> LocalImageStore:
+    store = LocalImageStore(str(tmp_path / "images"), max_bytes=1 << 20)
+    monkeypatch.setattr(image_store, "_backend", store)
+    return store
+
+
+def stored_files(store: LocalImageStore) -> list[str]:
+    return sorted(name for _, _, names in os.walk(store.root) for name in names)
+
+
+def test_put_then_get(local_store):
+    data = png_bytes()
+    image_id = asyncio.run(image_store.put(data))
+    assert image_id == content_hash(data) and is_image_id(image_id)
+    assert asyncio.run(image_store.get(image_id)) == data
+    assert asyncio.run(image_store.get("0" * 64)) is None
+    assert asyncio.run(image_store.get("not-an-id")) is None
+
+
+def test_sniff_mime_type():
+    assert sniff_mime_type(png_bytes()) == "image/png"
+    assert sniff_mime_type(b"\xff\xd8\xff\xe0rest") == "image/jpeg"
+    assert sniff_mime_type(b"RIFF\0\0\0\0WEBPVP8 ") == "image/webp"
+    assert sniff_mime_type(b"plain text") == "application/octet-stream"
+
+
+def test_get_survives_file_pruned_after_read(local_store, monkeypatch):
+    data = png_bytes()
+    image_id = content_hash(data)
+    local_store.put(image_id, data)
+
+    def pruned(path, *args):
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(image_store_module.os, "utime", pruned)
+    assert local_store.get(image_id) == data
+
+
+def test_put_rewrites_file_pruned_after_exists_check(local_store, monkeypatch):
+    data = png_bytes()
+    image_id = content_hash(data)
+    local_store.put(image_id, data)
+    path = local_store._path(image_id)
+
+    def pruned(target, *args):
+        os.remove(target)
+        raise FileNotFoundError(target)
+
+    monkeypatch.setattr(image_store_module.os, "utime", pruned)
+    local_store.put(image_id, data)
+    with open(path, "rb") as f:
+        assert f.read() == data
+
+
+def test_failed_write_leaves_no_temp_file(local_store, monkeypatch):
+    def full_disk(src, dst):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(image_store_module.os, "replace", full_disk)
+    with pytest.raises(OSError):
+        local_store.put(content_hash(b"x"), b"x")
+    assert stored_files(local_store) == []
+
+
+def test_prune_removes_least_recently_used_and_skips_temp_files(tmp_path):
+    store = LocalImageStore(str(tmp_path / "images"), max_bytes=250)
+    ids = []
+    for i in range(3):
+        data = bytes([i]) * 100
+        ids.append(content_hash(data))
+        store.put(ids[-1], data)
+        os.utime(store._path(ids[-1]), (1000 + i, 1000 + i))
+    # Reading the oldest makes it the most recently used
+    store.get(ids[0])
+    in_progress = os.path.join(os.path.dirname(store._path(ids[0])), "tmpwriting")
+    with open(in_progress, "wb") as f:
+        f.write(b"\0" * 100)
+
+    store.prune()
+    assert os.path.exists(in_progress)
+    assert store.get(ids[1]) is None
+    assert store.get(ids[0]) is not None and store.get(ids[2]) is not None
+
+
+def test_load_image_resolves_ids(local_store):
+    data = png_bytes()
+    image_id = asyncio.run(image_store.put(data))
+    assert asyncio.run(load_image(image_id)) == data
+
+    with pytest.raises(HTTPException) as malformed:
+        asyncio.run(load_image("../etc/passwd", "referenceImageIds[0]"))
+    assert malformed.value.status_code == 400
+    assert "referenceImageIds[0]" in malformed.value.detail
+
+    with pytest.raises(HTTPException) as unknown:
+        asyncio.run(load_image("f" * 64))
+    assert unknown.value.status_code == 404
+
+
+def test_resolve_image_needs_exactly_one_source(local_store):
+    data = png_bytes()
+    image_id = asyncio.run(image_store.put(data))
+    assert asyncio.run(resolve_image(None, image_id)) == data
+    assert asyncio.run(resolve_image("inline", None)) == "inline"
+    for inline, stored in (("inline", image_id), (None, None)):
+        with pytest.raises(HTTPException) as raised:
+            asyncio.run(resolve_image(inline, stored))
+        assert raised.value.status_code == 400
+
+
+def test_binary_response_stores_in_background(local_store):
+    result = ImageResult(data=png_bytes())
+
+    async def run():
+        response = await image_response(result, "image/png", RenderResponse)
+        stored_before = stored_files(local_store)
+        await asyncio.gather(*images._pending_stores)
+        return response, stored_before
+
+    response, stored_before = asyncio.run(run())
+    image_id = content_hash(result.data)
+    assert response.headers["X-Image-Id"] == image_id
+    # Answered before the write; stored right after
+    assert stored_before == []
+    assert stored_files(local_store) == [image_id]
+
+
+def test_id_response_waits_for_the_store(local_store, monkeypatch):
+    result = ImageResult(data=png_bytes())
+    response = asyncio.run(image_response(result, ID_FORMAT, RenderResponse))
+    assert response.status_code == 200
+    assert stored_files(local_store) == [content_hash(result.data)]
+
+    def store_down(image_id, data):
+        raise OSError("store down")
+
+    monkeypatch.setattr(local_store, "put", store_down)
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(image_response(ImageResult(data=png_bytes((1, 2, 3))), ID_FORMAT, RenderResponse))
+    assert raised.value.status_code == 503
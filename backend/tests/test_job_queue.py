@@ -0,0 +1,172 @@
+import asyncio
+
+import pytest
+
+from config import settings
+from services.job_queue import (
+    CANCELLED, QUEUED, RUNNING, SUCCEEDED, Job, JobManager, RedisJobBackend, _request_cancel, _start,
+)
+
+
+@pytest.fixture(autouse=True)
+def memory_backend(monkeypatch):
+    monkeypatch.setattr(settings, "job_backend", "memory")
+    monkeypatch.setattr(settings, "job_workers", 1)
+    monkeypatch.setattr(settings, "job_cancel_poll", 0.01)
+
+
+async def wait_for(manager: JobManager, job_id: str, status: str) -> None:
+    for _ in range(200):
+        if (await manager.get(job_id)).status == status:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job never reached {status}")
+
+
+def test_job_runs_to_completion():
+    async def run():
+        manager = JobManager()
+
+        async def runner(payload):
+            return {"echo": payload["value"]}
+
+        manager.register("echo", runner)
+        await manager.start()
+        try:
+            job = await manager.submit("echo", {"value": 7})
+            await wait_for(manager, job.id, SUCCEEDED)
+            return await manager.get(job.id)
+        finally:
+            await manager.aclose()
+
+    job = asyncio.run(run())
+    assert job.result == {"echo": 7}
+
+
+def test_cancel_queued_job_never_runs():
+    ran = []
+
+    async def run():
+        manager = JobManager()
+
+        async def runner(payload):
+            ran.append(payload)
+            return {}
+
+        manager.register("work", runner)
+        job = await manager.submit("work", {})
+        cancelled = await manager.cancel(job.id)
+        assert cancelled.status == CANCELLED
+        await manager.start()
+        try:
+            await asyncio.sleep(0.05)
+            return await manager.get(job.id)
+        finally:
+            await manager.aclose()
+
+    job = asyncio.run(run())
+    assert job.status == CANCELLED
+    assert ran == []
+
+
+def test_cancel_after_dequeue_is_not_overwritten():
+    # The cancel lands between the worker popping the id and starting the job
+    ran = []
+
+    async def run():
+        manager = JobManager()
+
+        async def runner(payload):
+            ran.append(payload)
+            return {}
+
+        manager.register("work", runner)
+        backend = manager.backend
+        dequeue = backend.dequeue
+
+        async def dequeue_then_cancel(timeout):
+            job_id = await dequeue(timeout)
+            if job_id is not None:
+                await manager.cancel(job_id)
+            return job_id
+
+        backend.dequeue = dequeue_then_cancel
+        job = await manager.submit("work", {})
+        await manager.start()
+        try:
+            await asyncio.sleep(0.05)
+            return await manager.get(job.id)
+        finally:
+            await manager.aclose()
+
+    job = asyncio.run(run())
+    assert job.status == CANCELLED
+    assert ran == []
+
+
+def test_cancel_running_job_cancels_its_task():
+    cancelled = []
+
+    async def run():
+        manager = JobManager()
+        running = asyncio.Event()
+
+        async def runner(payload):
+            running.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+            return {}
+
+        manager.register("slow", runner)
+        await manager.start()
+        try:
+            job = await manager.submit("slow", {})
+            await asyncio.wait_for(running.wait(), 1)
+            assert (await manager.get(job.id)).status == RUNNING
+            await manager.cancel(job.id)
+            await wait_for(manager, job.id, CANCELLED)
+            return await manager.get(job.id)
+        finally:
+            await manager.aclose()
+
+    job = asyncio.run(run())
+    assert job.status == CANCELLED
+    assert cancelled == [True]
+
+
+def test_transitions():
+    job = Job(id="a", kind="work")
+    assert job.status == QUEUED
+    assert _start(job) and job.status == RUNNING
+    assert not _start(job)
+    assert _request_cancel(job) and job.cancel_requested
+    # A second cancel of a running job changes nothing
+    assert not _request_cancel(job)
+
+    job = Job(id="b", kind="work")
+    assert _request_cancel(job) and job.status == CANCELLED
+    assert not _start(job)
+
+
+def test_redis_update_is_conditional():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("redis")
+
+    async def run():
+        backend = RedisJobBackend("redis://localhost", "test:", ttl=60)
+        backend._redis = fakeredis.FakeAsyncRedis()
+
+        job = Job(id="c", kind="work")
+        await backend.enqueue(job, {"value": 1})
+        cancelled, changed = await backend.update(job.id, _request_cancel)
+        assert changed and cancelled.status == CANCELLED
+        started, changed = await backend.update(job.id, _start)
+        assert not changed and started.status == CANCELLED
+        missing, changed = await backend.update("nope", _start)
+        assert missing is None and not changed
+        return await backend.load(job.id)
+
+    assert asyncio.run(run()).status == CANCELLED
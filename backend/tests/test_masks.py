@@ -0,0 +1,92 @@
+import base64
+import zlib
+
+import numpy as np
+import pytest
+
+from services.masks import (
+    PackedMask,
+    RLEMask,
+    StrokeMask,
+    decode_compact_mask,
+    load_mask,
+)
+
+
+def sample_mask(height=12, width=20) -> np.ndarray:
+    selected = np.zeros((height, width), dtype=bool)
+    selected[3:9, 5:15] = True
+    return selected
+
+
+def packed(selected: np.ndarray, deflate: bool) -> PackedMask:
+    raw = np.packbits(selected.ravel()).tobytes()
+    if deflate:
+        raw = zlib.compress(raw)
+    height, width = selected.shape
+    return PackedMask(format="packbits", width=width, height=height,
+                      data=base64.b64encode(raw).decode(), zlib=deflate)
+
+
+def rle(selected: np.ndarray) -> RLEMask:
+    flat = selected.ravel()
+    counts, value, run = [], False, 0
+    for pixel in flat:
+        if pixel == value:
+            run += 1
+        else:
+            counts.append(run)
+            value, run = pixel, 1
+    counts.append(run)
+    height, width = selected.shape
+    return RLEMask(format="rle", width=width, height=height, counts=counts)
+
+
+@pytest.mark.parametrize("deflate", [False, True])
+def test_packbits_round_trip(deflate):
+    selected = sample_mask()
+    assert np.array_equal(decode_compact_mask(packed(selected, deflate)), selected)
+
+
+def test_rle_round_trip():
+    selected = sample_mask()
+    assert np.array_equal(decode_compact_mask(rle(selected)), selected)
+
+
+def test_rle_counts_must_cover_the_image():
+    with pytest.raises(ValueError):
+        RLEMask(format="rle", width=4, height=4, counts=[3, 4])
+
+
+def test_packbits_too_short_is_rejected():
+    mask = PackedMask(format="packbits", width=64, height=64,
+                      data=base64.b64encode(b"\xff" * 8).decode())
+    with pytest.raises(ValueError):
+        decode_compact_mask(mask)
+
+
+def test_packbits_zlib_bomb_is_rejected_without_inflating():
+    # 64 MB of zeros deflates to ~64 KB; a 16x16 mask needs 32 bytes
+    bomb = zlib.compress(bytes(64 * 1024 * 1024), 9)
+    mask = PackedMask(format="packbits", width=16, height=16,
+                      data=base64.b64encode(bomb).decode(), zlib=True)
+    with pytest.raises(ValueError, match="more than"):
+        decode_compact_mask(mask)
+
+
+def test_strokes_rasterize_and_erase():
+    mask = StrokeMask(format="strokes", width=40, height=20, strokes=[
+        {"points": [(5, 10), (35, 10)], "radius": 3},
+        {"points": [(20, 10)], "radius": 2, "erase": True},
+    ])
+    selected = decode_compact_mask(mask)
+    assert selected[10, 8] and selected[10, 32]
+    assert not selected[10, 20]
+    assert not selected[0, 0]
+
+
+def test_load_mask_resizes_nearest_neighbour():
+    selected = load_mask(packed(sample_mask(), False), (40, 24))
+    assert selected.shape == (24, 40)
+    assert selected.dtype == bool
+    assert selected[12, 20] and not selected[0, 0]
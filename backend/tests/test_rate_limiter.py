@@ -0,0 +1,142 @@
+import asyncio
+import time
+
+import pytest
+
+from config import settings
+from services.rate_limiter import AdaptiveLimiter, RateLimiters, parse_reset
+
+
+def limiter(**overrides) -> AdaptiveLimiter:
+    options = dict(name="test", requests_per_minute=0, burst=5, initial_window=4, max_window=32, backoff=0.5)
+    options.update(overrides)
+    return AdaptiveLimiter(**options)
+
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_enabled", True)
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("12", 12.0), ("1.5s", 1.5), ("6m0s", 360.0), ("20ms", 0.02), ("1h2m", 3720.0),
+    (None, None), ("", None), ("soon", None), ("5s later", None),
+])
+def test_parse_reset(value, seconds):
+    assert parse_reset(value) == (pytest.approx(seconds) if seconds is not None else None)
+
+
+def test_window_grows_additively_on_success():
+    lim = limiter(initial_window=4)
+
+    async def run():
+        for _ in range(4):
+            async with lim.slot():
+                pass
+
+    asyncio.run(run())
+    # +1/window per success: four successes from 4 add about one slot
+    assert 4.9 < lim.window < 5.0
+    assert lim.successes == 4
+
+
+def test_window_is_bounded_by_max_window():
+    lim = limiter(initial_window=4, max_window=5)
+
+    async def run():
+        for _ in range(50):
+            async with lim.slot():
+                pass
+
+    asyncio.run(run())
+    assert lim.window == 5
+
+
+def test_one_round_of_429s_halves_the_window_once():
+    lim = limiter(initial_window=8)
+
+    async def call():
+        async with lim.slot() as slot:
+            await asyncio.sleep(0.01)
+            slot.throttled(0.0)
+
+    async def run():
+        await asyncio.gather(*(call() for _ in range(8)))
+
+    asyncio.run(run())
+    assert lim.window == 4
+    assert lim.decreases == 1
+    assert lim.throttles == 8
+
+
+def test_in_flight_calls_are_capped_by_the_window():
+    lim = limiter(initial_window=3, max_window=3)
+    peak = 0
+
+    async def call():
+        nonlocal peak
+        async with lim.slot():
+            peak = max(peak, lim.in_flight)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        await asyncio.gather(*(call() for _ in range(12)))
+
+    asyncio.run(run())
+    assert peak == 3
+    assert lim.in_flight == 0
+
+
+def test_429_reset_hint_pauses_the_next_calls():
+    lim = limiter()
+
+    async def run() -> float:
+        async with lim.slot() as slot:
+            slot.throttled(0.3)
+        started = time.monotonic()
+        async with lim.slot():
+            pass
+        return time.monotonic() - started
+
+    assert 0.25 <= asyncio.run(run()) < 1.0
+
+
+def test_token_bucket_spaces_calls_after_the_burst():
+    lim = limiter(requests_per_minute=600, burst=2)  # 10/s
+
+    async def run() -> float:
+        started = time.monotonic()
+        for _ in range(4):
+            async with lim.slot():
+                pass
+        return time.monotonic() - started
+
+    # Two from the burst, then one per 100ms
+    assert 0.15 <= asyncio.run(run()) < 0.5
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    lim = limiter(initial_window=1, max_window=1)
+
+    async def run():
+        async with lim.slot():
+            waiter = asyncio.ensure_future(lim.acquire())
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+        assert lim.in_flight == 0 and lim.waiting == 0
+        async with lim.slot():
+            pass
+
+    asyncio.run(run())
+
+
+def test_chat_calls_have_their_own_limit(monkeypatch):
+    monkeypatch.setattr(settings, "openai_requests_per_minute", 50)
+    monkeypatch.setattr(settings, "openai_chat_requests_per_minute", 500)
+    monkeypatch.setattr(settings, "openai_chat_initial_window", 16)
+    limiters = RateLimiters()
+    image = limiters.get("openai", "gpt-image-1")
+    chat = limiters.get("openai_chat", "gpt-4o")
+    assert image.rate == pytest.approx(50 / 60) and int(image.window) == settings.rate_limit_initial_window
+    assert chat.rate == pytest.approx(500 / 60) and int(chat.window) == 16
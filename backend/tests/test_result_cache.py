@@ -0,0 +1,189 @@
+import asyncio
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+from config import settings
+from services.image_result import ImageResult
+from services.masks import RLEMask
+from services.result_cache import ResultCache, input_hash, result_key
+
+
+def png_bytes(color=(10, 120, 220)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def cache_settings(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "result_cache_enabled", True)
+    monkeypatch.setattr(settings, "result_cache_path", str(tmp_path / "results"))
+    monkeypatch.setattr(settings, "result_cache_disk_bytes", 1 << 20)
+
+
+class Generator:
+    """Fake generation: counts calls, can be slow or fail, records cancellation"""
+
+    def __init__(self, data: bytes = b"", seconds: float = 0.0, fail: bool = False):
+        self.data = data or png_bytes()
+        self.seconds = seconds
+        self.fail = fail
+        self.calls = 0
+        self.cancelled = False
+
+    async def __call__(self) -> ImageResult:
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.seconds)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.fail:
+            raise RuntimeError("provider error")
+        return ImageResult(data=self.data, mime_type="image/png")
+
+
+def test_result_key_is_stable_and_covers_every_part():
+    key = result_key(operation="render", prompt="p", model="gpt-image-1", quality="high")
+    assert key == result_key(quality="high", model="gpt-image-1", prompt="p", operation="render")
+    assert key != result_key(operation="render", prompt="p", model="gpt-image-1", quality="standard")
+    assert key != result_key(operation="edit", prompt="p", model="gpt-image-1", quality="high")
+    assert len(key) == 64
+
+
+def test_input_hash_is_the_same_for_bytes_and_base64():
+    data = png_bytes()
+    assert input_hash(data) == input_hash(base64.b64encode(data).decode())
+    assert input_hash(data) != input_hash(png_bytes((0, 0, 0)))
+    assert input_hash(None) is None
+    assert input_hash([data, None]) == [input_hash(data), None]
+
+
+def test_input_hash_of_compact_masks():
+    mask = RLEMask(format="rle", width=4, height=2, counts=[2, 4, 2])
+    assert input_hash(mask) == input_hash(RLEMask(format="rle", width=4, height=2, counts=[2, 4, 2]))
+    assert input_hash(mask) != input_hash(RLEMask(format="rle", width=4, height=2, counts=[3, 3, 2]))
+
+
+def test_second_request_is_a_memory_hit():
+    cache = ResultCache()
+    generate = Generator()
+    key = result_key(operation="render", prompt="a")
+    first = asyncio.run(cache.get_or_create(key, generate))
+    second = asyncio.run(cache.get_or_create(key, generate))
+    assert first.data == second.data == generate.data
+    assert generate.calls == 1
+    stats = cache.stats()
+    assert (stats["misses"], stats["memory_hits"], stats["bytes_saved"]) == (1, 1, len(generate.data))
+
+
+def test_disk_hit_is_promoted_to_memory():
+    key = result_key(operation="render", prompt="b")
+    generate = Generator()
+    asyncio.run(ResultCache().get_or_create(key, generate))
+
+    # A fresh process: empty memory tier, same disk
+    cache = ResultCache()
+    result = asyncio.run(cache.get(key))
+    assert result.data == generate.data and result.mime_type == "image/png"
+    assert cache.disk_hits == 1
+    assert cache.memory.get(key) is not None
+    asyncio.run(cache.get(key))
+    assert (cache.disk_hits, cache.memory_hits) == (1, 1)
+
+
+def test_disk_errors_cost_a_hit_not_the_request(monkeypatch):
+    cache = ResultCache()
+    disk = cache.disk
+
+    def broken(*args):
+        raise OSError("read-only file system")
+
+    monkeypatch.setattr(disk, "put", broken)
+    monkeypatch.setattr(disk, "get", broken)
+    generate = Generator()
+    key = result_key(operation="render", prompt="c")
+    assert asyncio.run(cache.get_or_create(key, generate)).data == generate.data
+
+    cache.memory.clear()
+    assert asyncio.run(cache.get(key)) is None
+    assert asyncio.run(cache.get_or_create(key, generate)).data == generate.data
+    assert generate.calls == 2
+
+
+def test_disabled_cache_always_generates(monkeypatch):
+    monkeypatch.setattr(settings, "result_cache_enabled", False)
+    cache = ResultCache()
+    generate = Generator()
+    key = result_key(operation="render", prompt="d")
+    for _ in range(2):
+        asyncio.run(cache.get_or_create(key, generate))
+    assert generate.calls == 2
+    assert asyncio.run(cache.get(key)) is None
+    assert cache.stats()["misses"] == 0
+
+
+def test_concurrent_requests_share_one_generation():
+    cache = ResultCache()
+    generate = Generator(seconds=0.05)
+    key = result_key(operation="render", prompt="e")
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_create(key, generate) for _ in range(4)))
+
+    results = asyncio.run(run())
+    assert generate.calls == 1
+    assert all(result.data == generate.data for result in results)
+    assert cache.joined == 3 and cache.stats()["in_flight"] == 0
+
+
+def test_failed_generation_is_not_cached():
+    cache = ResultCache()
+    key = result_key(operation="render", prompt="f")
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.get_or_create(key, Generator(fail=True)))
+    assert cache.stats()["in_flight"] == 0
+    generate = Generator()
+    assert asyncio.run(cache.get_or_create(key, generate)).data == generate.data
+    assert generate.calls == 1
+
+
+def test_generation_keeps_running_while_someone_waits():
+    cache = ResultCache()
+    generate = Generator(seconds=0.05)
+    key = result_key(operation="render", prompt="g")
+
+    async def run():
+        first = asyncio.ensure_future(cache.get_or_create(key, generate))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(cache.get_or_create(key, generate))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second, generate.cancelled
+
+    result, cancelled = asyncio.run(run())
+    assert result.data == generate.data
+    assert not cancelled
+
+
+def test_generation_is_cancelled_with_its_last_waiter():
+    cache = ResultCache()
+    generate = Generator(seconds=5)
+    key = result_key(operation="render", prompt="h")
+
+    async def run():
+        waiters = [asyncio.ensure_future(cache.get_or_create(key, generate)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+        # Checked before asyncio.run() cancels whatever is left over
+        return generate.cancelled, cache.stats()["in_flight"]
+
+    cancelled, in_flight = asyncio.run(run())
+    assert cancelled
+    assert in_flight == 0
@@ -0,0 +1,139 @@
+import asyncio
+import io
+
+import numpy as np
+from PIL import Image
+
+from services import segmentation
+from services.segmentation import (
+    ClickPoint, LabImage, _clean_mask, _fill_holes, _to_working, build_lab_image, segment, segment_image_async,
+)
+
+BLUE = (40, 70, 200)
+RED = (210, 40, 30)
+GREEN = (30, 180, 60)
+
+
+def encode(pixels: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def two_regions(width: int = 400, height: int = 200) -> np.ndarray:
+    """Left half blue, right half red"""
+    pixels = np.zeros((height, width, 3), dtype=np.uint8)
+    pixels[:, :width // 2] = BLUE
+    pixels[:, width // 2:] = RED
+    return pixels
+
+
+def decode_mask(result) -> np.ndarray:
+    return np.asarray(Image.open(io.BytesIO(result.mask_png)).convert("L")) > 0
+
+
+def test_click_selects_the_connected_region():
+    image = build_lab_image(encode(two_regions()))
+    result = segment(image, [ClickPoint(50, 100)])
+    mask = decode_mask(result)
+
+    assert result.size == (400, 200) and mask.shape == (200, 400)
+    assert mask[:, :195].all() and not mask[:, 205:].any()
+    x, y, w, h = result.bounds
+    assert (x, y, h) == (0, 0, 200) and 195 <= w <= 205
+    assert abs(result.coverage - 0.5) < 0.02
+
+
+def test_positive_clicks_are_unioned():
+    image = build_lab_image(encode(two_regions()))
+    result = segment(image, [ClickPoint(50, 100), ClickPoint(350, 100)])
+    assert decode_mask(result).all()
+    assert result.bounds == (0, 0, 400, 200)
+
+
+def test_enclosed_region_is_filled_unless_clicked_out():
+    pixels = two_regions()
+    pixels[80:120, 80:120] = GREEN  # A "window" inside the blue half
+    image = build_lab_image(encode(pixels))
+
+    filled = decode_mask(segment(image, [ClickPoint(20, 20)]))
+    assert filled[100, 100]
+
+    carved = decode_mask(segment(image, [ClickPoint(20, 20), ClickPoint(100, 100, positive=False)]))
+    assert not carved[85:115, 85:115].any()
+    assert carved[20, 20] and carved[150, 150]
+
+
+def test_only_negative_clicks_select_nothing():
+    image = build_lab_image(encode(two_regions()))
+    result = segment(image, [ClickPoint(50, 100, positive=False)])
+    assert result.bounds is None
+    assert result.coverage == 0.0
+    assert not decode_mask(result).any()
+
+
+def test_clicks_map_to_working_resolution_and_clamp():
+    image = LabImage(lab=np.zeros((100, 200, 3), dtype=np.float32), source_size=(2000, 1000))
+    assert _to_working(image, ClickPoint(1000, 500)) == (100, 50)
+    assert _to_working(image, ClickPoint(1999, 999)) == (199, 99)
+    # Clicks just outside the image (rounding in the frontend) land on the edge
+    assert _to_working(image, ClickPoint(2050, -3)) == (199, 0)
+
+
+def test_large_source_is_segmented_at_working_size_and_scaled_back():
+    image = build_lab_image(encode(two_regions(2400, 1200)))
+    assert max(image.size) == segmentation.SEGMENT_IMAGE_SPEC.max_size
+    result = segment(image, [ClickPoint(2000, 600)])
+    mask = decode_mask(result)
+    assert mask.shape == (1200, 2400)
+    assert mask[:, 1220:].all() and not mask[:, :1180].any()
+
+
+def test_fill_holes_leaves_regions_touching_the_border():
+    mask = np.zeros((50, 50), dtype=bool)
+    mask[10:40, 10:40] = True
+    mask[20:30, 20:30] = False  # Enclosed: a hole
+    mask[:, :5] = True
+    mask[0:10, 0:2] = False  # Open to the border: not a hole
+    filled = _fill_holes(mask)
+    assert filled[20:30, 20:30].all()
+    assert not filled[0:10, 0:2].any()
+    assert not filled[45:, 45:].any()
+
+
+def test_clean_mask_keeps_only_clicked_components():
+    mask = np.zeros((300, 300), dtype=bool)
+    mask[20:120, 20:120] = True
+    mask[180:280, 180:280] = True
+    mask[150, 150] = True  # Speckle
+    cleaned = _clean_mask(mask, [(50, 50)])
+    # Opening rounds the corners a little
+    assert cleaned[22:118, 22:118].all()
+    assert not cleaned[180:280, 180:280].any()
+    assert not cleaned[150, 150]
+
+
+def test_clean_mask_falls_back_when_clicks_were_opened_away():
+    mask = np.zeros((300, 300), dtype=bool)
+    mask[:, 150] = True  # A one-pixel pole; opening removes it
+    assert (_clean_mask(mask, [(150, 10)]) == mask).all()
+
+
+def test_concurrent_clicks_convert_the_image_once(monkeypatch):
+    builds = []
+
+    def counting_build(data):
+        builds.append(data)
+        return build_lab_image(data)
+
+    monkeypatch.setattr(segmentation, "build_lab_image", counting_build)
+    segmentation.lab_cache.clear()
+    data = encode(two_regions(320, 160))
+
+    async def main():
+        return await asyncio.gather(*(segment_image_async(data, [ClickPoint(20 + i, 80)]) for i in range(5)))
+
+    results = asyncio.run(main())
+    assert len(builds) == 1
+    assert all(abs(result.coverage - 0.5) < 0.02 for result in results)
+    assert not segmentation._inflight
@@ -0,0 +1,104 @@
+import asyncio
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from config import settings
+from services.tiled_render import output_size, plan_tiles, render_tiled, stitch_tiles
+
+
+@pytest.mark.parametrize("size", [(4096, 3072), (3000, 2000), (1025, 1024), (2048, 1024), (5000, 700)])
+def test_tiles_cover_the_frame_with_at_least_the_overlap(size):
+    tile, overlap = 1024, 128
+    grid = plan_tiles(size, tile, overlap)
+    assert len(grid.tiles) == grid.rows * grid.cols
+
+    covered = np.zeros((size[1], size[0]), dtype=bool)
+    for t in grid.tiles:
+        assert 0 <= t.x and t.x + t.width <= size[0]
+        assert 0 <= t.y and t.y + t.height <= size[1]
+        covered[t.y:t.y + t.height, t.x:t.x + t.width] = True
+        assert (t.overlap_left == 0) == (t.col == 0)
+        assert (t.overlap_top == 0) == (t.row == 0)
+        if t.col:
+            assert overlap <= t.overlap_left < tile
+        if t.row:
+            assert overlap <= t.overlap_top < tile
+    assert covered.all()
+
+
+def test_tiles_are_row_major_and_consistent():
+    grid = plan_tiles((3000, 2000), 1024, 128)
+    assert [(t.row, t.col) for t in grid.tiles] == [(r, c) for r in range(grid.rows) for c in range(grid.cols)]
+    for t in grid.tiles:
+        left = grid.tiles[t.row * grid.cols + t.col - 1] if t.col else None
+        if left is not None:
+            assert t.overlap_left == left.x + left.width - t.x
+
+
+def test_frame_smaller_than_a_tile_is_one_tile():
+    grid = plan_tiles((800, 600), 1024, 128)
+    assert (grid.rows, grid.cols) == (1, 1)
+    (only,) = grid.tiles
+    assert (only.x, only.y, only.width, only.height) == (0, 0, 800, 600)
+
+
+def test_invalid_overlap_is_rejected():
+    with pytest.raises(ValueError):
+        plan_tiles((4096, 4096), 1024, 1024)
+
+
+def test_output_size_keeps_aspect_and_caps(monkeypatch):
+    monkeypatch.setattr(settings, "tiled_render_max_size", 4096)
+    assert output_size((3000, 2000)) == (3000, 2000)
+    assert output_size((3000, 2000), 6000) == (4096, 2731)
+    assert output_size((3000, 2000), 1500) == (1500, 1000)
+
+
+def test_stitching_identical_tiles_is_seamless():
+    grid = plan_tiles((1500, 900), 512, 64)
+    tile_png = io.BytesIO()
+    Image.new("RGB", (512, 512), (90, 160, 30)).save(tile_png, format="PNG")
+    stitched = Image.open(io.BytesIO(stitch_tiles(grid, [tile_png.getvalue()] * len(grid.tiles))))
+    pixels = np.asarray(stitched.convert("RGB")).astype(int)
+    assert stitched.size == (1500, 900)
+    assert (np.abs(pixels - [90, 160, 30]) <= 1).all()
+
+
+def test_failed_tile_cancels_the_others(monkeypatch):
+    monkeypatch.setattr(settings, "tiled_render_tile", 64)
+    monkeypatch.setattr(settings, "tiled_render_overlap", 8)
+    monkeypatch.setattr(settings, "tiled_render_concurrency", 3)
+    source = io.BytesIO()
+    Image.new("RGB", (280, 160), (120, 120, 120)).save(source, format="PNG")
+    started, finished, cancelled = [], [], []
+
+    async def render_tile(image, tile, grid):
+        started.append((tile.row, tile.col))
+        if (tile.row, tile.col) == (0, 0):
+            await asyncio.sleep(0.05)
+            raise RuntimeError("provider error")
+        try:
+            await asyncio.sleep(0.1)
+        except asyncio.CancelledError:
+            cancelled.append((tile.row, tile.col))
+            raise
+        finished.append((tile.row, tile.col))
+        return b""
+
+    async def run():
+        with pytest.raises(RuntimeError, match="provider error"):
+            await render_tiled(source.getvalue(), render_tile)
+        # Long enough for leftover tiles to finish and queued ones to start
+        await asyncio.sleep(0.3)
+        # Checked before asyncio.run() cancels whatever is left over
+        return list(started), list(finished), list(cancelled)
+
+    started, finished, cancelled = asyncio.run(run())
+    assert len(plan_tiles((280, 160), 64, 8).tiles) == 15
+    # Only the first round reached the provider; the queued tiles never did
+    assert len(started) == 3
+    assert finished == []
+    assert sorted(cancelled) == sorted(started[1:])